@@ -1,17 +1,22 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 from flask_cors import CORS
 import os
 import csv
 import sys
 import json
-from features.search import search_works, extract_and_save_to_csv
+from features.search import iter_search_works, extract_and_save_to_csv
 from features.search_pubmed import search_pubmed
-from features.download_pdfs import download_pdfs_from_csv
+from features.search_cache import cached_search, cached_iter_search
+from features.federated_search import iter_federated_search
+from features.streaming_csv import read_commit_marker
+from features.result_store import read_results, csv_has_header
+from features.download_pdfs import download_pdfs_from_csv, determine_source_from_csv, stream_core_pdfs_zip
 from features.embedding_and_indexing import process_data_generate_vectors_and_metadata, build_faiss_index, save_metadata_list, save_doi_mapped_json, search_faiss
 from sentence_transformers import SentenceTransformer
 import faiss
 import re
 import time
+import itertools
 
 from  utils.result_processor import get_context_from_result
 from utils.llm_setup import llm_instance as llm
@@ -85,6 +90,16 @@ def search():
         page = int(request.args.get("page", 1))
         per_page = int(request.args.get("per_page", 10))
         search_source = request.args.get("search_source", "core").lower()  # Default to "core"
+        refresh = request.args.get("refresh", "false").lower() == "true"  # Bypass the result cache
+        enrichment_engine = request.args.get("engine")  # "threads" or "async"; None uses the server default
+        # Seconds to spend enriching before answering with partially enriched rows; None uses the server default
+        try:
+            time_budget = float(request.args["time_budget"]) if request.args.get("time_budget") else None
+        except ValueError:
+            time_budget = None
+        background_enrichment = request.args.get("background_enrichment")  # "true"/"false"; None uses the server default
+        if background_enrichment is not None:
+            background_enrichment = background_enrichment.lower() == "true"
         
         # Handle empty or invalid values for max_results, start_year, and end_year
         try:
@@ -129,17 +144,34 @@ def search():
         search_progress = {
             "stage": 1,
             "sub_stage": 0,
-            "message": f"Querying {'PubMed' if search_source == 'pubmed' else 'CORE'} API",
+            "message": "Querying CORE and PubMed APIs" if search_source == "all" else f"Querying {'PubMed' if search_source == 'pubmed' else 'CORE'} API",
             "timestamp": time.time()
         }
         
         # Choose search API based on search_source parameter
-        if search_source == "pubmed":
-            results = search_pubmed(query, max_results=max_results, start_year=start_year, end_year=end_year)
+        work_items = None
+        if search_source == "all":
+            # Both sources run concurrently; merged, de-duplicated items stream straight into enrichment.
+            # Wait for the first one so an empty search can still be reported as such.
+            merged = iter_federated_search(query, max_results=max_results, start_year=start_year,
+                                           end_year=end_year, refresh=refresh)
+            results = []
+            first_item = next(merged, None)
+            if first_item is not None:
+                work_items = itertools.chain([first_item], merged)
+        elif search_source == "pubmed":
+            results = cached_search("pubmed", search_pubmed, query, max_results=max_results,
+                                    start_year=start_year, end_year=end_year, refresh=refresh)
         else:  # default to "core"
-            results = search_works(query, max_results=max_results, start_year=start_year, end_year=end_year)
+            # CORE streams page by page, so enrichment starts while the scroll is still fetching later pages
+            pages = cached_iter_search("core", iter_search_works, query, max_results=max_results,
+                                       start_year=start_year, end_year=end_year, refresh=refresh)
+            results = []
+            first_item = next(pages, None)
+            if first_item is not None:
+                work_items = itertools.chain([first_item], pages)
             
-        if not results:
+        if not results and work_items is None:
             search_progress = {
                 "stage": -1,
                 "sub_stage": 0,
@@ -169,7 +201,10 @@ def search():
             "timestamp": time.time()
         }
         
-        processed_results = extract_and_save_to_csv(results, csv_path)
+        processed_results = extract_and_save_to_csv(work_items if work_items is not None else results, csv_path,
+                                                    engine=enrichment_engine, time_budget=time_budget,
+                                                    background=background_enrichment)
+        partially_enriched = sum(1 for entry in processed_results if entry.get("Enrichment_Status") == "partial")
         
         # Verify CSV file was created successfully
         if not os.path.exists(csv_path):
@@ -201,15 +236,16 @@ def search():
         start_idx = (page - 1) * per_page
         end_idx = min(start_idx + per_page, total_results)
         
-        # Return paginated results
+        # Return paginated results: the saved (de-duplicated) rows, shaped like /get_paginated_results
         return jsonify({
-            "results": results[start_idx:end_idx],
+            "results": [paper_summary(entry) for entry in processed_results[start_idx:end_idx]],
             "csv_filename": csv_filename,
             "total_results": total_results,
             "current_page": page,
             "total_pages": total_pages,
             "per_page": per_page,
-            "search_source": search_source  # Include the search source in the response
+            "search_source": search_source,  # Include the search source in the response
+            "partially_enriched": partially_enriched  # Rows saved before their lookups finished (time budget ran out)
         })
 
     except Exception as e:
@@ -251,6 +287,20 @@ def download_csv(filename):
     except FileNotFoundError:
         return jsonify({"error": "File not found"}), 404
 
+# Columns the result listing endpoints need; Full_Text and Abstract are never loaded for them
+PAPER_SUMMARY_COLUMNS = ['Source', 'Title', 'Download_URL', 'Year_Published', 'Keywords', 'Enrichment_Status']
+
+def paper_summary(row):
+    """Shapes a result row (see features.result_store.read_results) for the frontend."""
+    return {
+        'source': str(row.get('Source') or '').strip() or 'Unknown',
+        'title': str(row.get('Title') or '').strip() or 'Unknown',
+        'download_url': str(row.get('Download_URL') or '').strip() or '',
+        'year': str(row.get('Year_Published') or '').strip() or 'N/A',  # Missing years are stored as N/A
+        'keywords': list(row.get('Keywords') or []),  # Already a list in the results dataset
+        'partial': row.get('Enrichment_Status') == 'partial'  # Saved before enrichment finished; may fill in later
+    }
+
 # --- Get CSV Data Endpoint ---
 @app.route("/get_csv_data/<filename>")
 def get_csv_data(filename):
@@ -260,64 +310,15 @@ def get_csv_data(filename):
             print(f"CSV file not found: {csv_path}")
             return jsonify({"error": "CSV file not found"}), 404
 
+        print(f"Reading results for: {csv_path}")
+        # Reads the Parquet dataset when present, else the committed rows of the CSV
         papers = []
-        print(f"Reading CSV file: {csv_path}")
-        
-        # Read CSV in chunks to handle large files
-        with open(csv_path, 'r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
-            chunk_size = 10  # Process 10 rows at a time
-            chunk = []
-            
-            for row in reader:
-                try:
-                    # Get the keywords value
-                    keyword_value = row.get('Keywords', '')
-                    
-                    # Process keywords based on what we got
-                    if isinstance(keyword_value, list):
-                        # Already a list, use as is
-                        processed_keywords = keyword_value
-                    elif isinstance(keyword_value, str):
-                        # Try to convert from string representation
-                        keyword_str = keyword_value.strip()
-                        if not keyword_str:
-                            processed_keywords = []
-                        elif keyword_str.startswith('[') and keyword_str.endswith(']'):
-                            # Looks like a list representation, try to parse it
-                            try:
-                                # Replace single quotes with double quotes for JSON parsing
-                                json_ready = keyword_str.replace("'", '"')
-                                processed_keywords = json.loads(json_ready)
-                            except:
-                                # If parsing fails, split by comma
-                                processed_keywords = [k.strip() for k in keyword_str.strip('[]').split(',') if k.strip()]
-                        else:
-                            # Not a list format, split by comma
-                            processed_keywords = [k.strip() for k in keyword_str.split(',') if k.strip()]
-                    else:
-                        # Unknown format, use empty list
-                        processed_keywords = []
-                    
-                    paper = {
-                        'source': str(row.get('Source', '')).strip() or 'Unknown',
-                        'title': str(row.get('Title', '')).strip() or 'Unknown',
-                        'download_url': str(row.get('Download_URL', '')).strip() or '',
-                        'year': str(row.get('Year_Published', '')).strip() or 'Unknown',
-                        'keywords': processed_keywords  # Now this is an actual list
-                    }
-                    chunk.append(paper)
-                    
-                    if len(chunk) >= chunk_size:
-                        papers.extend(chunk)
-                        chunk = []
-                        
-                except Exception as row_error:
-                    print(f"Error processing row: {row} - Error: {str(row_error)}")
-                    continue
-            
-            if chunk:  # Add remaining papers
-                papers.extend(chunk)
+        for row in read_results(csv_path, columns=PAPER_SUMMARY_COLUMNS):
+            try:
+                papers.append(paper_summary(row))
+            except Exception as row_error:
+                print(f"Error processing row: {row} - Error: {str(row_error)}")
+                continue
                     
         if not papers:
             print("No valid papers found in CSV")
@@ -361,116 +362,32 @@ def get_paginated_results():
             return jsonify({"error": "CSV file is empty"}), 404
 
         papers = []
-        print(f"Reading CSV file: {csv_path}")
+        print(f"Reading results for: {csv_path}")
+        # A commit marker means enrichment is still appending rows to this file
+        is_complete = read_commit_marker(csv_path) is None
         
-        # Read CSV in chunks to handle large files
+        # Check if we could read the headers
+        if not csv_has_header(csv_path):
+            print(f"CSV file has no headers: {csv_path}")
+            return jsonify({"error": "CSV file is invalid (no headers)"}), 400
+
+        # Reads the Parquet dataset when present, else the committed rows of the CSV (only the listed columns)
         try:
-            with open(csv_path, 'r', encoding='utf-8-sig') as file:
-                reader = csv.DictReader(file)
-                
-                # Check if we could read the headers
-                if not reader.fieldnames:
-                    print(f"CSV file has no headers: {csv_path}")
-                    return jsonify({"error": "CSV file is invalid (no headers)"}), 400
-                
-                for row in reader:
-                    try:
-                        # Get the keywords value
-                        keyword_value = row.get('Keywords', '')
-                        
-                        # Process keywords based on what we got
-                        if isinstance(keyword_value, list):
-                            # Already a list, use as is
-                            processed_keywords = keyword_value
-                        elif isinstance(keyword_value, str):
-                            # Try to convert from string representation
-                            keyword_str = keyword_value.strip()
-                            if not keyword_str:
-                                processed_keywords = []
-                            elif keyword_str.startswith('[') and keyword_str.endswith(']'):
-                                # Looks like a list representation, try to parse it
-                                try:
-                                    # Replace single quotes with double quotes for JSON parsing
-                                    json_ready = keyword_str.replace("'", '"')
-                                    processed_keywords = json.loads(json_ready)
-                                except:
-                                    # If parsing fails, split by comma
-                                    processed_keywords = [k.strip() for k in keyword_str.strip('[]').split(',') if k.strip()]
-                            else:
-                                # Not a list format, split by comma
-                                processed_keywords = [k.strip() for k in keyword_str.split(',') if k.strip()]
-                        else:
-                            # Unknown format, use empty list
-                            processed_keywords = []
-                        
-                        paper = {
-                            'source': str(row.get('Source', '')).strip() or 'Unknown',
-                            'title': str(row.get('Title', '')).strip() or 'Unknown',
-                            'download_url': str(row.get('Download_URL', '')).strip() or '',
-                            'year': str(row.get('Year_Published', '')).strip() or 'Unknown',
-                            'keywords': processed_keywords  # Now this is an actual list
-                        }
-                        papers.append(paper)
-                    except Exception as row_error:
-                        print(f"Error processing row: {row} - Error: {str(row_error)}")
-                        continue
-        except UnicodeDecodeError:
-            print(f"Unicode decode error reading CSV file: {csv_path}")
-            # Try with a different encoding
-            try:
-                with open(csv_path, 'r', encoding='latin-1') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        try:
-                            # Get the keywords value
-                            keyword_value = row.get('Keywords', '')
-                            
-                            # Process keywords based on what we got
-                            if isinstance(keyword_value, list):
-                                # Already a list, use as is
-                                processed_keywords = keyword_value
-                            elif isinstance(keyword_value, str):
-                                # Try to convert from string representation
-                                keyword_str = keyword_value.strip()
-                                if not keyword_str:
-                                    processed_keywords = []
-                                elif keyword_str.startswith('[') and keyword_str.endswith(']'):
-                                    # Looks like a list representation, try to parse it
-                                    try:
-                                        # Replace single quotes with double quotes for JSON parsing
-                                        json_ready = keyword_str.replace("'", '"')
-                                        processed_keywords = json.loads(json_ready)
-                                    except:
-                                        # If parsing fails, split by comma
-                                        processed_keywords = [k.strip() for k in keyword_str.strip('[]').split(',') if k.strip()]
-                                else:
-                                    # Not a list format, split by comma
-                                    processed_keywords = [k.strip() for k in keyword_str.split(',') if k.strip()]
-                            else:
-                                # Unknown format, use empty list
-                                processed_keywords = []
-                            
-                            paper = {
-                                'source': str(row.get('Source', '')).strip() or 'Unknown',
-                                'title': str(row.get('Title', '')).strip() or 'Unknown',
-                                'download_url': str(row.get('Download_URL', '')).strip() or '',
-                                'year': str(row.get('Year_Published', '')).strip() or 'Unknown',
-                                'keywords': processed_keywords  # Now this is an actual list
-                            }
-                            papers.append(paper)
-                        except Exception as row_error:
-                            print(f"Error processing row: {row} - Error: {str(row_error)}")
-                            continue
-            except Exception as e:
-                print(f"Failed to read CSV with latin-1 encoding: {e}")
-                return jsonify({"error": "Cannot read CSV file (encoding issues)"}), 500
+            rows = read_results(csv_path, columns=PAPER_SUMMARY_COLUMNS)
         except Exception as e:
-            print(f"Unexpected error reading CSV file: {e}")
+            print(f"Unexpected error reading results file: {e}")
             import traceback
             print(traceback.format_exc())
             return jsonify({"error": f"Error reading CSV file: {str(e)}"}), 500
+
+        for row in rows:
+            try:
+                papers.append(paper_summary(row))
+            except Exception as row_error:
+                print(f"Error processing row: {row} - Error: {str(row_error)}")
+                continue
                     
-        if not papers:
+        if not papers and is_complete:
             print("No valid papers found in CSV")
             return jsonify({"error": "No valid data found in CSV"}), 404
         
@@ -488,7 +405,8 @@ def get_paginated_results():
             "total_results": total_results,
             "current_page": page,
             "total_pages": total_pages,
-            "per_page": per_page
+            "per_page": per_page,
+            "complete": is_complete  # False while more rows are still being added
         })
                 
     except Exception as e:
@@ -498,6 +416,13 @@ def get_paginated_results():
         return jsonify({"error": "Error processing CSV file"}), 500
 
 # --- Download PDFs Endpoint ---
+# Streamed bundles start sending once the first CSV row's PDF is done (including its retries and alternate
+# URLs) instead of after the whole zip is written. The status is sent before any download finishes, so a
+# bundle where every download failed arrives as a 200 zip holding only download_errors.txt rather than a
+# 500 error; streaming is therefore opt-in. ?stream=true|false overrides the default per request; PubMed
+# bundles are always built on disk first.
+PDF_STREAM_DOWNLOADS = os.environ.get("PDF_STREAM_DOWNLOADS", "false").lower() == "true"
+
 @app.route("/download_pdfs/<filename>")
 def download_pdfs(filename):
     try:
@@ -510,6 +435,19 @@ def download_pdfs(filename):
         # Create a unique zip filename based on the CSV filename
         zip_filename = f"{os.path.splitext(filename)[0]}_pdfs.zip"
         zip_path = os.path.join(DATA_FOLDER, zip_filename)
+
+        stream = request.args.get("stream", str(PDF_STREAM_DOWNLOADS)).lower() == "true"
+        if stream and determine_source_from_csv(csv_file_path) == "core":
+            # Entries go out as their PDFs arrive; download failures are listed in download_errors.txt
+            return Response(
+                stream_core_pdfs_zip(csv_file_path),
+                mimetype='application/zip',
+                headers={
+                    "Content-Disposition": f'attachment; filename="{zip_filename}"',
+                    "X-Accel-Buffering": "no",  # Keep nginx-style proxies from buffering the whole bundle
+                    "Cache-Control": "no-store",
+                },
+            )
         
         # Download PDFs and create zip file
         success, message = download_pdfs_from_csv(csv_file_path, zip_path)
@@ -0,0 +1,379 @@
+# async_enrichment.py
+# Asyncio engine for the enrichment stage. Runs the same steps as search.process_work_item
+# (provider name, DOI lookup, BibTeX, keywords) on a single aiohttp client, so hundreds of
+# lookups can be in flight at once under per-host connection limits and the shared rate limiter.
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+from urllib.parse import urlencode
+
+import aiohttp
+
+from .search import (
+    EMAIL, core_session, clean_text, _prepare_work_item, _needs_doi_lookup, _accept_found_doi,
+    _wants_bibtex, _apply_bibtex, _apply_external_keywords, _finalize_entry,
+)
+from .helper.doi_finder import (
+    DOI_RESOLVERS, DOI_RESOLUTION_MODE, DOI_HEDGE_DELAY, DOI_RACE_POLICY, DOI_RACE_GRACE,
+    _ranked_resolvers, _pick_race_winner, _is_definitive,
+)
+from .helper.doi_info_scraper import _bibtex_request, _parse_bibtex_response
+from .helper.keywords_scraper import KEYWORD_SOURCES, _json_from_response, _is_definitive as _keywords_definitive
+from .helper.metadata_cache import lookup_bibtex, remember_bibtex, lookup_keywords, remember_keywords, _count
+from .helper.doi_cache import lookup_cached_doi, remember_doi
+from .helper.provider_registry import get_provider_name
+from .helper.rate_limiter import throttle_async
+from .helper.http_recorder import record_response
+from .helper.circuit_breaker import (
+    CircuitOpenError, circuit_open, before_request, record_outcome, release_request, retry_budget,
+)
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+ASYNC_MAX_ITEMS = int(os.environ.get("ASYNC_MAX_ITEMS", 200))  # Work items enriched concurrently
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("ASYNC_MAX_CONNECTIONS", 200))  # Total open connections
+ASYNC_LIMIT_PER_HOST = int(os.environ.get("ASYNC_LIMIT_PER_HOST", 20))  # Open connections per upstream host
+# Mirrors the retry policy of create_session_with_retries
+ASYNC_RETRIES = 5
+ASYNC_BACKOFF_FACTOR = 1.0
+ASYNC_RETRY_STATUSES = (500, 502, 503, 504, 429)
+
+
+class _AsyncResponse:
+    """Buffered aiohttp response exposing the subset of requests.Response the helper parsers use."""
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    def __bool__(self):
+        # Same truthiness as requests.Response, which the parsers rely on
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _build_url(url, params):
+    # Append params the way requests does, keeping any query string already in the URL
+    if not params:
+        return url
+    return url + ('&' if '?' in url else '?') + urlencode(params)
+
+
+async def _async_get(http, url, params=None, headers=None, timeout=15):
+    """GET with the shared rate limiter, circuit breakers, retry budget and urllib3-style retries.
+    Returns _AsyncResponse or None.
+    """
+    full_url = _build_url(url, params)
+    if circuit_open(full_url):
+        logging.debug(f"Skipping {url}: upstream circuit breaker is open")
+        return None
+    try:
+        before_request(full_url)  # Same admission as BreakerAdapter: one per request, not per retry
+    except CircuitOpenError:
+        return None
+
+    response, error = None, None
+    try:
+        for attempt in range(ASYNC_RETRIES + 1):
+            # Deliberately per attempt, unlike urllib3's retries in the sync path: a retry is another
+            # request the upstream counts against its limit (arXiv allows one every 3 seconds)
+            await throttle_async(full_url)
+            response, error = None, None
+            sent_at = time.time()
+            try:
+                async with http.get(full_url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    body = await resp.read()
+                    response = _AsyncResponse(resp.status, body, resp.headers)
+                # Redirects are followed by aiohttp, so the final answer is recorded under the requested URL
+                record_response("GET", full_url, resp.status, resp.headers, body, time.time() - sent_at)
+            except asyncio.TimeoutError as e:
+                error = e
+            except aiohttp.ClientError as e:
+                error = e
+
+            if response is not None and response.status_code not in ASYNC_RETRY_STATUSES:
+                return response
+            out_of_retries = attempt == ASYNC_RETRIES
+            if not out_of_retries and (circuit_open(full_url) or not retry_budget.try_spend()):
+                logging.debug(f"Not retrying {url}: circuit breaker open or retry budget exhausted")
+                out_of_retries = True
+            if out_of_retries:
+                # Retries exhausted: requests raises RetryError here, which the sync helpers turn into None
+                if isinstance(error, asyncio.TimeoutError):
+                    logging.warning(f"Request timed out: {url}")
+                elif error is not None:
+                    logging.error(f"Request Exception for {url}: {error}")
+                else:
+                    logging.error(f"Request Exception for {url}: too many {response.status_code} responses")
+                return None
+
+            # Back off like urllib3's Retry: honour Retry-After, else no wait first, then backoff_factor * 2^attempt
+            delay = ASYNC_BACKOFF_FACTOR * (2 ** attempt) if attempt else 0
+            if response is not None:
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    delay = int(retry_after)
+            await asyncio.sleep(delay)
+        return None
+    except asyncio.CancelledError:
+        # A cancelled request (e.g. a losing DOI race) says nothing about the upstream's health
+        release_request(full_url)
+        response, error = None, None
+        raise
+    finally:
+        if response is not None or error is not None:
+            record_outcome(full_url, response=response, error=error)
+
+
+async def _off_loop(fn, *args):
+    """Runs a blocking call (e.g. a DiskCache lookup, which hits SQLite) in the default executor."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+# --- Async counterparts of the helper entry points ---
+async def _get_doi_race_async(title, http, email=EMAIL, hedge_delay=DOI_HEDGE_DELAY, policy=DOI_RACE_POLICY):
+    """Async version of doi_finder._get_doi_race: same hedging, policy and result, but losers are cancelled outright."""
+    ranked = _ranked_resolvers()
+    ranked_names = [name for name, _, _ in ranked]
+
+    async def run_resolver(position, build_request, parse_response):
+        if position and hedge_delay:
+            await asyncio.sleep(position * hedge_delay)
+        url, params, timeout = build_request(title, email)
+        response = await _async_get(http, url, params=params, timeout=timeout)
+        return parse_response(title, response), _is_definitive(response)
+
+    pending = {
+        asyncio.ensure_future(run_resolver(position, build_request, parse_response)): name
+        for position, (name, build_request, parse_response) in enumerate(ranked)
+    }
+    answers = {}
+    all_definitive = True
+    first_answer_at = None
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            now = loop.time()
+            grace_expired = first_answer_at is not None and now - first_answer_at >= DOI_RACE_GRACE
+            decided, doi = _pick_race_winner(ranked_names, answers, policy, grace_expired)
+            if doi:
+                return doi, next(name for name, answer in answers.items() if answer == doi), True
+            if decided or not pending:
+                return None, None, all_definitive and len(answers) == len(ranked_names)
+            timeout = None
+            if policy == "priority" and first_answer_at is not None:
+                timeout = max(first_answer_at + DOI_RACE_GRACE - now, 0)
+            done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                try:
+                    answers[name], definitive = task.result()
+                except Exception as e:
+                    logging.error(f"DOI resolver {name} failed for '{title[:60]}...': {e}")
+                    answers[name], definitive = None, False
+                all_definitive = all_definitive and definitive
+                if answers[name] and first_answer_at is None:
+                    first_answer_at = loop.time()
+    finally:
+        # Unlike threads, losing tasks can be cancelled mid-request
+        for task in pending:
+            task.cancel()
+
+
+async def resolve_doi_async(title, http, email=EMAIL, mode=None):
+    """Async version of doi_finder.resolve_doi: returns (doi, resolver name, definitive)."""
+    if not title:
+        logging.warning("get_doi called with empty title.")
+        return None, None, True
+    if (mode or DOI_RESOLUTION_MODE) == "race":
+        doi, resolver, definitive = await _get_doi_race_async(title, http, email)
+        if not doi:
+            logging.info(f"--- DOI search failed for title: {title[:60]}... ---")
+        return doi, resolver, definitive
+    all_definitive = True
+    for name, build_request, parse_response in DOI_RESOLVERS:
+        url, params, timeout = build_request(title, email)
+        response = await _async_get(http, url, params=params, timeout=timeout)
+        doi = parse_response(title, response)
+        if doi:
+            return doi, name, True
+        all_definitive = all_definitive and _is_definitive(response)
+    logging.info(f"--- DOI search failed for title: {title[:60]}... ---")
+    return None, None, all_definitive
+
+
+async def get_doi_async(title, http, email=EMAIL, mode=None):
+    """Async version of doi_cache.get_doi_cached: the title->DOI cache is checked before any resolver."""
+    cached = await _off_loop(lookup_cached_doi, title)
+    if cached is not None:
+        return cached["doi"]
+    doi, resolver, definitive = await resolve_doi_async(title, http, email, mode=mode)
+    if doi or definitive:
+        await _off_loop(remember_doi, title, doi, resolver)
+    return doi
+
+
+async def fetch_bibtex_async(doi, http):
+    """Async version of doi_info_scraper.fetch_bibtex."""
+    if not doi:
+        return "Error: DOI is empty."
+    url, headers = _bibtex_request(doi)
+    return _parse_bibtex_response(doi, await _async_get(http, url, headers=headers))
+
+
+async def fetch_bibtex_cached_async(doi, http):
+    """Async version of metadata_cache.fetch_bibtex_cached: returns (bibtex, parsed or None)."""
+    cached = await _off_loop(lookup_bibtex, doi)
+    if cached is not None:
+        return cached
+    _count("bibtex_fetches")
+    bibtex = await fetch_bibtex_async(doi, http)
+    return bibtex, await _off_loop(remember_bibtex, doi, bibtex)
+
+
+async def find_keywords_async(doi, http, email=EMAIL):
+    """Async version of keywords_scraper.find_keywords: returns (keywords, source name, definitive)."""
+    if not doi:
+        logging.warning("Input DOI is empty for keyword search.")
+        return None, None, True
+    all_definitive = True
+    for name, build_request, parse_data in KEYWORD_SOURCES:
+        url, params = build_request(doi, email)
+        response = await _async_get(http, url, params=params)
+        keywords = parse_data(_json_from_response(url, response) if response is not None else None)
+        if keywords:
+            logging.info(f"Keywords found via {name} for DOI: {doi}")
+            return keywords, name, True
+        all_definitive = all_definitive and _keywords_definitive(response)
+    logging.info(f"--- Keyword search complete for DOI: {doi}. Not found. ---")
+    return None, None, all_definitive
+
+
+async def get_keywords_for_doi_async(doi, http, email=EMAIL):
+    """Async version of metadata_cache.get_keywords_cached."""
+    cached = await _off_loop(lookup_keywords, doi)
+    if cached is not None:
+        return cached[0] or None
+    _count("keyword_fetches")
+    keywords, source, definitive = await find_keywords_async(doi, http, email)
+    if keywords or definitive:
+        await _off_loop(remember_keywords, doi, keywords, source)
+    return keywords
+
+
+async def process_work_item_async(work_item, item_index, total_items, http, progress=None):
+    """Async version of search.process_work_item; produces the same entry."""
+    item_id = work_item.get('id', 'N/A')
+    logging.info(f"[Item {item_index+1}/{total_items}] Processing item ID: {item_id} (async)")
+
+    state = _prepare_work_item(work_item, item_index)
+    if state is None:
+        return None
+    entry = state["entry"]
+    if progress is not None:
+        progress[item_index] = (state, work_item)
+
+    if state["provider_url"]:
+        # The provider registry is synchronous and deduplicated; run it off the event loop
+        provider_name = await _off_loop(get_provider_name, state["provider_url"], core_session)
+        entry["Source"] = clean_text(provider_name)
+
+    if _needs_doi_lookup(state, item_index):
+        _accept_found_doi(state, await get_doi_async(state["title"], http), item_index)
+
+    doi = state["doi"]
+    if doi:
+        entry["Doi"] = doi
+        if _wants_bibtex(state):
+            bibtex_data, parsed = await fetch_bibtex_cached_async(doi, http)
+            _apply_bibtex(state, bibtex_data, item_index, parsed)
+        if not state["keywords"]:
+            logging.debug(f"[Item {item_index+1}] No keywords found yet for DOI {doi}. Querying keyword APIs...")
+            _apply_external_keywords(state, await get_keywords_for_doi_async(doi, http), item_index)
+
+    await _off_loop(_finalize_entry, state, work_item)  # Reads and writes the full-text cache
+    logging.info(f"[Item {item_index+1}/{total_items}] Finished processing item ID: {item_id}")
+    return entry
+
+
+async def _enrich_all(data, results, progress=None, cancel=None):
+    """Enriches every item, putting (item_index, result, exception) on the results queue as each finishes.
+    `data` may be any iterable; it is read off the event loop so a slow producer never blocks in-flight items.
+    `progress` and `cancel` work as in search._iter_enriched_threaded.
+    """
+    total_items = len(data) if hasattr(data, '__len__') else '?'
+    loop = asyncio.get_running_loop()
+    items = iter(data)
+    exhausted = object()
+    connector = aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, limit_per_host=ASYNC_LIMIT_PER_HOST)
+    headers = {'User-Agent': f'ResearchFetcher/1.1 (mailto:{EMAIL})'}
+    item_slots = asyncio.Semaphore(ASYNC_MAX_ITEMS)
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as http:
+        async def run_one(item_index, work_item):
+            async with item_slots:
+                if cancel is not None and cancel.is_set():
+                    results.put((item_index, None, None)) # Skipped: the caller stopped waiting
+                    return
+                try:
+                    result = await process_work_item_async(work_item, item_index, total_items, http, progress)
+                    results.put((item_index, result, None))
+                except Exception as e:
+                    results.put((item_index, None, e))
+
+        tasks = []
+        item_index = 0
+        while cancel is None or not cancel.is_set():
+            try:
+                work_item = await loop.run_in_executor(None, next, items, exhausted)
+            except Exception as e:
+                logging.error(f"Reading work items failed after {item_index} items: {e}", exc_info=True)
+                break
+            if work_item is exhausted:
+                break
+            if progress is not None:
+                progress[item_index] = (None, work_item) # Not started yet
+            tasks.append(asyncio.ensure_future(run_one(item_index, work_item)))
+            item_index += 1
+        await asyncio.gather(*tasks)
+
+
+def iter_enriched_async(data, progress=None, cancel=None):
+    """
+    Runs the async engine on a private event loop thread and yields (item_index, result, exception)
+    tuples in completion order, matching what the threaded path produces.
+    """
+    results = queue.Queue()
+    finished = object()
+
+    def run_loop():
+        try:
+            asyncio.run(_enrich_all(data, results, progress, cancel))
+        except Exception as e:
+            logging.error(f"Async enrichment engine failed: {e}", exc_info=True)
+        finally:
+            results.put(finished)
+
+    start_time = time.time()
+    worker = threading.Thread(target=run_loop, name='AsyncEnrichment', daemon=True)
+    worker.start()
+    while True:
+        item = results.get()
+        if item is finished:
+            break
+        yield item
+    worker.join()
+    logging.info(f"Async enrichment finished in {time.time() - start_time:.2f} seconds.")
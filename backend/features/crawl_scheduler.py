@@ -0,0 +1,167 @@
+# crawl_scheduler.py
+# Bounded-concurrency scheduler for headless full-text crawls. Jobs run in priority order (e.g. the
+# first page of results first) with a global limit on open pages and a per-publisher limit, so large
+# result sets neither exhaust memory nor hammer one publisher. Every crawl can get its own timeout.
+# Crawls of https://doi.org/<doi> are attributed to the publisher the DOI redirects to.
+import os
+import time
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse, quote
+
+import requests
+
+from .helper.rate_limiter import throttle
+from .helper.http_session import create_session_with_retries
+from .helper.upstream_urls import base_url
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+CRAWL_MAX_CONCURRENCY = int(os.environ.get("CRAWL_MAX_CONCURRENCY", 4))  # Headless pages open at once
+CRAWL_PER_DOMAIN = int(os.environ.get("CRAWL_PER_DOMAIN", 2))  # Pages open at once per publisher host
+CRAWL_TIMEOUT = float(os.environ.get("CRAWL_TIMEOUT", 45))  # Seconds per URL before the crawl is abandoned
+DOI_HOSTS = ("doi.org", "dx.doi.org")
+
+# Redirect targets are looked up through the DOI handle API, which answers without touching the publisher
+_resolver_session = create_session_with_retries(retries=2, pool_maxsize=CRAWL_MAX_CONCURRENCY)
+_publisher_hosts = {}
+_publisher_hosts_lock = threading.Lock()
+
+
+def _resolve_doi_host(doi):
+    url = f"{base_url('doi')}/api/handles/{quote(doi, safe='/')}"
+    try:
+        throttle(url)
+        response = _resolver_session.get(url, params={'type': 'URL'}, timeout=10)
+        if response.status_code == 200:
+            for value in response.json().get('values', []):
+                if value.get('type') == 'URL':
+                    return (urlparse(value.get('data', {}).get('value', '')).hostname or '').lower() or None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.debug(f"Could not resolve publisher for DOI {doi}: {e}")
+    return None
+
+
+def publisher_host(url):
+    """Returns the host that will serve url: for doi.org links, the host the DOI redirects to (cached)."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host not in DOI_HOSTS:
+        return host
+    doi = parsed.path.lstrip('/')
+    with _publisher_hosts_lock:
+        cached = _publisher_hosts.get(doi)
+    if cached is None:
+        cached = _resolve_doi_host(doi) or host  # Unresolvable DOIs share one doi.org bucket
+        with _publisher_hosts_lock:
+            _publisher_hosts[doi] = cached
+    return cached
+
+
+class CrawlScheduler:
+    """
+    Runs `fetch(url)` coroutines for (priority, key, url) jobs, lowest priority value first, with at
+    most `max_concurrency` running overall and `per_domain` per publisher host. Jobs whose publisher is
+    busy are set aside so the free slots go to other publishers. Returns {key: result}; failed or timed
+    out jobs yield `default`. `timeout` bounds each job (None = no limit); leave it to `fetch` when part
+    of a job is waiting, e.g. for a browser from the crawler pool, which should not count against it.
+    `jobs` may also be an asyncio.Queue that jobs are put on while the scheduler runs, ended with None.
+    """
+
+    def __init__(self, fetch, max_concurrency=CRAWL_MAX_CONCURRENCY, per_domain=CRAWL_PER_DOMAIN,
+                 timeout=CRAWL_TIMEOUT, domain_of=publisher_host, default=""):
+        self.fetch = fetch
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_domain = max(1, per_domain)
+        self.timeout = timeout
+        self.domain_of = domain_of
+        self.default = default
+        self.stats = {"completed": 0, "failed": 0, "timed_out": 0, "deferred": 0}
+
+    async def run(self, jobs):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.PriorityQueue()
+        streamed = isinstance(jobs, asyncio.Queue)
+        added = 0
+        input_closed = not streamed
+        if not streamed:
+            for sequence, (priority, key, url) in enumerate(jobs):
+                ready.put_nowait((priority, sequence, key, url))
+            added = ready.qsize()
+            if not added:
+                return {}
+        remaining = added
+        results = {}
+        active = {}  # domain -> running crawls
+        deferred = {}  # domain -> jobs waiting for that domain
+        domains = {}  # url -> publisher host
+        all_done = asyncio.Event()
+
+        async def crawl(job, domain):
+            nonlocal remaining
+            priority, _, key, url = job
+            started = time.time()
+            try:
+                results[key] = await asyncio.wait_for(self.fetch(url), timeout=self.timeout) if self.timeout else await self.fetch(url)
+                self.stats["completed"] += 1
+            except asyncio.TimeoutError:
+                logging.warning(f"Crawl of {url} timed out after {self.timeout:.0f}s")
+                results[key] = self.default
+                self.stats["timed_out"] += 1
+            except Exception as e:
+                logging.error(f"Crawl of {url} failed: {e}")
+                results[key] = self.default
+                self.stats["failed"] += 1
+            logging.debug(f"Crawled {url} ({domain}, priority {priority}) in {time.time() - started:.1f}s")
+            active[domain] -= 1
+            waiting = deferred.get(domain)
+            if waiting:
+                ready.put_nowait(waiting.pop(0))  # Hand the freed domain slot to its next job
+            remaining -= 1
+            if not remaining and input_closed:
+                all_done.set()
+
+        async def feed():
+            # Streamed jobs join the queue as they arrive; None means no more will come
+            nonlocal added, remaining, input_closed
+            while (job := await jobs.get()) is not None:
+                priority, key, url = job
+                ready.put_nowait((priority, added, key, url))
+                added += 1
+                remaining += 1
+            input_closed = True
+            if not remaining:
+                all_done.set()
+
+        async def worker():
+            while not all_done.is_set():
+                get_job = asyncio.ensure_future(ready.get())
+                finished = asyncio.ensure_future(all_done.wait())
+                done, _ = await asyncio.wait({get_job, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if get_job not in done:
+                    get_job.cancel()
+                    return
+                finished.cancel()
+                job = get_job.result()
+                url = job[3]
+                if url not in domains:
+                    # The handle lookup is a blocking HTTP call; keep it off the event loop
+                    domains[url] = await loop.run_in_executor(None, self.domain_of, url)
+                domain = domains[url]
+                if active.get(domain, 0) >= self.per_domain:
+                    deferred.setdefault(domain, []).append(job)
+                    self.stats["deferred"] += 1
+                    continue
+                active[domain] = active.get(domain, 0) + 1
+                await crawl(job, domain)
+
+        started = time.time()
+        workers = [worker() for _ in range(self.max_concurrency if streamed else min(self.max_concurrency, remaining))]
+        await asyncio.gather(*([feed()] if streamed else []), *workers)
+        logging.info(f"Crawl scheduler: {self.stats['completed']} crawled, {self.stats['timed_out']} timed out, "
+                     f"{self.stats['failed']} failed across {len(set(domains.values()))} publishers "
+                     f"in {time.time() - started:.1f}s")
+        return results
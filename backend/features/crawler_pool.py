@@ -0,0 +1,288 @@
+# crawler_pool.py
+# Long-lived crawl service shared by every PubMed search. One background thread runs an asyncio event
+# loop that owns a small pool of warm crawl4ai browsers; sync callers (Flask request threads) submit
+# coroutines to it and wait on the returned futures, instead of each search starting its own loop and
+# browser. Browsers are started on demand up to CRAWLER_POOL_SIZE, each serving a few pages at once.
+# A periodic health check probes idle browsers and recycles any that crashed, failed repeatedly, served
+# CRAWLER_MAX_USES pages or sat idle past CRAWLER_IDLE_SECONDS (CRAWLER_MIN_WARM are always kept).
+import os
+import time
+import atexit
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+from crawl4ai import AsyncWebCrawler
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+CRAWLER_POOL_SIZE = int(os.environ.get("CRAWLER_POOL_SIZE", 2))  # Browsers kept by the pool
+CRAWLER_PAGES_PER_BROWSER = int(os.environ.get("CRAWLER_PAGES_PER_BROWSER", 2))  # Pages open at once per browser
+CRAWLER_MIN_WARM = int(os.environ.get("CRAWLER_MIN_WARM", 1))  # Browsers kept running while idle
+CRAWLER_IDLE_SECONDS = int(os.environ.get("CRAWLER_IDLE_SECONDS", 600))  # Idle browsers beyond the warm ones are closed
+CRAWLER_MAX_USES = int(os.environ.get("CRAWLER_MAX_USES", 200))  # Pages per browser before it is replaced
+CRAWLER_MAX_FAILURES = int(os.environ.get("CRAWLER_MAX_FAILURES", 3))  # Consecutive errors that mark a browser as crashed
+CRAWLER_HEALTH_INTERVAL = int(os.environ.get("CRAWLER_HEALTH_INTERVAL", 60))  # Seconds between health checks
+CRAWLER_PROBE_TIMEOUT = float(os.environ.get("CRAWLER_PROBE_TIMEOUT", 15))
+CRAWLER_PREWARM = os.environ.get("CRAWLER_PREWARM", "false").lower() == "true"  # Start a browser with the service
+PROBE_URL = "raw:<html><body><p>ok</p></body></html>"  # Rendered locally, no network
+
+
+class _PooledCrawler:
+    """A started browser plus the bookkeeping the pool needs to share and retire it."""
+
+    def __init__(self, crawler, number):
+        self.crawler = crawler
+        self.number = number
+        self.in_use = 0
+        self.uses = 0
+        self.failures = 0  # Consecutive
+        self.retiring = False
+        self.retire_reason = None
+        self.probing = False  # Health probe running; the browser is not handed out meanwhile
+        self.last_used = time.time()
+
+
+class CrawlerPool:
+    """
+    Size-limited pool of AsyncWebCrawler instances, used only from the service loop. `arun(url)` borrows
+    the least busy healthy browser (starting one if the pool has room, waiting otherwise) and returns
+    crawl4ai's result; exceptions propagate to the caller after being counted against the browser.
+    `timeout` bounds the crawl itself, not the wait for a free browser.
+    """
+
+    def __init__(self, size=CRAWLER_POOL_SIZE, pages_per_browser=CRAWLER_PAGES_PER_BROWSER):
+        self.size = max(1, size)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self._crawlers = []
+        self._starting = 0
+        self._created = 0
+        self._condition = None  # Created on the service loop
+        self.stats = {"started": 0, "recycled": 0, "crawls": 0, "errors": 0, "waits": 0}
+
+    def _cond(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _start_crawler(self):
+        self._created += 1
+        number = self._created
+        crawler = AsyncWebCrawler()
+        started = time.time()
+        await crawler.__aenter__()
+        self.stats["started"] += 1
+        logging.info(f"Crawler pool: browser #{number} started in {time.time() - started:.1f}s")
+        return _PooledCrawler(crawler, number)
+
+    async def _close(self, pooled, reason):
+        try:
+            await pooled.crawler.__aexit__(None, None, None)
+        except Exception as e:
+            logging.warning(f"Crawler pool: error closing browser #{pooled.number}: {e}")
+        logging.info(f"Crawler pool: browser #{pooled.number} closed ({reason}) after {pooled.uses} pages")
+
+    async def _retire(self, pooled, reason):
+        """Takes a browser out of rotation; it is closed as soon as its open pages finish."""
+        if not pooled.retiring:
+            pooled.retiring = True
+            pooled.retire_reason = reason
+            self.stats["recycled"] += 1
+        if pooled.in_use == 0 and not pooled.probing and pooled in self._crawlers:
+            self._crawlers.remove(pooled)
+            await self._close(pooled, reason)
+            async with self._cond():
+                self._cond().notify_all()
+
+    def _pick(self):
+        candidates = [c for c in self._crawlers if not c.retiring and not c.probing and c.in_use < self.pages_per_browser]
+        return min(candidates, key=lambda c: c.in_use) if candidates else None
+
+    async def _acquire(self):
+        waited = False
+        async with self._cond():
+            while True:
+                pooled = self._pick()
+                # Prefer an idle slot on a running browser; start another only if every browser is busy
+                if pooled is not None and (pooled.in_use == 0 or len(self._crawlers) + self._starting >= self.size):
+                    pooled.in_use += 1
+                    return pooled
+                if len(self._crawlers) + self._starting < self.size:
+                    self._starting += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.stats["waits"] += 1
+                await self._cond().wait()
+        try:
+            pooled = await self._start_crawler()
+        except BaseException:
+            self._starting -= 1
+            async with self._cond():
+                self._cond().notify_all()  # Let a waiter try to start one instead
+            raise
+        pooled.in_use = 1
+        self._crawlers.append(pooled)
+        self._starting -= 1
+        return pooled
+
+    async def _release(self, pooled, failed):
+        pooled.in_use -= 1
+        pooled.uses += 1
+        pooled.last_used = time.time()
+        pooled.failures = pooled.failures + 1 if failed else 0
+        if pooled.failures >= CRAWLER_MAX_FAILURES:
+            await self._retire(pooled, f"{pooled.failures} consecutive errors")
+        elif pooled.uses >= CRAWLER_MAX_USES:
+            await self._retire(pooled, "page limit reached")
+        elif pooled.retiring:
+            await self._retire(pooled, pooled.retire_reason)
+        async with self._cond():
+            self._cond().notify_all()
+
+    async def arun(self, url, timeout=None, **kwargs):
+        pooled = await self._acquire()
+        failed = False
+        try:
+            self.stats["crawls"] += 1
+            return await asyncio.wait_for(pooled.crawler.arun(url=url, **kwargs), timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            raise  # Timed out; says nothing about the browser's health
+        except Exception:
+            failed = True
+            self.stats["errors"] += 1
+            raise
+        finally:
+            await self._release(pooled, failed)
+
+    async def warm_up(self, count=CRAWLER_MIN_WARM):
+        while len(self._crawlers) + self._starting < min(count, self.size):
+            self._starting += 1
+            try:
+                self._crawlers.append(await self._start_crawler())
+            finally:
+                self._starting -= 1
+
+    async def check_health(self):
+        """Probes idle browsers, recycling crashed ones and closing those idle past CRAWLER_IDLE_SECONDS."""
+        now = time.time()
+        idle = [c for c in self._crawlers if not c.retiring and not c.probing and c.in_use == 0]
+        for pooled in idle:
+            if pooled.in_use or pooled.retiring:
+                continue  # Borrowed or retired while an earlier browser was being probed
+            running = len([c for c in self._crawlers if not c.retiring])
+            if now - pooled.last_used > CRAWLER_IDLE_SECONDS and running > CRAWLER_MIN_WARM:
+                await self._retire(pooled, "idle")
+                continue
+            pooled.probing = True  # Keep the browser out of rotation while it is probed
+            try:
+                result = await asyncio.wait_for(pooled.crawler.arun(url=PROBE_URL), timeout=CRAWLER_PROBE_TIMEOUT)
+                healthy = bool(result and result.success)
+            except Exception as e:
+                logging.warning(f"Crawler pool: health probe of browser #{pooled.number} failed: {e}")
+                healthy = False
+            finally:
+                pooled.probing = False
+            if not healthy:
+                await self._retire(pooled, "failed health check")
+            elif pooled.retiring:
+                await self._retire(pooled, pooled.retire_reason)  # Retired while probed; close it now
+            async with self._cond():
+                self._cond().notify_all()  # Back in rotation for callers that waited during the probe
+
+    async def close(self):
+        for pooled in list(self._crawlers):
+            self._crawlers.remove(pooled)
+            await self._close(pooled, "shutdown")
+
+    def describe(self):
+        return {**self.stats, "browsers": len(self._crawlers),
+                "open_pages": sum(c.in_use for c in self._crawlers)}
+
+
+class CrawlerService:
+    """
+    Background thread running the event loop that owns the crawler pool. `submit(coroutine)` schedules
+    a coroutine on it from any thread and returns a concurrent.futures.Future; `run(...)` waits for it.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or CrawlerPool()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._health_task = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                self._health_task = loop.create_task(self._health_loop())
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name="CrawlerService", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            logging.info(f"Crawler service started (pool of {self.pool.size} browsers, "
+                         f"{self.pool.pages_per_browser} pages each)")
+            if CRAWLER_PREWARM:
+                asyncio.run_coroutine_threadsafe(self.pool.warm_up(), loop)
+            return loop
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(CRAWLER_HEALTH_INTERVAL)
+            try:
+                await self.pool.check_health()
+            except Exception as e:
+                logging.error(f"Crawler pool health check failed: {e}")
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the service loop and returns a concurrent.futures.Future for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_started())
+
+    def call_soon(self, callback, *args):
+        """Schedules a plain callback on the service loop from any thread (e.g. to feed an asyncio.Queue)."""
+        self._ensure_started().call_soon_threadsafe(callback, *args)
+
+    def run(self, coroutine, timeout=None):
+        """Runs a coroutine on the service loop and blocks until it finishes (cancelling it on timeout)."""
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def warm_up(self):
+        """Starts CRAWLER_MIN_WARM browsers in the background, e.g. when the app boots."""
+        return self.submit(self.pool.warm_up())
+
+    def stop(self, timeout=30):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        if self._health_task is not None:
+            loop.call_soon_threadsafe(self._health_task.cancel)
+        try:
+            asyncio.run_coroutine_threadsafe(self.pool.close(), loop).result(timeout=timeout)
+        except Exception as e:
+            logging.warning(f"Crawler service: error closing browsers on shutdown: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=timeout)
+
+
+crawler_service = CrawlerService()
+atexit.register(crawler_service.stop)  # Close the browsers instead of leaving orphaned Chromium processes
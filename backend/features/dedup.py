@@ -0,0 +1,192 @@
+# dedup.py
+# Near-duplicate detection ahead of enrichment. CORE often returns the same paper several times
+# (preprint and published version, copies in different repositories, small title edits); each copy
+# would otherwise be enriched, written and embedded on its own. Items are matched by exact DOI, then
+# by MinHash/LSH similarity of their normalized title + abstract, and duplicates are folded into
+# the first (highest ranked) copy, which keeps the other copies' download URLs. The index merges into
+# its own copy of each canonical item, so items already handed to enrichment are never modified.
+import os
+import re
+import zlib
+import logging
+import numpy as np
+
+from .helper.doi_finder import normalize_title
+
+try:
+    import xxhash
+except ImportError:  # Optional: zlib.crc32 is slower but gives the same quality of hash for this
+    xxhash = None
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.7))  # Estimated Jaccard similarity that counts as a duplicate
+DEDUP_NUM_PERM = int(os.environ.get("DEDUP_NUM_PERM", 64))  # MinHash signature length
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", 16))  # LSH bands; DEDUP_NUM_PERM / DEDUP_BANDS rows each
+DEDUP_SHINGLE_SIZE = 3  # Words per shingle
+DEDUP_ABSTRACT_WORDS = 200  # Only the start of the abstract is compared, which bounds the cost per item
+DEDUP_MIN_SHINGLES = 3  # Items with less text than this are only matched by DOI
+
+MERSENNE_PRIME = (1 << 31) - 1
+DOI_URL_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:)', re.IGNORECASE)
+ARXIV_DOI_PREFIX = "10.48550/"
+
+
+def normalize_doi(doi):
+    """Lower-cases a DOI and strips resolver prefixes such as https://doi.org/."""
+    return DOI_URL_PREFIX.sub('', (doi or '').strip()).lower()
+
+
+def title_key(title):
+    """normalize_title with punctuation removed, so 'Title: Sub-title.' and 'Title Sub title' match."""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', normalize_title(title)).split())
+
+
+def _shingles(item):
+    words = title_key(item.get('title')).split()
+    words += title_key(item.get('abstract')).split()[:DEDUP_ABSTRACT_WORDS]
+    if len(words) < DEDUP_SHINGLE_SIZE:
+        return set()
+    return {' '.join(words[i:i + DEDUP_SHINGLE_SIZE]) for i in range(len(words) - DEDUP_SHINGLE_SIZE + 1)}
+
+
+def _hash32(shingle):
+    data = shingle.encode('utf-8')
+    return xxhash.xxh32_intdigest(data) if xxhash is not None else zlib.crc32(data)
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes (a*x + b) mod p, computed for all permutations at once."""
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    def signature(self, shingles):
+        hashes = np.fromiter((_hash32(s) for s in shingles), dtype=np.int64, count=len(shingles)) % MERSENNE_PRIME
+        # a and the hashes are below 2^31, so the products fit in int64
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+def _distinct_dois(doi_a, doi_b):
+    # Two different DOIs are two papers, except an arXiv preprint DOI next to the published one
+    if not doi_a or not doi_b or doi_a == doi_b:
+        return False
+    return not (doi_a.startswith(ARXIV_DOI_PREFIX) or doi_b.startswith(ARXIV_DOI_PREFIX))
+
+
+def _merge_duplicate(canonical, duplicate):
+    """Folds a duplicate into its canonical item: keeps its download URLs and fills fields the canonical lacks."""
+    alternates = canonical.setdefault('alternateDownloadUrls', [])
+    for url in [duplicate.get('downloadUrl')] + list(duplicate.get('alternateDownloadUrls') or []):
+        if url and url != canonical.get('downloadUrl') and url not in alternates:
+            alternates.append(url)
+    canonical.setdefault('duplicateIds', []).append(duplicate.get('id'))
+    for field in ('doi', 'abstract', 'fullText', 'yearPublished', 'downloadUrl'):
+        if not canonical.get(field) and duplicate.get(field):
+            canonical[field] = duplicate[field]
+
+
+class DuplicateIndex:
+    """
+    Incremental duplicate index: add() items in rank order and it returns the earlier item each
+    duplicate was folded into. Lookups cost one signature plus a few LSH bucket probes, so items
+    can be checked as they stream in.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS):
+        self.threshold = threshold
+        self._hasher = MinHasher(num_perm)
+        self._rows = max(num_perm // bands, 1)
+        self._buckets = [{} for _ in range(num_perm // self._rows)]
+        self._items = []  # Our own copies of the canonical items; positions are referenced from the buckets
+        self._signatures = []
+        self._by_doi = {}
+        self.duplicates = 0
+
+    def _band_keys(self, signature):
+        for band, buckets in enumerate(self._buckets):
+            yield buckets, signature[band * self._rows:(band + 1) * self._rows].tobytes()
+
+    def _near_duplicate(self, signature, doi):
+        candidates = set()
+        for buckets, key in self._band_keys(signature):
+            candidates.update(buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for position in candidates:
+            other = self._signatures[position]
+            if other is None or _distinct_dois(doi, normalize_doi(self._items[position].get('doi'))):
+                continue
+            score = float(np.mean(other == signature))
+            if score >= best_score:
+                best, best_score = position, score
+        return best
+
+    def add(self, item):
+        """Returns the canonical copy this item was merged into, or None if it is new (a copy is then indexed)."""
+        doi = normalize_doi(item.get('doi'))
+        position = self._by_doi.get(doi) if doi else None
+        shingles = None
+        signature = None
+        if position is None:
+            shingles = _shingles(item)
+            if len(shingles) >= DEDUP_MIN_SHINGLES:
+                signature = self._hasher.signature(shingles)
+                position = self._near_duplicate(signature, doi)
+
+        if position is not None:
+            canonical = self._items[position]
+            _merge_duplicate(canonical, item)
+            if doi:
+                self._by_doi.setdefault(doi, position)
+            self.duplicates += 1
+            logging.debug(f"Duplicate of item {canonical.get('id')}: {item.get('id')} ('{str(item.get('title'))[:50]}...')")
+            return canonical
+
+        position = len(self._items)
+        self._items.append(dict(item, alternateDownloadUrls=list(item.get('alternateDownloadUrls') or []),
+                                duplicateIds=list(item.get('duplicateIds') or [])))
+        self._signatures.append(signature)
+        if doi:
+            self._by_doi[doi] = position
+        if signature is not None:
+            for buckets, key in self._band_keys(signature):
+                buckets.setdefault(key, []).append(position)
+        return None
+
+    def items(self):
+        """The canonical items with every duplicate seen so far folded in, in the order they were added."""
+        return list(self._items)
+
+    def alternates(self, position):
+        """Download URLs merged into the position-th canonical item so far."""
+        return list(self._items[position]['alternateDownloadUrls'])
+
+
+def iter_deduplicated(items, index=None):
+    """
+    Yields the items that are not duplicates of an earlier one, unmodified and as soon as they arrive.
+    Duplicates are folded into the index's copy of their canonical item; pass an `index` to read the
+    download URLs of duplicates that arrived after the item was yielded (index.alternates(position)).
+    """
+    index = index or DuplicateIndex()
+    total = 0
+    for item in items:
+        total += 1
+        if index.add(item) is None:
+            yield item
+    if index.duplicates:
+        logging.info(f"Dedup: collapsed {index.duplicates} duplicates out of {total} items")
+
+
+def deduplicate(items):
+    """List version of iter_deduplicated. Duplicates that appear after their canonical item are folded in before it is returned."""
+    index = DuplicateIndex()
+    for _ in iter_deduplicated(items, index):
+        pass
+    return index.items()
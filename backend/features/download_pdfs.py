@@ -1,10 +1,51 @@
 import csv
+import time
+import logging
 import requests
 import zipfile
 import os
+import queue
+import shutil
+import threading
+import tempfile
 from io import BytesIO
 import re
-from urllib.parse import unquote
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import unquote, urlparse
+from .helper.http_session import create_session_with_retries
+from .helper.rate_limiter import TokenBucket
+from .result_store import parse_keywords
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Concurrent Download Configuration ---
+PDF_DOWNLOAD_WORKERS = int(os.environ.get("PDF_DOWNLOAD_WORKERS", 8))  # Downloads in flight overall
+PDF_DOWNLOAD_PER_HOST = int(os.environ.get("PDF_DOWNLOAD_PER_HOST", 2))  # Downloads in flight per host
+PDF_DOWNLOAD_TIMEOUT = float(os.environ.get("PDF_DOWNLOAD_TIMEOUT", 30))  # Connect/read timeout per request
+PDF_DOWNLOAD_MAX_BYTES_PER_SECOND = int(os.environ.get("PDF_DOWNLOAD_MAX_BYTES_PER_SECOND", 0))  # Shared cap; 0 = unlimited
+# Downloads may run at most this many rows ahead of the next archive entry, which bounds what is held back
+PDF_DOWNLOAD_LOOKAHEAD = int(os.environ.get("PDF_DOWNLOAD_LOOKAHEAD", 32))
+PDF_CHUNK_SIZE = 64 * 1024
+# Downloads are spooled in memory up to this size and to a temporary file (in PDF_SPOOL_DIR) beyond it
+PDF_SPOOL_MEMORY_BYTES = int(os.environ.get("PDF_SPOOL_MEMORY_BYTES", 512 * 1024))
+PDF_SPOOL_DIR = os.environ.get("PDF_SPOOL_DIR") or None  # None: the system temp directory
+PDF_MAX_FILE_MB = int(os.environ.get("PDF_MAX_FILE_MB", 100))  # Larger downloads are abandoned; 0 = no limit
+PDF_MAX_TOTAL_MB = int(os.environ.get("PDF_MAX_TOTAL_MB", 2048))  # Cap on the content of one archive; 0 = no limit
+# Streamed archives: zip bytes buffered between the builder thread and a slow client (in ~64 KB chunks)
+PDF_STREAM_BUFFER_CHUNKS = int(os.environ.get("PDF_STREAM_BUFFER_CHUNKS", 64))
+ERRORS_ENTRY_NAME = "download_errors.txt"
+
+# One pooled, retrying session for all downloads; keep-alive connections per host match the per-host limit
+_pdf_session = create_session_with_retries(retries=3, pool_connections=50, pool_maxsize=PDF_DOWNLOAD_PER_HOST)
+# Bandwidth is metered in chunks: one token per PDF_CHUNK_SIZE bytes read
+_bandwidth = (TokenBucket(PDF_DOWNLOAD_MAX_BYTES_PER_SECOND / PDF_CHUNK_SIZE, burst=4)
+              if PDF_DOWNLOAD_MAX_BYTES_PER_SECOND > 0 else None)
+
+
+class PdfSizeLimitError(Exception):
+    """A download or archive went over PDF_MAX_FILE_MB / PDF_MAX_TOTAL_MB."""
 
 def sanitize_filename(filename):
     """Sanitize the filename to be safe for all operating systems."""
@@ -108,12 +149,209 @@ def download_pubmed_pdfs(csv_file_path, output_zip_name):
         print(error_message)
         return False, error_message
 
+def _pdf_url(url):
+    """Turns arXiv abstract links into their PDF links; other URLs are used as they are."""
+    if "arxiv.org/abs/" in url:
+        return url.replace("arxiv.org/abs/", "arxiv.org/pdf/") + ".pdf"
+    return url
+
+def _read_download_jobs(csv_file_path):
+    """
+    Returns (filename, urls) for every CSV row with a download URL, in CSV order. urls starts with
+    Download_URL and continues with the row's Alternate_Download_URLs as fallbacks; filenames are unique.
+    """
+    jobs = []
+    used_names = set()
+    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if not row.get("Download_URL"):
+                continue
+            candidates = [row["Download_URL"]] + parse_keywords(row.get("Alternate_Download_URLs"))
+            urls = list(dict.fromkeys(_pdf_url(url.strip()) for url in candidates if url and url.strip()))
+            safe_title = sanitize_filename(row.get("Title") or "untitled")
+            filename = f"{safe_title}.pdf"
+            copy = 2
+            while filename in used_names:  # Same title twice would otherwise overwrite the first entry
+                filename = f"{safe_title} ({copy}).pdf"
+                copy += 1
+            used_names.add(filename)
+            jobs.append((filename, urls))
+    return jobs
+
+def _download_pdf(urls, max_bytes=PDF_MAX_FILE_MB * 1024 * 1024):
+    """
+    Downloads the first URL in urls that answers, falling back to the next one on errors. The body is
+    streamed chunk by chunk into a spooled temporary file, which is returned rewound as (spool, errors);
+    spool is None if every URL failed. Bodies over max_bytes are abandoned.
+    """
+    errors = []
+    for url in urls:
+        spool = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MEMORY_BYTES, dir=PDF_SPOOL_DIR)
+        try:
+            with _pdf_session.get(url, timeout=PDF_DOWNLOAD_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get('Content-Length') or 0)
+                if max_bytes and declared > max_bytes:
+                    raise PdfSizeLimitError(f"{declared} bytes is over the {max_bytes} byte limit")
+                size = 0
+                for chunk in response.iter_content(PDF_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise PdfSizeLimitError(f"over the {max_bytes} byte limit")
+                    if _bandwidth is not None:
+                        _bandwidth.acquire()
+                    spool.write(chunk)
+            spool.seek(0)
+            return spool, errors
+        except PdfSizeLimitError as e:
+            spool.close()
+            errors.append(f"{url}: {e}")
+            break  # Alternates are copies of the same paper
+        except requests.exceptions.RequestException as e:
+            spool.close()
+            errors.append(f"{url}: {e}")
+        except Exception as e:
+            spool.close()
+            errors.append(f"{url}: unexpected error: {e}")
+    return None, errors
+
+def _discard_download(result):
+    spool, _ = result
+    if spool is not None:
+        spool.close()
+
+def iter_pdf_downloads(jobs, download=_download_pdf, workers=PDF_DOWNLOAD_WORKERS,
+                       per_host=PDF_DOWNLOAD_PER_HOST, lookahead=PDF_DOWNLOAD_LOOKAHEAD, discard=None):
+    """
+    Downloads (filename, urls) jobs concurrently and yields (job, download(urls)) in job order, so archives
+    come out the same on every run. At most `workers` downloads run at once and at most `per_host` per host
+    (by the first URL's host); a job whose host is busy lets later jobs for other hosts go first.
+    If the caller stops early, `discard(result)` is called for results that were never yielded.
+    """
+    hosts = [(urlparse(urls[0]).hostname or '').lower() for _, urls in jobs]
+    workers = max(1, workers)
+    pending = list(range(len(jobs)))
+    running = {}  # future -> job index
+    finished = {}  # job index -> result, waiting for the jobs before it
+    active = Counter()  # host -> downloads in flight
+    next_index = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='PDFDownload') as executor:
+            while next_index < len(jobs):
+                for index in list(pending):
+                    if len(running) >= workers or index >= next_index + max(lookahead, workers):
+                        break
+                    if active[hosts[index]] >= max(1, per_host):
+                        continue
+                    pending.remove(index)
+                    active[hosts[index]] += 1
+                    running[executor.submit(download, jobs[index][1])] = index
+                if next_index not in finished:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = running.pop(future)
+                        active[hosts[index]] -= 1
+                        finished[index] = future.result()
+                while next_index in finished:
+                    result = finished.pop(next_index)
+                    next_index += 1
+                    yield jobs[next_index - 1], result
+    finally:
+        # The executor has waited for downloads still in flight; release whatever they and the held-back ones hold
+        if discard is not None:
+            for result in finished.values():
+                discard(result)
+            for future in running:
+                if not future.cancelled() and future.exception() is None:
+                    discard(future.result())
+
+
+class PdfZipBuilder:
+    """
+    Writes downloaded files into a zip archive, copying each one in chunks so no whole file is held in
+    memory. PDFs are stored as they are (their content is already compressed); anything else is deflated.
+    `add` raises PdfSizeLimitError once the archive's content would go over max_total_bytes.
+    """
+
+    def __init__(self, target, max_total_bytes=PDF_MAX_TOTAL_MB * 1024 * 1024):
+        self.zipf = zipfile.ZipFile(target, 'w')
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self.entries = 0
+        self.stored_entries = 0
+
+    def add(self, filename, source):
+        """Adds the contents of the binary file object `source` as `filename`."""
+        size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+        if self.max_total_bytes and self.total_bytes + size > self.max_total_bytes:
+            raise PdfSizeLimitError(f"archive limit of {self.max_total_bytes} bytes reached")
+        head = source.read(5)
+        source.seek(0)
+        info = zipfile.ZipInfo(filename, date_time=time.localtime(time.time())[:6])
+        info.compress_type = zipfile.ZIP_STORED if head.startswith(b'%PDF') else zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        info.file_size = size  # Lets zipfile pick ZIP64 headers up front for very large entries
+        with self.zipf.open(info, 'w') as entry:
+            shutil.copyfileobj(source, entry, PDF_CHUNK_SIZE)
+        self.total_bytes += size
+        self.entries += 1
+        self.stored_entries += info.compress_type == zipfile.ZIP_STORED
+
+    def close(self):
+        self.zipf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _write_core_pdfs_zip(jobs, target, report_errors=False):
+    """
+    Downloads jobs and writes them into a zip archive at target (a path or a writable file object).
+    With report_errors, failures are listed in a text entry at the end of the archive.
+    Returns (downloaded, error_messages, builder).
+    """
+    error_messages = []
+    downloaded = 0
+    with PdfZipBuilder(target) as builder:
+        for (filename, urls), (spool, errors) in iter_pdf_downloads(jobs, discard=_discard_download):
+            if spool is None:
+                error_msg = f"Error downloading {'; '.join(errors)}"
+                error_messages.append(error_msg)
+                print(error_msg)
+                continue
+            try:
+                builder.add(filename, spool)
+            except PdfSizeLimitError as e:
+                error_messages.append(f"Stopped at {filename}: {e}")
+                print(f"Stopped at {filename}: {e}")
+                break
+            finally:
+                spool.close()
+            downloaded += 1
+            print(f"Downloaded: {filename}")
+        if report_errors and error_messages:
+            builder.add(ERRORS_ENTRY_NAME, BytesIO('\n'.join(error_messages).encode('utf-8')))
+    return downloaded, error_messages, builder
+
+def _log_download_summary(downloaded, jobs, builder, started):
+    logging.info(f"PDF downloads: {downloaded}/{len(jobs)} in {time.time() - started:.1f}s "
+                 f"({PDF_DOWNLOAD_WORKERS} workers, {PDF_DOWNLOAD_PER_HOST} per host), "
+                 f"{builder.total_bytes / (1024 * 1024):.1f} MB archived, {builder.stored_entries} entries stored uncompressed")
+
 def download_core_pdfs(csv_file_path, output_zip_name):
     """
     Reads a CSV file, downloads PDFs from the 'Download_URL' column,
     handling both direct download URLs and arXiv URLs, and saves them
     into a zip file with proper naming.
 
+    Downloads run concurrently (see iter_pdf_downloads); entries are
+    written in CSV order. Alternate_Download_URLs are tried when the
+    main URL fails. Downloads are spooled to disk and copied into the
+    archive in chunks, within PDF_MAX_FILE_MB and PDF_MAX_TOTAL_MB.
+
     Args:
         csv_file_path (str): The path to the CSV file.
         output_zip_name (str): The name of the output zip file.
@@ -122,56 +360,20 @@ def download_core_pdfs(csv_file_path, output_zip_name):
         tuple: (success, message) where success is a boolean and message is a string
     """
     try:
-        pdf_files = []
-        error_messages = []
+        started = time.time()
 
         # Read the CSV file and extract the download URLs and titles
-        with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                url = row.get("Download_URL")
-                title = row.get("Title", "untitled")
-                
-                if not url:
-                    continue
-
-                try:
-                    # Handle arXiv URLs
-                    if "arxiv.org/abs/" in url:
-                        pdf_url = url.replace("arxiv.org/abs/", "arxiv.org/pdf/") + ".pdf"
-                    else:
-                        pdf_url = url
-
-                    # Download the PDF
-                    response = requests.get(pdf_url, timeout=30)
-                    response.raise_for_status()
-
-                    # Create a safe filename from the title
-                    safe_title = sanitize_filename(title)
-                    filename = f"{safe_title}.pdf"
-
-                    # Add to our list of PDFs
-                    pdf_files.append((filename, response.content))
-                    print(f"Downloaded: {filename}")
-
-                except requests.exceptions.RequestException as e:
-                    error_msg = f"Error downloading {url}: {str(e)}"
-                    error_messages.append(error_msg)
-                    print(error_msg)
-                except Exception as e:
-                    error_msg = f"Unexpected error processing {url}: {str(e)}"
-                    error_messages.append(error_msg)
-                    print(error_msg)
-
-        if not pdf_files:
-            return False, "No PDFs were successfully downloaded"
+        jobs = _read_download_jobs(csv_file_path)
 
-        # Create a zip file containing the downloaded PDFs
-        with zipfile.ZipFile(output_zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for filename, content in pdf_files:
-                zipf.writestr(filename, content)
+        # Create a zip file containing the downloaded PDFs, streaming each one in as soon as it is its turn
+        downloaded, error_messages, builder = _write_core_pdfs_zip(jobs, output_zip_name)
+
+        _log_download_summary(downloaded, jobs, builder, started)
+        if not downloaded:
+            os.remove(output_zip_name)
+            return False, "No PDFs were successfully downloaded"
 
-        success_message = f"Successfully downloaded {len(pdf_files)} PDFs"
+        success_message = f"Successfully downloaded {downloaded} PDFs"
         if error_messages:
             success_message += f" (with {len(error_messages)} errors)"
 
@@ -182,6 +384,74 @@ def download_core_pdfs(csv_file_path, output_zip_name):
         print(error_message)
         return False, error_message
 
+
+class _QueueWriter:
+    """
+    Write-only file object that hands zip bytes to a bounded queue for a streamed response. It is not
+    seekable, so zipfile writes each entry's sizes in a data descriptor after its data.
+    """
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def put(self, item):
+        # Blocks while the client is behind, but gives up once the response has been closed
+        while True:
+            if self.cancelled.is_set():
+                raise BrokenPipeError("client went away")
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self.put(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def stream_core_pdfs_zip(csv_file_path):
+    """
+    Yields a zip archive of the CSV's PDFs while it is being built, for a streamed HTTP response. Each
+    entry goes out as soon as its PDF is downloaded and it is its turn (CSV order); the central directory
+    comes last. Failed downloads are listed in download_errors.txt inside the archive, since the response
+    status has already been sent by then. Closing the generator stops the downloads.
+    """
+    jobs = _read_download_jobs(csv_file_path)
+    chunks = queue.Queue(maxsize=max(1, PDF_STREAM_BUFFER_CHUNKS))
+    cancelled = threading.Event()
+    writer = _QueueWriter(chunks, cancelled)
+    finished = object()
+
+    def build():
+        started = time.time()
+        try:
+            downloaded, _, builder = _write_core_pdfs_zip(jobs, writer, report_errors=True)
+            _log_download_summary(downloaded, jobs, builder, started)
+        except BrokenPipeError:
+            logging.info(f"Streamed PDF archive for {os.path.basename(csv_file_path)} abandoned by the client")
+        except Exception as e:
+            logging.error(f"Error streaming PDF archive for {csv_file_path}: {e}")
+        finally:
+            try:
+                writer.put(finished)
+            except BrokenPipeError:
+                pass
+
+    threading.Thread(target=build, name="PDFZipStream", daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is finished:
+                return
+            yield chunk
+    finally:
+        cancelled.set()
+
 def determine_source_from_csv(csv_file_path):
     """
     Determine the source of papers in the CSV file (PubMed or CORE).
@@ -8,6 +8,7 @@ import nltk
 import os
 import time
 import json
+from .result_store import read_results_frame
 
 # --- NLTK Download ---
 try:
@@ -23,11 +24,11 @@ HDBSCAN_MIN_CLUSTER_SIZE = 3  # Min sentences to form a dense cluster
 
 # Load CSV file
 def load_data(csv_filepath):
-    """Loads the data from the CSV file."""
+    """Loads the columns needed for chunking from the results dataset (or the CSV if there is none)."""
     print(f"Loading data from {csv_filepath}...")
     start_time = time.time()
     try:
-        df = pd.read_csv(csv_filepath)
+        df = read_results_frame(csv_filepath, columns=['Source', 'Reference', 'Doi', 'Title', 'Full_Text', 'Year_Published'])
         print(f"Data loaded in {time.time() - start_time:.2f} seconds.")
         if 'Full_Text' not in df.columns or 'Doi' not in df.columns or 'Title' not in df.columns:
             raise ValueError("CSV must contain 'Full_Text', 'Doi', 'Title'.")
@@ -0,0 +1,127 @@
+# federated_search.py
+# search_source=all: queries CORE and PubMed at the same time and merges their results as they
+# arrive, dropping papers already seen from the other source (matched by DOI, then by title). Each
+# source gets an equal share of max_results, so the faster one cannot crowd the other out.
+import math
+import queue
+import logging
+import threading
+
+from .search import iter_search_works
+from .search_pubmed import search_pubmed
+from .search_cache import cached_search, cached_iter_search
+from .dedup import normalize_doi, title_key
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+
+class ResultMerger:
+    """Keeps the first copy of each paper seen across sources, matching by DOI and then by title."""
+
+    def __init__(self):
+        self._dois = set()
+        self._titles = set()
+        self.kept = 0
+        self.duplicates = 0
+
+    def add(self, item):
+        """Returns True if item is new (and records it), False if it duplicates an earlier item."""
+        doi = normalize_doi(item.get('doi'))
+        title = title_key(item.get('title'))
+        if (doi and doi in self._dois) or (title and title in self._titles):
+            self.duplicates += 1
+            return False
+        if doi:
+            self._dois.add(doi)
+        if title:
+            self._titles.add(title)
+        self.kept += 1
+        return True
+
+
+def _core_results(query, max_results, start_year, end_year, refresh):
+    # CORE streams page by page, so its first page can be merged before the scroll finishes
+    return cached_iter_search("core", iter_search_works, query, max_results=max_results,
+                              start_year=start_year, end_year=end_year, refresh=refresh)
+
+
+def _pubmed_results(query, max_results, start_year, end_year, refresh):
+    return cached_search("pubmed", search_pubmed, query, max_results=max_results,
+                         start_year=start_year, end_year=end_year, refresh=refresh) or []
+
+
+FEDERATED_SOURCES = [
+    ("core", _core_results),
+    ("pubmed", _pubmed_results),
+]
+
+
+def _share_spare(spare, quotas, kept, held, done, finished_name):
+    """Hands a finished source's unused quota to the others: sources still running split it, finished ones take what they hold."""
+    for name in quotas:
+        if name != finished_name and name in done and spare:
+            extra = min(spare, kept[name] + len(held[name]) - quotas[name])
+            if extra > 0:
+                quotas[name] += extra
+                spare -= extra
+    running = [name for name in quotas if name not in done]
+    for position in range(spare if running else 0):
+        quotas[running[position % len(running)]] += 1
+
+
+def iter_federated_search(query, max_results=10, start_year=0, end_year=0, refresh=False):
+    """
+    Runs every source in FEDERATED_SOURCES concurrently (each asked for max_results) and yields
+    de-duplicated items in arrival order, so items from the faster source flow downstream
+    (e.g. into extract_and_save_to_csv) while the slower one is still running. At most max_results
+    items are yielded in total, ceil(max_results / sources) per source; items beyond a source's share
+    are held back and released when another source finishes short of its own. Sources still running
+    once the total is reached finish in the background (filling the cache).
+    """
+    arrivals = queue.Queue()
+    finished = object()
+
+    def run_source(name, fetch):
+        count = 0
+        try:
+            for item in fetch(query, max_results, start_year, end_year, refresh):
+                arrivals.put((name, item))
+                count += 1
+        except Exception as e:
+            logging.error(f"Federated search: {name} failed: {e}", exc_info=True)
+        finally:
+            logging.info(f"Federated search: {name} returned {count} results")
+            arrivals.put((name, finished))
+
+    for name, fetch in FEDERATED_SOURCES:
+        threading.Thread(target=run_source, args=(name, fetch), name=f"Federated-{name}", daemon=True).start()
+
+    merger = ResultMerger()
+    share = math.ceil(max_results / len(FEDERATED_SOURCES))
+    quotas = {name: share for name, _ in FEDERATED_SOURCES}
+    kept = {name: 0 for name in quotas}
+    held = {name: [] for name in quotas}  # Items beyond the source's quota, in arrival order
+    done = set()
+
+    def release(name):
+        while held[name] and kept[name] < quotas[name] and merger.kept < max_results:
+            item = held[name].pop(0)
+            if merger.add(item):
+                kept[name] += 1
+                yield item
+
+    while len(done) < len(quotas) and merger.kept < max_results:
+        name, item = arrivals.get()
+        if item is finished:
+            done.add(name)
+            spare = quotas[name] - kept[name]
+            quotas[name] = kept[name]
+            _share_spare(spare, quotas, kept, held, done, name)
+            for other in quotas:
+                yield from release(other)
+            continue
+        held[name].append(item)
+        yield from release(name)
+    logging.info(f"Federated search for '{query}': {merger.kept} unique results "
+                 f"({', '.join(f'{name}: {count}' for name, count in kept.items())}), {merger.duplicates} duplicates dropped")
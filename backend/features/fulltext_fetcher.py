@@ -0,0 +1,190 @@
+# fulltext_fetcher.py
+# Tiered full-text retrieval for PubMed results. Cheap tiers run first and the headless browser is the
+# last resort:
+#   http  - plain GET of https://doi.org/<doi>, readable text extracted from the publisher's HTML
+#   pmc   - JATS XML from PubMed Central via E-utilities, when the article has a PMCID
+#   crawl - crawl4ai headless render (the only tier that needs a browser)
+# Every attempt is timed and the tier that produced the text is reported with it.
+import os
+import time
+import asyncio
+import logging
+import threading
+import xml.etree.ElementTree as ET
+
+import aiohttp
+import requests
+from bs4 import BeautifulSoup
+
+from .helper.eutils import eutils_url, eutils_params, get_eutils
+from .helper.rate_limiter import throttle_async
+from .helper.circuit_breaker import circuit_open
+from .helper.upstream_urls import base_url
+from .helper.http_recorder import record_response
+
+try:
+    from readability import Document  # readability-lxml
+except ImportError:  # Optional: without it the article body is picked out with BeautifulSoup heuristics
+    Document = None
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+FULLTEXT_TIERS = [tier.strip() for tier in os.environ.get("FULLTEXT_TIERS", "http,pmc,crawl").split(',') if tier.strip()]
+FULLTEXT_HTTP_TIMEOUT = float(os.environ.get("FULLTEXT_HTTP_TIMEOUT", 15))
+# Extracted text shorter than this is treated as a landing page (abstract, paywall) rather than the article
+FULLTEXT_MIN_CHARS = int(os.environ.get("FULLTEXT_MIN_CHARS", 2000))
+FULLTEXT_MAX_HTML_BYTES = 10 * 1024 * 1024
+BROWSER_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form', 'button', 'svg', 'iframe']
+TIER_SOURCES = {"http": "http", "pmc": "pmc", "crawl": "crawl4ai"}  # Source names recorded in the full-text cache
+
+
+def extract_readable_text(html):
+    """Returns the main text of an HTML page as lightly formatted Markdown (headings, paragraphs, list items)."""
+    if Document is not None:
+        try:
+            html = Document(html).summary(html_partial=True)
+        except Exception as e:
+            logging.debug(f"readability failed, falling back to heuristics: {e}")
+    soup = BeautifulSoup(html, 'lxml')
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    root = soup.find('article') or soup.find('main') or soup.body or soup
+    blocks = []
+    for element in root.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'li']):
+        text = element.get_text(' ', strip=True)
+        if not text:
+            continue
+        if element.name.startswith('h'):
+            blocks.append(f"{'#' * int(element.name[1])} {text}")
+        else:
+            blocks.append(text)
+    return '\n\n'.join(blocks)
+
+
+def _jats_to_text(xml_content):
+    """Title, abstract and body sections of a PMC JATS article as Markdown, or '' if the body is not available."""
+    root = ET.fromstring(xml_content)
+    article = root.find('.//article')
+    body = article.find('body') if article is not None else None
+    if body is None:
+        return ""  # Not in the open-access subset: PMC returns front matter only
+
+    def paragraphs(element):
+        return [' '.join(''.join(p.itertext()).split()) for p in element.findall('p')]
+
+    blocks = []
+    title = article.findtext('.//article-title')
+    if title:
+        blocks.append(f"# {' '.join(title.split())}")
+    abstract = article.find('.//abstract')
+    if abstract is not None:
+        blocks.append("## Abstract")
+        blocks.extend(' '.join(''.join(p.itertext()).split()) for p in abstract.iter('p'))
+
+    def add_section(section, depth):
+        heading = section.findtext('title')
+        if heading:
+            blocks.append(f"{'#' * min(depth, 6)} {' '.join(heading.split())}")
+        blocks.extend(paragraphs(section))
+        for subsection in section.findall('sec'):
+            add_section(subsection, depth + 1)
+
+    blocks.extend(paragraphs(body))
+    for section in body.findall('sec'):
+        add_section(section, 2)
+    return '\n\n'.join(block for block in blocks if block)
+
+
+def fetch_pmc_full_text(pmcid):
+    """Fetches a PMC article's JATS XML through E-utilities and returns its text ('' if unavailable)."""
+    numeric_id = pmcid.upper().removeprefix('PMC')
+    response = get_eutils(eutils_url('efetch'), params=eutils_params(db='pmc', id=numeric_id, retmode='xml'))
+    return _jats_to_text(response.content)
+
+
+class TieredFullTextFetcher:
+    """
+    Fetches an article's full text tier by tier (see FULLTEXT_TIERS) and returns (text, tier),
+    with ('', None) if every tier came up empty. `crawl(url)` is the coroutine for the browser tier;
+    `http` is the aiohttp session for the plain-HTTP tier. Per-tier attempts, successes and time
+    are kept in `stats`.
+    """
+
+    def __init__(self, http, crawl=None, tiers=None, min_chars=FULLTEXT_MIN_CHARS):
+        self.http = http
+        self.crawl = crawl
+        self.tiers = [tier for tier in (tiers or FULLTEXT_TIERS) if tier in TIER_SOURCES and (tier != "crawl" or crawl)]
+        self.min_chars = min_chars
+        self.stats = {tier: {"attempts": 0, "successes": 0, "seconds": 0.0} for tier in self.tiers}
+        self._stats_lock = threading.Lock()
+
+    async def _fetch_http(self, doi, pmcid):
+        url = f"{base_url('doi')}/{doi}"
+        await throttle_async(url)  # doi.org redirect hop is rate limited like the other doi.org calls
+        headers = {'User-Agent': BROWSER_USER_AGENT, 'Accept': 'text/html,application/xhtml+xml'}
+        sent_at = time.time()
+        async with self.http.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=FULLTEXT_HTTP_TIMEOUT)) as response:
+            content_type = response.headers.get('Content-Type', '')
+            if response.status != 200 or 'html' not in content_type:
+                record_response("GET", url, response.status, response.headers, b"", time.time() - sent_at)
+                logging.debug(f"Plain HTTP tier skipped {doi}: status {response.status}, {content_type or 'no content type'}")
+                return ""
+            # content.read(n) returns only what is buffered so far; read chunks until the body ends or the cap is hit
+            chunks, size = [], 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= FULLTEXT_MAX_HTML_BYTES:
+                    break
+            html = b''.join(chunks)[:FULLTEXT_MAX_HTML_BYTES]
+            encoding = response.charset or 'utf-8'
+            # Redirects are followed by aiohttp, so the publisher's page is recorded under the doi.org URL
+            record_response("GET", url, response.status, response.headers, html, time.time() - sent_at)
+        try:
+            page = html.decode(encoding, errors='replace')
+        except LookupError:  # Charset Python does not know
+            page = html.decode('utf-8', errors='replace')
+        # Parsing is CPU-bound; keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, extract_readable_text, page)
+
+    async def _fetch_pmc(self, doi, pmcid):
+        if not pmcid or circuit_open(eutils_url('efetch')):
+            return ""
+        return await asyncio.get_running_loop().run_in_executor(None, fetch_pmc_full_text, pmcid)
+
+    async def _fetch_crawl(self, doi, pmcid):
+        return await self.crawl(f"https://doi.org/{doi}")
+
+    def _record(self, tier, seconds, success):
+        with self._stats_lock:
+            tier_stats = self.stats[tier]
+            tier_stats["attempts"] += 1
+            tier_stats["successes"] += int(success)
+            tier_stats["seconds"] += seconds
+
+    async def fetch(self, doi, pmcid=None):
+        """Returns (text, tier) for a DOI, trying each tier in order until one returns a full article."""
+        for tier in self.tiers:
+            if tier == "pmc" and not pmcid:
+                continue
+            started = time.time()
+            text = ""
+            try:
+                text = await getattr(self, f"_fetch_{tier}")(doi, pmcid) or ""
+            except (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.RequestException, ET.ParseError, UnicodeError) as e:
+                logging.debug(f"Full-text tier '{tier}' failed for {doi}: {e}")
+            elapsed = time.time() - started
+            # The browser tier is the last resort, so whatever it returns is kept
+            success = len(text) >= self.min_chars or (tier == "crawl" and bool(text))
+            self._record(tier, elapsed, success)
+            logging.debug(f"Full-text tier '{tier}' for {doi}: {'ok' if success else 'no article'} ({len(text)} chars, {elapsed:.2f}s)")
+            if success:
+                return text, tier
+        return "", None
+
+    def log_stats(self):
+        summary = ', '.join(f"{tier}: {s['successes']}/{s['attempts']} in {s['seconds']:.1f}s" for tier, s in self.stats.items())
+        logging.info(f"Full-text tiers (successes/attempts): {summary or 'none'}")
@@ -0,0 +1,222 @@
+# helper/circuit_breaker.py
+import os
+import time
+import logging
+import threading
+from collections import deque
+import requests
+from .rate_limiter import upstream_for_url
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+CIRCUIT_FAILURE_RATE = float(os.environ.get("CIRCUIT_FAILURE_RATE", 0.5))  # Failure share that trips a breaker
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 10))  # Calls in the window before the rate is trusted
+CIRCUIT_WINDOW = float(os.environ.get("CIRCUIT_WINDOW", 30.0))  # Seconds of history the failure rate covers
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", 30.0))  # First cool-down before a probe
+CIRCUIT_MAX_OPEN_SECONDS = float(os.environ.get("CIRCUIT_MAX_OPEN_SECONDS", 300.0))  # Cool-down doubles up to this after failed probes
+# Process-wide retry budget: retries may use at most this share of recent request volume,
+# plus a small steady allowance so an idle process can still retry the odd failure
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get("RETRY_BUDGET_MIN_PER_SECOND", 1.0))
+RETRY_BUDGET_MAX = float(os.environ.get("RETRY_BUDGET_MAX", 50))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to an upstream whose breaker is open."""
+
+
+def is_failure_status(status_code):
+    # Server errors and throttling mean the upstream is struggling; other 4xx are ordinary answers
+    return status_code >= 500 or status_code == 429
+
+
+# --- Circuit Breaker ---
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker for one upstream. Closed: requests flow and outcomes are tracked over
+    a sliding window. Open: requests are refused until the cool-down passes. Half-open: one probe is
+    let through; success closes the breaker, failure reopens it with a doubled cool-down.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_rate=CIRCUIT_FAILURE_RATE, min_calls=CIRCUIT_MIN_CALLS, window=CIRCUIT_WINDOW,
+                 open_seconds=CIRCUIT_OPEN_SECONDS, max_open_seconds=CIRCUIT_MAX_OPEN_SECONDS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = self.CLOSED
+        self._open_seconds = open_seconds
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes = deque()  # (timestamp, ok)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _cooled_down(self, now):
+        return now - self._opened_at >= self._open_seconds
+
+    def is_open(self):
+        """True while requests would be refused. Read-only, so callers can skip work (e.g. a rate-limit wait) early."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return not self._cooled_down(time.monotonic())
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow(self):
+        """Decides whether a request may be sent now. In half-open state only one probe is allowed at a time."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and self._cooled_down(now):
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logging.info(f"Circuit breaker '{self.name}' half-open: probing upstream")
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._open_seconds = self.base_open_seconds
+                    self._outcomes.clear()
+                    logging.info(f"Circuit breaker '{self.name}' closed: upstream recovered")
+                else:
+                    self._trip(now, min(self._open_seconds * 2, self.max_open_seconds))
+                return
+            if self.state == self.OPEN:
+                return  # Late result of a request sent before the breaker opened
+
+            self._outcomes.append((now, ok))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            failures = sum(1 for _, outcome_ok in self._outcomes if not outcome_ok)
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._trip(now, self.base_open_seconds)
+
+    def release(self):
+        """Forgets a request that was admitted but abandoned without an outcome (e.g. cancelled)."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _trip(self, now, open_seconds):
+        # Caller holds the lock
+        self.state = self.OPEN
+        self._opened_at = now
+        self._open_seconds = open_seconds
+        self._outcomes.clear()
+        logging.warning(f"Circuit breaker '{self.name}' open for {open_seconds:.0f}s: upstream failing")
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "rejected": self.rejected, "window_calls": len(self._outcomes)}
+
+
+# --- Retry Budget ---
+class RetryBudget:
+    """
+    Token bucket for retries shared by every session in the process. Each request deposits
+    `ratio` tokens and each retry spends one, so retries stay a bounded share of traffic even
+    when an upstream fails every call.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_BUDGET_MIN_PER_SECOND, max_balance=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self._balance = min(self.max_balance, self._balance + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def deposit(self):
+        """Called once per request sent."""
+        with self._lock:
+            self._refill_locked()
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_spend(self):
+        """Takes one retry from the budget. Returns False if the budget is exhausted."""
+        with self._lock:
+            self._refill_locked()
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            self.denied += 1
+            return False
+
+
+retry_budget = RetryBudget()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(upstream):
+    """Returns the shared breaker for an upstream key (see rate_limiter.UPSTREAM_HOSTS), or None."""
+    if not upstream:
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            breaker = _breakers[upstream] = CircuitBreaker(upstream)
+        return breaker
+
+
+def breaker_for_url(url):
+    return breaker_for(upstream_for_url(url))
+
+
+def circuit_open(url):
+    """True if requests to url's upstream are currently being refused. Use it to skip a step cheaply."""
+    breaker = breaker_for_url(url)
+    return breaker is not None and breaker.is_open()
+
+
+def before_request(url):
+    """Admits a request to url's upstream, raising CircuitOpenError if its breaker refuses it."""
+    breaker = breaker_for_url(url)
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker '{breaker.name}' is open; skipping {url}")
+    retry_budget.deposit()  # Only requests that go out earn retries; refused ones would refill it during an outage
+
+
+def record_outcome(url, response=None, error=None):
+    """Feeds the final outcome of a request (after any retries) to url's breaker."""
+    breaker = breaker_for_url(url)
+    if breaker is None:
+        return
+    breaker.record(error is None and response is not None and not is_failure_status(response.status_code))
+
+
+def release_request(url):
+    """Call instead of record_outcome when an admitted request was abandoned without an outcome."""
+    breaker = breaker_for_url(url)
+    if breaker is not None:
+        breaker.release()
+
+
+def breaker_stats():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    stats = {name: breaker.stats() for name, breaker in breakers.items()}
+    stats["retry_budget_denied"] = retry_budget.denied
+    return stats
@@ -0,0 +1,150 @@
+# helper/disk_cache.py
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+# Caches live outside DATA_FOLDER because /search wipes that folder on every run
+CACHE_FOLDER = os.environ.get(
+    "CACHE_FOLDER",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'cache'))
+)
+
+
+class DiskCache:
+    """
+    Small SQLite-backed key/value store shared by the search and enrichment caches.
+    Values are JSON-serialised and compressed; entries can carry their own TTL and the
+    store is kept under max_entries / max_bytes by evicting the least recently used rows.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, name, max_entries=None, max_bytes=None, compress=zlib.compress, decompress=zlib.decompress):
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        self.name = name
+        self.path = os.path.join(CACHE_FOLDER, f"{name}.sqlite3")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._compress = compress
+        self._decompress = decompress
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL, expires_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if missing or expired."""
+        entry = self.get_entry(key)
+        return entry[0] if entry else default
+
+    def get_entry(self, key):
+        """Returns (value, created_at) for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            blob, created_at, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        try:
+            return json.loads(self._decompress(blob).decode('utf-8')), created_at
+        except Exception as e:
+            logging.warning(f"Discarding unreadable '{self.name}' cache entry {key!r}: {e}")
+            self.delete(key)
+            return None
+
+    def has(self, key):
+        """True if key holds an unexpired entry. Cheaper than get(): the value is not read or decompressed."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[0] is not None and row[0] <= now):
+                return False
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return True
+
+    def set(self, key, value, ttl=None):
+        """Stores value under key. ttl (seconds) is optional; None means no expiry."""
+        blob = self._compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(blob), len(blob), now, now, expires_at)
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def extend_ttl(self, key, ttl=None):
+        """Pushes key's expiry out to ttl seconds from now (None: never expires); expiries are never brought forward."""
+        now = time.time()
+        with self._lock:
+            if ttl:
+                self._conn.execute(
+                    "UPDATE entries SET expires_at = ? WHERE key = ? AND expires_at IS NOT NULL AND expires_at < ?",
+                    (now + ttl, key, now + ttl)
+                )
+            else:
+                self._conn.execute("UPDATE entries SET expires_at = NULL WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self):
+        """Returns entry count and total stored bytes."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": total}
+
+    def _evict_locked(self, now):
+        """Drops expired rows, then least recently used rows until within bounds. Caller holds the lock."""
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        if self.max_entries:
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+        if self.max_bytes:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                evict_keys = []
+                for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    evict_keys.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", evict_keys)
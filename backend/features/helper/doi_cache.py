@@ -0,0 +1,56 @@
+# helper/doi_cache.py
+import os
+import time
+import logging
+from .disk_cache import DiskCache
+from .doi_finder import EMAIL, normalize_title, resolve_doi
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+DOI_CACHE_TTL = int(os.environ.get("DOI_CACHE_TTL", 90 * 24 * 60 * 60))  # Seconds; 0 disables the cache
+# Titles with no DOI are re-checked sooner, since a DOI may be registered later
+DOI_NEGATIVE_CACHE_TTL = int(os.environ.get("DOI_NEGATIVE_CACHE_TTL", 3 * 24 * 60 * 60))
+DOI_CACHE_MAX_ENTRIES = int(os.environ.get("DOI_CACHE_MAX_ENTRIES", 500000))
+
+_resolution_store = DiskCache("doi_resolutions", max_entries=DOI_CACHE_MAX_ENTRIES)
+
+
+def lookup_cached_doi(title):
+    """
+    Returns the cached resolution for a title as {"doi", "resolver", "resolved_at"}, or None if the
+    title has not been resolved recently. A cached negative result has doi set to None.
+    """
+    key = normalize_title(title)
+    if DOI_CACHE_TTL <= 0 or not key:
+        return None
+    return _resolution_store.get(key)
+
+
+def remember_doi(title, doi, resolver=None):
+    """Caches the outcome of a resolution; doi=None records that no resolver knows the title."""
+    key = normalize_title(title)
+    if DOI_CACHE_TTL <= 0 or not key:
+        return
+    record = {"doi": doi, "resolver": resolver, "resolved_at": time.time()}
+    try:
+        _resolution_store.set(key, record, ttl=DOI_CACHE_TTL if doi else DOI_NEGATIVE_CACHE_TTL)
+    except Exception as e:
+        logging.warning(f"Failed to cache DOI resolution for '{title[:60]}...': {e}")
+
+
+def get_doi_cached(title, email=EMAIL, session=None, mode=None):
+    """
+    get_doi through the resolution cache: a cached answer (including "no DOI") skips the resolvers.
+    Misses caused by resolvers failing to answer are not cached.
+    """
+    cached = lookup_cached_doi(title)
+    if cached is not None:
+        logging.debug(f"DOI cache hit for '{title[:60]}...': {cached['doi'] or 'no DOI'} (via {cached['resolver']})")
+        return cached["doi"]
+
+    doi, resolver, definitive = resolve_doi(title, email=email, session=session, mode=mode)
+    if doi or definitive:
+        remember_doi(title, doi, resolver)
+    return doi
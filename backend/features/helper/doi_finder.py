@@ -4,20 +4,47 @@ import json
 import time
 import xml.etree.ElementTree as ET
 import re
+import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import quote
 from .extract_secrets import get_secrets
+from .rate_limiter import throttle, throttle_cancellable
+from .http_session import SessionPool
+from .circuit_breaker import circuit_open
+from .upstream_urls import base_url as upstream_base_url
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Constants and Configuration ---
 EMAIL = get_secrets("email")
+# "sequential" tries the resolvers one after another; "race" queries them concurrently
+DOI_RESOLUTION_MODE = os.environ.get("DOI_RESOLUTION_MODE", "sequential").lower()
+DOI_HEDGE_DELAY = float(os.environ.get("DOI_HEDGE_DELAY", 0.25))  # Seconds between launching successive resolvers in race mode
+# "first": the first validated DOI wins; "priority": a DOI is only taken once every resolver ranked above it has answered
+DOI_RACE_POLICY = os.environ.get("DOI_RACE_POLICY", "first").lower()
+DOI_RACE_GRACE = float(os.environ.get("DOI_RACE_GRACE", 1.0))  # Max seconds "priority" waits on higher-ranked resolvers
+DOI_RACE_WORKERS = int(os.environ.get("DOI_RACE_WORKERS", 32))
+# A racing resolver whose rate-limit token is further off than this sits the race out (e.g. arXiv at 1 request / 3s)
+DOI_RACE_MAX_TOKEN_WAIT = float(os.environ.get("DOI_RACE_MAX_TOKEN_WAIT", 2.0))
+NOT_ASKED = object()  # _get_request result when a racing request was called off before it was sent
 
 # --- Generic Request Helper ---
-def _get_request(url, params=None, headers=None, timeout=15, session=None):
-    """Helper to perform GET request using session or default requests."""
+def _get_request(url, params=None, headers=None, timeout=15, session=None, cancel_event=None):
+    """Helper to perform GET request using session or default requests.
+    With a cancel_event, returns NOT_ASKED if the request is called off while waiting for its token."""
     requester = session if session else requests
+    if circuit_open(url):
+        logging.debug(f"Skipping {url}: upstream circuit breaker is open")
+        return None
+    # Shared per-upstream token bucket replaces the old per-thread politeness sleeps
+    if cancel_event is None:
+        throttle(url)
+    elif not throttle_cancellable(url, cancel_event, max_wait=DOI_RACE_MAX_TOKEN_WAIT):
+        # The race was decided (or the token is too far off): no token is taken and nothing is sent
+        return NOT_ASKED
     try:
         response = requester.get(url, params=params, headers=headers, timeout=timeout)
         return response # Return the full response object
@@ -26,23 +53,34 @@ def _get_request(url, params=None, headers=None, timeout=15, session=None):
     except requests.exceptions.RequestException as e:
         logging.error(f"Request Exception for {url}: {e}")
     return None
+def normalize_title(title):
+    """Lower-cases and collapses whitespace; the form titles are compared (and cached) in."""
+    return ' '.join((title or '').lower().split())
+
+
 def _titles_match(input_title, result_title):
     """Simple normalization and comparison for title matching."""
-    def normalize(t):
-        return ' '.join(t.lower().split())
-    return normalize(input_title) == normalize(result_title)
+    return normalize_title(input_title) == normalize_title(result_title)
+
+
+def _is_definitive(response):
+    """False when a resolver could not give an answer at all (no response, 5xx or 429), so a miss may not be final."""
+    return response is not None and response.status_code < 500 and response.status_code != 429
 
 # --- API Helper Functions (Modified for Session) ---
 
-def _get_doi_crossref(title, email, session=None):
-    """Fetches DOI from Crossref API using session."""
-    logging.debug(f"Querying Crossref for title: {title[:60]}...")
-    base_url = "https://api.crossref.org/works"
+# Each resolver is split into a request builder (returns url, params, timeout) and a response
+# parser, so the threaded helpers below and the asyncio engine share the exact same logic.
+
+def _crossref_request(title, email):
+    base_url = f"{upstream_base_url('crossref')}/works"
     params = {'query.bibliographic': title, 'rows': 1, 'mailto': email}
     # User-Agent should be handled by the session passed from the main script
+    return base_url, params, 15
 
-    response = _get_request(base_url, params=params, session=session, timeout=15)
 
+def _parse_crossref_response(title, response):
+    """Extracts a title-matched DOI from a Crossref search response."""
     if response:
         if response.status_code == 200:
             try:
@@ -73,15 +111,23 @@ def _get_doi_crossref(title, email, session=None):
     return None
 
 
-def _get_doi_openalex(title, email, session=None):
-    """Fetches DOI from OpenAlex API using session."""
-    logging.debug(f"Querying OpenAlex for title: {title[:60]}...")
+def _get_doi_crossref(title, email, session=None):
+    """Fetches DOI from Crossref API using session."""
+    logging.debug(f"Querying Crossref for title: {title[:60]}...")
+    base_url, params, timeout = _crossref_request(title, email)
+    response = _get_request(base_url, params=params, session=session, timeout=timeout)
+    return _parse_crossref_response(title, response)
+
+
+def _openalex_request(title, email):
     encoded_title = quote(title)
-    base_url = f"https://api.openalex.org/works?filter=title.search:{encoded_title}"
+    base_url = f"{upstream_base_url('openalex')}/works?filter=title.search:{encoded_title}"
     params = {'per_page': 1, 'mailto': email}
+    return base_url, params, 15
 
-    response = _get_request(base_url, params=params, session=session, timeout=15)
 
+def _parse_openalex_response(title, response):
+    """Extracts a title-matched DOI from an OpenAlex search response."""
     if response:
         if response.status_code == 200:
             try:
@@ -113,18 +159,22 @@ def _get_doi_openalex(title, email, session=None):
     return None
 
 
-def _get_doi_semantic_scholar(title, session=None):
-    """Fetches DOI from Semantic Scholar API using session."""
-    logging.debug(f"Querying Semantic Scholar for title: {title[:60]}...")
-    base_url = "https://api.semanticscholar.org/graph/v1/paper/search"
-    params = {'query': title, 'fields': 'doi', 'limit': 1}
+def _get_doi_openalex(title, email, session=None):
+    """Fetches DOI from OpenAlex API using session."""
+    logging.debug(f"Querying OpenAlex for title: {title[:60]}...")
+    base_url, params, timeout = _openalex_request(title, email)
+    response = _get_request(base_url, params=params, session=session, timeout=timeout)
+    return _parse_openalex_response(title, response)
 
-    # Keep pre-emptive sleep for S2 politeness
-    time.sleep(0.3)
 
-    # Session's retry logic handles 429s, but initial request uses the helper
-    response = _get_request(base_url, params=params, session=session, timeout=15)
+def _semantic_scholar_request(title, email=None):
+    base_url = f"{upstream_base_url('semantic_scholar')}/graph/v1/paper/search"
+    params = {'query': title, 'fields': 'doi', 'limit': 1}
+    return base_url, params, 15
 
+
+def _parse_semantic_scholar_response(title, response):
+    """Extracts a title-matched DOI from a Semantic Scholar search response."""
     if response:
         if response.status_code == 200:
              try:
@@ -158,21 +208,26 @@ def _get_doi_semantic_scholar(title, session=None):
     return None
 
 
-def _get_doi_arxiv(title, session=None):
-    """Fetches DOI (arXiv format) from arXiv API using session."""
-    logging.debug(f"Querying arXiv for title: {title[:60]}...")
-    base_url = "http://export.arxiv.org/api/query"
+def _get_doi_semantic_scholar(title, session=None):
+    """Fetches DOI from Semantic Scholar API using session."""
+    logging.debug(f"Querying Semantic Scholar for title: {title[:60]}...")
+    base_url, params, timeout = _semantic_scholar_request(title)
+    # Session's retry logic handles 429s, but initial request uses the helper
+    response = _get_request(base_url, params=params, session=session, timeout=timeout)
+    return _parse_semantic_scholar_response(title, response)
+
+
+def _arxiv_request(title, email=None):
+    base_url = f"{upstream_base_url('arxiv')}/api/query"
     # Clean title slightly for query - remove excessive whitespace
     clean_title = ' '.join(title.split())
     search_query = f'ti:"{clean_title}"' # Exact phrase search
     params = {'search_query': search_query, 'max_results': 1}
+    return base_url, params, 20 # Longer timeout for arXiv
 
-    # Keep mandatory arXiv sleep BEFORE the request
-    logging.debug("Waiting 3.1 seconds for arXiv API politeness...")
-    time.sleep(3.1)
-
-    response = _get_request(base_url, params=params, timeout=20, session=session) # Longer timeout for arXiv
 
+def _parse_arxiv_response(title, response):
+    """Extracts an arXiv DOI from an arXiv API Atom response after checking the title."""
     if response:
         if response.status_code == 200:
             try:
@@ -225,34 +280,188 @@ def _get_doi_arxiv(title, session=None):
     return None
 
 
+def _get_doi_arxiv(title, session=None):
+    """Fetches DOI (arXiv format) from arXiv API using session."""
+    logging.debug(f"Querying arXiv for title: {title[:60]}...")
+    base_url, params, timeout = _arxiv_request(title)
+    # arXiv's one-request-per-3-seconds policy is enforced process-wide by the rate limiter in _get_request
+    response = _get_request(base_url, params=params, timeout=timeout, session=session)
+    return _parse_arxiv_response(title, response)
+
+
+# Resolvers in the order get_doi tries them: (name, request builder, response parser)
+DOI_RESOLVERS = [
+    ("arxiv", _arxiv_request, _parse_arxiv_response),
+    ("crossref", _crossref_request, _parse_crossref_response),
+    ("openalex", _openalex_request, _parse_openalex_response),
+    ("semantic_scholar", _semantic_scholar_request, _parse_semantic_scholar_response),
+]
+
+
+# Race mode ranking, highest first; launch order for hedging and tie-break order for the "priority" policy.
+# Override with DOI_RESOLVER_PRIORITY="crossref,openalex,semantic_scholar,arxiv".
+DOI_RESOLVER_PRIORITY = [
+    name.strip() for name in os.environ.get(
+        "DOI_RESOLVER_PRIORITY", "crossref,openalex,semantic_scholar,arxiv").split(',')
+    if name.strip() in {resolver[0] for resolver in DOI_RESOLVERS}
+]
+
+
+# --- Racing Resolution ---
+# Racing resolvers run on their own threads and sessions so they never share a connection
+# with each other or with the calling worker.
+_race_executor = ThreadPoolExecutor(max_workers=DOI_RACE_WORKERS, thread_name_prefix='DoiRace')
+_race_sessions = SessionPool(DOI_RACE_WORKERS, name="doi-race")
+
+
+def _ranked_resolvers():
+    resolvers = {name: (build_request, parse_response) for name, build_request, parse_response in DOI_RESOLVERS}
+    ranked = [name for name in DOI_RESOLVER_PRIORITY if name in resolvers]
+    ranked += [name for name in resolvers if name not in ranked]
+    return [(name,) + resolvers[name] for name in ranked]
+
+
+def _pick_race_winner(ranked_names, answers, policy, grace_expired):
+    """
+    Decides a race from the answers received so far ({resolver name: doi or None}).
+    Returns (decided, doi); decided is False while a better answer may still arrive.
+    """
+    if policy == "priority":
+        for name in ranked_names:
+            if name not in answers:
+                if not grace_expired:
+                    return False, None
+                continue  # Out of patience for this resolver: fall through to the next ranked answer
+            if answers[name]:
+                return True, answers[name]
+    else:
+        for doi in answers.values():  # Insertion order is arrival order
+            if doi:
+                return True, doi
+    return len(answers) == len(ranked_names), None
+
+
+def _run_resolver(build_request, parse_response, title, email, session=None, cancel_event=None):
+    """Runs one resolver. Returns (doi, definitive); definitive is None if the resolver was never asked."""
+    url, params, timeout = build_request(title, email)
+    response = _get_request(url, params=params, timeout=timeout, session=session, cancel_event=cancel_event)
+    if response is NOT_ASKED:
+        return None, None
+    return parse_response(title, response), _is_definitive(response)
+
+
+def _run_racing_resolver(build_request, parse_response, title, email, cancel_event):
+    if cancel_event.is_set():
+        return None, None
+    with _race_sessions.session() as session:
+        return _run_resolver(build_request, parse_response, title, email, session=session, cancel_event=cancel_event)
+
+
+def _get_doi_race(title, email=EMAIL, hedge_delay=DOI_HEDGE_DELAY, policy=DOI_RACE_POLICY):
+    """
+    Queries the resolvers concurrently, launching them hedge_delay seconds apart in priority order,
+    and returns (doi, winning resolver, definitive) as chosen by the race policy. Resolvers not yet
+    launched are never started and queued ones are cancelled once the race is decided.
+    A miss is definitive when every resolver that was asked answered definitively; resolvers that sat
+    the race out (see DOI_RACE_MAX_TOKEN_WAIT) do not count, but at least one must have been asked.
+    """
+    ranked = _ranked_resolvers()
+    ranked_names = [name for name, _, _ in ranked]
+    cancel_event = threading.Event()
+    pending = {}
+    answers = {}
+    all_definitive = True
+    asked = 0
+    start_time = time.monotonic()
+    first_answer_at = None
+    launched = 0
+    try:
+        while True:
+            now = time.monotonic()
+            # Launch every resolver whose hedge slot has come up; all at once when hedge_delay is 0
+            while launched < len(ranked) and now - start_time >= launched * hedge_delay:
+                name, build_request, parse_response = ranked[launched]
+                future = _race_executor.submit(_run_racing_resolver, build_request, parse_response, title, email, cancel_event)
+                pending[future] = name
+                launched += 1
+
+            grace_expired = first_answer_at is not None and now - first_answer_at >= DOI_RACE_GRACE
+            decided, doi = _pick_race_winner(ranked_names, answers, policy, grace_expired)
+            if decided:
+                if not doi:
+                    return None, None, all_definitive and asked > 0 and len(answers) == len(ranked_names)
+                winner = next(name for name, answer in answers.items() if answer == doi)
+                logging.debug(f"DOI race for '{title[:60]}...' won by {winner} in {now - start_time:.2f}s")
+                return doi, winner, True
+
+            # Sleep until a resolver finishes, the next hedge slot opens, or the grace period ends
+            timeouts = []
+            if launched < len(ranked):
+                timeouts.append(start_time + launched * hedge_delay - now)
+            if policy == "priority" and first_answer_at is not None:
+                timeouts.append(first_answer_at + DOI_RACE_GRACE - now)
+            if not pending and not timeouts:
+                return None, None, False
+            done, _ = wait(list(pending), timeout=max(min(timeouts), 0) if timeouts else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    answers[name], definitive = future.result()
+                except Exception as e:
+                    logging.error(f"DOI resolver {name} failed for '{title[:60]}...': {e}")
+                    answers[name], definitive = None, False
+                if definitive is not None:  # None: sat the race out without sending a request
+                    asked += 1
+                    all_definitive = all_definitive and definitive
+                if answers[name] and first_answer_at is None:
+                    first_answer_at = time.monotonic()
+    finally:
+        # Losers still waiting on a rate-limit token return it and skip their request; queued ones never start
+        cancel_event.set()
+        for future in pending:
+            future.cancel()
+
+
 # --- Main Combined Function (Modified for Session) ---
-def get_doi(title, email=EMAIL, session=None):
+def resolve_doi(title, email=EMAIL, session=None, mode=None):
     """
-    Tries to find the DOI for a paper title by querying APIs in order, using session.
+    Finds the DOI for a paper title. Returns (doi, resolver name, definitive): definitive is
+    False when the DOI was not found but some resolver failed to answer, so the miss may be transient.
+    mode="race" (or DOI_RESOLUTION_MODE=race) queries the resolvers concurrently instead of in order;
+    racing resolvers use their own pooled sessions rather than the one passed in.
     """
     if not title:
         logging.warning("get_doi called with empty title.")
-        return None
+        return None, None, True
 
+    if (mode or DOI_RESOLUTION_MODE) == "race":
+        logging.debug(f"--- Racing DOI resolvers for title: {title[:60]}... ---")
+        doi, resolver, definitive = _get_doi_race(title, email)
+        if not doi:
+            logging.info(f"--- DOI search failed for title: {title[:60]}... ---")
+        return doi, resolver, definitive
 
     logging.debug(f"--- Starting DOI search for title: {title[:60]}... ---")
 
     # Try APIs sequentially, passing the session down
     # Order: arXiv first (specific format), then general ones
-    doi = _get_doi_arxiv(title, session=session)
-    if doi: return doi
-
-    doi = _get_doi_crossref(title, email, session=session)
-    if doi: return doi
+    all_definitive = True
+    for name, build_request, parse_response in DOI_RESOLVERS:
+        doi, definitive = _run_resolver(build_request, parse_response, title, email, session=session)
+        if doi:
+            return doi, name, True
+        all_definitive = all_definitive and definitive
 
-    doi = _get_doi_openalex(title, email, session=session)
-    if doi: return doi
+    logging.info(f"--- DOI search failed for title: {title[:60]}... ---")
+    return None, None, all_definitive
 
-    doi = _get_doi_semantic_scholar(title, session=session)
-    if doi: return doi
 
-    logging.info(f"--- DOI search failed for title: {title[:60]}... ---")
-    return None
+def get_doi(title, email=EMAIL, session=None, mode=None):
+    """
+    Tries to find the DOI for a paper title by querying APIs in order, using session.
+    See resolve_doi for mode.
+    """
+    return resolve_doi(title, email=email, session=session, mode=mode)[0]
 
 # Example Usage (can be removed)
 # if __name__ == "__main__":
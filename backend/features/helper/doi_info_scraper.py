@@ -2,6 +2,9 @@
 import requests
 import re
 import logging
+from .rate_limiter import throttle
+from .circuit_breaker import circuit_open
+from .upstream_urls import base_url
 
 # --- Configure Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -10,6 +13,10 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def _get_request(url, params=None, headers=None, timeout=15, session=None):
     """Helper to perform GET request using session or default requests."""
     requester = session if session else requests # Use passed session or default requests
+    if circuit_open(url):
+        logging.debug(f"Skipping {url}: upstream circuit breaker is open")
+        return None
+    throttle(url) # Wait for doi.org request budget shared across all threads
     try:
         response = requester.get(url, params=params, headers=headers, timeout=timeout)
         # Allow callers to handle status codes specifically
@@ -21,17 +28,17 @@ def _get_request(url, params=None, headers=None, timeout=15, session=None):
     return None
 
 # --- BibTeX Fetching ---
-def fetch_bibtex(doi, session=None):
-    """Fetch BibTeX entry for a given DOI using DOI.org API, using provided session."""
-    if not doi:
-        return "Error: DOI is empty."
-    url = f"https://doi.org/{doi}"
-    headers = {"Accept": "application/x-bibtex"}
-    logging.debug(f"Fetching BibTeX for DOI: {doi} from {url}")
+def _bibtex_request(doi):
+    """Returns (url, headers) for a DOI content-negotiation BibTeX request."""
+    return f"{base_url('doi')}/{doi}", {"Accept": "application/x-bibtex"}
 
-    response = _get_request(url, headers=headers, session=session)
 
-    if response:
+BIBTEX_NOT_FOUND = "Not Found (404)"  # Ends the error string for DOIs doi.org does not know
+
+
+def _parse_bibtex_response(doi, response):
+    """Decodes a doi.org BibTeX response, returning the entry or an 'Error ...' string."""
+    if response is not None:  # A requests Response is falsy for 4xx, which would hide the 404 case
         if response.status_code == 200:
             logging.debug(f"Successfully fetched BibTeX for DOI: {doi}")
             # Decode response text, trying utf-8 first, then latin-1 as fallback
@@ -46,7 +53,7 @@ def fetch_bibtex(doi, session=None):
                     return f"Error fetching DOI {doi}: Could not decode response content"
         elif response.status_code == 404:
             logging.warning(f"BibTeX not found (404) for DOI: {doi}")
-            return f"Error fetching DOI {doi}: Not Found (404)"
+            return f"Error fetching DOI {doi}: {BIBTEX_NOT_FOUND}"
         else:
             logging.error(f"Error fetching BibTeX for DOI {doi}: Status {response.status_code}")
             return f"Error fetching DOI {doi}: Status {response.status_code}"
@@ -54,6 +61,17 @@ def fetch_bibtex(doi, session=None):
         # Error logged by _get_request
         return f"Error fetching DOI {doi}: Request failed (see logs)"
 
+
+def fetch_bibtex(doi, session=None):
+    """Fetch BibTeX entry for a given DOI using DOI.org API, using provided session."""
+    if not doi:
+        return "Error: DOI is empty."
+    url, headers = _bibtex_request(doi)
+    logging.debug(f"Fetching BibTeX for DOI: {doi} from {url}")
+
+    response = _get_request(url, headers=headers, session=session)
+    return _parse_bibtex_response(doi, response)
+
 # --- BibTeX Parsing and Formatting ---
 def clean_pages_field(bibtex_entry):
     """Fix common encoding issues in BibTeX fields, especially pages."""
@@ -0,0 +1,43 @@
+# helper/eutils.py
+# Shared transport for NCBI E-utilities (PubMed search/fetch and PMC full texts).
+import os
+import requests
+from .extract_secrets import get_pubmed_api_key
+from .rate_limiter import throttle
+from .http_session import create_session_with_retries
+from .upstream_urls import base_url
+
+# --- Constants and Configuration ---
+PUBMED_API_KEY = get_pubmed_api_key()
+EUTILS_REQUEST_TIMEOUT = 60
+EUTILS_POOL_SIZE = int(os.environ.get("PUBMED_EFETCH_WORKERS", 4))  # One keep-alive connection per EFetch worker
+
+# Pooled, retrying session for E-utilities: goes through the NCBI circuit breaker, the shared retry budget
+# and (when enabled) the response recorder
+eutils_session = create_session_with_retries(pool_maxsize=EUTILS_POOL_SIZE)
+
+
+def eutils_url(tool):
+    """URL of an E-utility, e.g. eutils_url('efetch')."""
+    return f'{base_url("ncbi")}/entrez/eutils/{tool}.fcgi'
+
+
+def eutils_params(**params):
+    """Request params with the API key added when one is configured."""
+    if PUBMED_API_KEY:
+        params['api_key'] = PUBMED_API_KEY
+    return params
+
+
+def get_eutils(url, params=None, stream=False):
+    """GET against NCBI E-utilities under the shared rate limit and the NCBI circuit breaker.
+    Raises requests exceptions (CircuitOpenError while the breaker is open) and HTTPError for bad statuses.
+    """
+    throttle(url)  # Stay under the NCBI E-utilities rate limit
+    response = eutils_session.get(url, params=params, timeout=EUTILS_REQUEST_TIMEOUT, stream=stream)
+    try:
+        response.raise_for_status()  # Raise exception for HTTP errors
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
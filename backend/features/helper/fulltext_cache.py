@@ -0,0 +1,166 @@
+# helper/fulltext_cache.py
+# Persistent full-text store shared by both search paths. Texts are stored once per content hash
+# (content-addressed), compressed with zstd when the zstandard package is installed (zlib otherwise),
+# and reached through identifier keys: DOI, PubMed ID and CORE id. Each identifier records where and
+# when the text was fetched. The text store is capped in size and evicts the least recently used texts.
+#
+#   python -m features.helper.fulltext_cache stats
+#   python -m features.helper.fulltext_cache clear
+import os
+import sys
+import time
+import zlib
+import hashlib
+import logging
+import argparse
+import threading
+from .disk_cache import DiskCache
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib compresses full texts less well but needs nothing extra
+    zstandard = None
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+FULLTEXT_CACHE_ENABLED = os.environ.get("FULLTEXT_CACHE_ENABLED", "true").lower() == "true"
+FULLTEXT_CACHE_MAX_MB = int(os.environ.get("FULLTEXT_CACHE_MAX_MB", 2048))  # Cap on stored (compressed) text
+FULLTEXT_CACHE_TTL = int(os.environ.get("FULLTEXT_CACHE_TTL", 0))  # Seconds; 0 keeps texts until evicted
+# Plain HTTP pages may be landing or paywall pages rather than the article, so they are refetched after a while
+FULLTEXT_HTTP_TTL = int(os.environ.get("FULLTEXT_HTTP_TTL", 7 * 24 * 3600))
+FULLTEXT_ZSTD_LEVEL = int(os.environ.get("FULLTEXT_ZSTD_LEVEL", 10))
+FULLTEXT_INDEX_MAX_ENTRIES = 500000
+FULLTEXT_SOURCE_TTLS = {"http": FULLTEXT_HTTP_TTL}  # Sources trusted less than FULLTEXT_CACHE_TTL
+
+# Blobs carry a one-byte codec tag so a store written with zlib stays readable once zstd is installed
+_ZSTD_TAG, _ZLIB_TAG = b"S", b"Z"
+_local = threading.local()  # zstd (de)compressors are not thread-safe
+
+
+def _compress(data):
+    if zstandard is None:
+        return _ZLIB_TAG + zlib.compress(data, 6)
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        compressor = _local.compressor = zstandard.ZstdCompressor(level=FULLTEXT_ZSTD_LEVEL)
+    return _ZSTD_TAG + compressor.compress(data)
+
+
+def _decompress(blob):
+    tag, payload = bytes(blob[:1]), blob[1:]
+    if tag == _ZLIB_TAG:
+        return zlib.decompress(payload)
+    if tag == _ZSTD_TAG and zstandard is not None:
+        decompressor = getattr(_local, "decompressor", None)
+        if decompressor is None:
+            decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(payload)
+    raise ValueError(f"unsupported full-text codec {tag!r}")
+
+
+_text_store = DiskCache("fulltext_blobs", max_bytes=FULLTEXT_CACHE_MAX_MB * 1024 * 1024,
+                        compress=_compress, decompress=_decompress)
+_index_store = DiskCache("fulltext_index", max_entries=FULLTEXT_INDEX_MAX_ENTRIES)
+_metrics = {"hits": 0, "misses": 0, "stored": 0}
+_metrics_lock = threading.Lock()
+
+
+def _count(metric):
+    with _metrics_lock:
+        _metrics[metric] += 1
+
+
+def _source_ttl(source):
+    return FULLTEXT_SOURCE_TTLS.get(source, FULLTEXT_CACHE_TTL) or None
+
+
+def _identifier_keys(doi=None, pmid=None, core_id=None):
+    keys = []
+    if doi and str(doi).strip():
+        keys.append(f"doi:{str(doi).strip().lower()}")  # DOIs are case-insensitive
+    if pmid and str(pmid).strip():
+        keys.append(f"pmid:{str(pmid).strip()}")
+    if core_id not in (None, "", "N/A"):
+        keys.append(f"core:{core_id}")
+    return keys
+
+
+def lookup_full_text(doi=None, pmid=None, core_id=None):
+    """
+    Returns (text, info) for the first identifier with a stored full text, or None.
+    info holds the text's source, fetched_at (epoch seconds) and content hash.
+    """
+    keys = _identifier_keys(doi, pmid, core_id)
+    if not FULLTEXT_CACHE_ENABLED or not keys:
+        return None
+    for key in keys:
+        info = _index_store.get(key)
+        if not info:
+            continue
+        text = _text_store.get(info["hash"])
+        if text is None:
+            _index_store.delete(key)  # Text was evicted
+            continue
+        _count("hits")
+        # Make the text reachable under the caller's other identifiers too
+        for other_key in keys:
+            if other_key != key and _index_store.get(other_key) is None:
+                _index_store.set(other_key, info, ttl=_source_ttl(info.get("source")))
+        return text, info
+    _count("misses")
+    return None
+
+
+def remember_full_text(text, source, doi=None, pmid=None, core_id=None):
+    """
+    Stores a non-empty full text under every given identifier. source names where it came from (e.g. 'crawl4ai');
+    texts from sources in FULLTEXT_SOURCE_TTLS expire after that many seconds.
+    """
+    keys = _identifier_keys(doi, pmid, core_id)
+    if not FULLTEXT_CACHE_ENABLED or not keys or not text or not text.strip():
+        return
+    ttl = _source_ttl(source)
+    content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    if not _text_store.has(content_hash):
+        _text_store.set(content_hash, text, ttl=ttl)
+        _count("stored")
+    else:
+        _text_store.extend_ttl(content_hash, ttl)  # e.g. first stored by the http tier, now confirmed by pmc or crawl
+    info = {"hash": content_hash, "source": source, "fetched_at": time.time(), "chars": len(text)}
+    for key in keys:
+        existing = _index_store.get(key)
+        if existing is None or existing.get("hash") != content_hash:
+            _index_store.set(key, info, ttl=ttl)
+
+
+def fulltext_cache_stats():
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats.update({f"texts_{name}": value for name, value in _text_store.stats().items()})
+    stats["identifiers"] = _index_store.stats()["entries"]
+    stats["codec"] = "zstd" if zstandard is not None else "zlib"
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the full-text cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show stored texts, identifiers and size")
+    commands.add_parser("clear", help="Drop every stored full text")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        stats = fulltext_cache_stats()
+        print(f"{stats['texts_entries']} texts ({stats['texts_bytes'] / (1024 * 1024):.1f} MB, {stats['codec']}) "
+              f"under {stats['identifiers']} identifiers")
+    elif args.command == "clear":
+        _text_store.clear()
+        _index_store.clear()
+        print("Full-text cache cleared.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# helper/http_recorder.py
+# Record mode: with HTTP_RECORD_DIR set, every upstream response seen by the shared sessions
+# (create_session_with_retries), the async enrichment engine and the E-utilities helper is appended
+# to a fixture archive in that directory, one gzipped JSON-lines file per upstream.
+# features/upstream_standin.py replays these archives.
+import os
+import gzip
+import json
+import time
+import base64
+import logging
+import threading
+from urllib.parse import parse_qsl, urlencode
+from .upstream_urls import route_for_url
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+HTTP_RECORD_DIR = os.environ.get("HTTP_RECORD_DIR", "")
+# Credentials and contact details are dropped from recorded URLs and from fixture keys
+VOLATILE_PARAMS = frozenset(["api_key", "mailto", "email", "tool"])
+RECORDED_HEADERS = ("Content-Type", "Retry-After", "Location")
+FIXTURE_SUFFIX = ".jsonl.gz"
+
+_write_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Sorts query parameters and drops VOLATILE_PARAMS, so equivalent requests share a fixture."""
+    params = [(name, value) for name, value in parse_qsl(query, keep_blank_values=True) if name not in VOLATILE_PARAMS]
+    return urlencode(sorted(params))
+
+
+def fixture_key(method, path, query):
+    normalized = normalize_query(query)
+    return f"{method.upper()} {path}{'?' + normalized if normalized else ''}"
+
+
+def fixture_file(directory, scope):
+    return os.path.join(directory, scope.replace('/', '_') + FIXTURE_SUFFIX)
+
+
+def recording_enabled():
+    return bool(HTTP_RECORD_DIR)
+
+
+def record_response(method, url, status_code, headers, content, elapsed):
+    """Appends one response to the fixture archive of its upstream. No-op unless HTTP_RECORD_DIR is set."""
+    if not HTTP_RECORD_DIR:
+        return
+    scope, path, query = route_for_url(url)
+    fixture = {
+        "scope": scope,
+        "key": fixture_key(method, path, query),
+        "status": status_code,
+        "headers": {name: headers[name] for name in RECORDED_HEADERS if headers.get(name) is not None},
+        "body": base64.b64encode(content or b"").decode('ascii'),
+        "elapsed": round(elapsed, 4),
+        "recorded_at": time.time(),
+    }
+    try:
+        with _write_lock:
+            os.makedirs(HTTP_RECORD_DIR, exist_ok=True)
+            # Appending gzip members keeps each write independent; readers see one stream
+            with gzip.open(fixture_file(HTTP_RECORD_DIR, scope), 'at', encoding='utf-8') as f:
+                f.write(json.dumps(fixture) + "\n")
+    except OSError as e:
+        logging.warning(f"Failed to record response for {scope} {fixture['key']}: {e}")
+
+
+def record_requests_response(response):
+    """record_response for a requests.Response (reads its body, so do not pass streamed responses)."""
+    if not HTTP_RECORD_DIR or response is None:
+        return
+    elapsed = response.elapsed.total_seconds() if response.elapsed is not None else 0.0
+    record_response(response.request.method, response.url, response.status_code, response.headers,
+                    response.content, elapsed)
+
+
+def load_fixtures(directory):
+    """
+    Loads every fixture archive in directory into {(scope, key): [fixture, ...]} in recording order.
+    Fixtures whose body was recorded as base64 are returned with the decoded bytes under 'content'.
+    """
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(FIXTURE_SUFFIX):
+            continue
+        with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    fixture = json.loads(line)
+                    fixture["content"] = base64.b64decode(fixture.pop("body", ""))
+                except (ValueError, TypeError):
+                    logging.warning(f"Skipping unreadable fixture {name}:{line_number}")
+                    continue
+                fixtures.setdefault((fixture["scope"], fixture["key"]), []).append(fixture)
+    return fixtures
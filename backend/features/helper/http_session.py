@@ -0,0 +1,163 @@
+# helper/http_session.py
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import MaxRetryError, ResponseError
+from .extract_secrets import get_secrets
+from .circuit_breaker import before_request, record_outcome, breaker_for_url, retry_budget
+from .http_recorder import recording_enabled, record_requests_response
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+EMAIL = get_secrets("email")
+
+
+# --- Circuit Breaker and Retry Budget Integration ---
+class BudgetedRetry(Retry):
+    """Retry that also stops early when the process-wide retry budget is spent or the upstream's breaker opened."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method=method, url=url, response=response, error=error,
+                                      _pool=_pool, _stacktrace=_stacktrace)
+        origin = f"{getattr(_pool, 'scheme', 'https')}://{_pool.host}" if getattr(_pool, 'host', None) else None
+        breaker = breaker_for_url(origin) if origin else None
+        if breaker is not None and breaker.is_open():
+            raise MaxRetryError(_pool, url, error or ResponseError(f"circuit breaker '{breaker.name}' opened"))
+        if not retry_budget.try_spend():
+            logging.debug(f"Retry budget exhausted; not retrying {origin}{url}")
+            raise MaxRetryError(_pool, url, error or ResponseError("retry budget exhausted"))
+        return new_retry
+
+
+class BreakerAdapter(HTTPAdapter):
+    """HTTPAdapter that refuses requests to upstreams with an open breaker and reports each final outcome."""
+
+    def send(self, request, **kwargs):
+        before_request(request.url)  # Raises CircuitOpenError (a ConnectionError) while the breaker is open
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            record_outcome(request.url, error=e)
+            raise
+        record_outcome(request.url, response=response)
+        if recording_enabled() and not kwargs.get('stream'):
+            record_requests_response(response)  # Each redirect hop is recorded under its own URL
+        return response
+
+
+# --- Session with Retries (moved from search.py so helpers can share it) ---
+# OPTIMIZATION: Use a Session object for connection pooling and add retries
+def create_session_with_retries(
+    retries=5,  # Increased from 3 to 5
+    backoff_factor=1.0,  # Increased from 0.5 to 1.0 for longer delays
+    status_forcelist=(500, 502, 503, 504, 429), # Retry on these server errors and rate limits
+    session=None,
+    pool_connections=10,  # Number of distinct hosts to keep connection pools for
+    pool_maxsize=10,  # Max keep-alive connections per host
+):
+    """Creates a requests Session with robust retry logic.
+    Retries draw on the shared retry budget and every request passes its upstream's circuit breaker.
+    """
+    session = session or requests.Session()
+    retry = BudgetedRetry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        # Respect Retry-After header if present (important for rate limits like 429)
+        respect_retry_after_header=True,
+        allowed_methods=frozenset(['HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'TRACE']) # Methods to retry on
+    )
+    adapter = BreakerAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Add common headers like User-Agent globally to the session
+    session.headers.update({'User-Agent': f'ResearchFetcher/1.1 (mailto:{EMAIL})'})
+    return session
+
+
+def connection_stats(session):
+    """Returns connection-reuse counters summed over the urllib3 pools of a session."""
+    stats = {"connections_opened": 0, "requests": 0}
+    for adapter in set(session.adapters.values()):
+        pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["connections_opened"] += getattr(pool, 'num_connections', 0)
+            stats["requests"] += getattr(pool, 'num_requests', 0)
+    stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+    return stats
+
+
+# --- Bounded Session Pool ---
+class SessionPool:
+    """
+    A bounded pool of retrying sessions shared by worker threads.
+    Each worker borrows one session for the duration of a task, so keep-alive connections
+    to Crossref, OpenAlex, Semantic Scholar, arXiv and doi.org survive across items (and
+    across searches) instead of being rebuilt for every work item. With one session per
+    worker and one connection per host per session, each host sees at most `size` connections.
+    """
+
+    def __init__(self, size, pool_connections=10, pool_maxsize=1, name="sessions"):
+        self.size = size
+        self.name = name
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest session in use
+        self._all_sessions = []
+        self._lock = threading.Lock()
+        self._borrows = 0
+
+    def _create_session(self):
+        return create_session_with_retries(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize)
+
+    def acquire(self):
+        """Borrows a session, creating one if the pool is not yet full, otherwise waiting for one."""
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = None
+            with self._lock:
+                if len(self._all_sessions) < self.size:
+                    session = self._create_session()
+                    self._all_sessions.append(session)
+            if session is None:
+                session = self._idle.get()
+        with self._lock:
+            self._borrows += 1
+        return session
+
+    def release(self, session):
+        self._idle.put(session)
+
+    @contextmanager
+    def session(self):
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def stats(self):
+        """Returns pool size plus connection-reuse counters summed over all pooled sessions since the pool was created."""
+        with self._lock:
+            sessions = list(self._all_sessions)
+            stats = {"sessions": len(sessions), "borrows": self._borrows}
+        totals = {"connections_opened": 0, "requests": 0, "connections_reused": 0}
+        for session in sessions:
+            for key, value in connection_stats(session).items():
+                totals[key] += value
+        stats.update(totals)
+        return stats
@@ -1,11 +1,12 @@
 # helper/keywords_scraper.py
 import requests
-import json
-import time
 import logging
 import urllib.parse
 from typing import List, Optional, Dict, Any # For type hinting
 from .extract_secrets import get_secrets
+from .rate_limiter import throttle
+from .circuit_breaker import circuit_open
+from .upstream_urls import base_url
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,44 +15,66 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 EMAIL = get_secrets("email") # Fetch email using the helper
 
 # --- Generic JSON Fetch Helper with Session Support ---
-def _fetch_json(url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, timeout: int = 15, session=None) -> Optional[Dict[str, Any]]:
-    """Generic function to fetch JSON data with error handling, using session if provided."""
+def _get_response(url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, timeout: int = 15, session=None):
+    """Performs the GET with error handling, using session if provided. Returns the response or None."""
     requester = session if session else requests # Use passed session or default requests
+    if circuit_open(url):
+        logging.debug(f"Skipping {url}: upstream circuit breaker is open")
+        return None
+    throttle(url) # Wait for this upstream's request budget shared across all threads
     try:
-        response = requester.get(url, params=params, headers=headers, timeout=timeout)
-        response.raise_for_status() # Raise exception for bad status codes (4xx or 5xx)
-        # Check content type before decoding
-        if 'application/json' in response.headers.get('Content-Type', ''):
-            return response.json()
-        else:
-            logging.warning(f"Non-JSON response received from {url}. Content-Type: {response.headers.get('Content-Type')}")
-            return None # Or handle non-JSON appropriately
+        return requester.get(url, params=params, headers=headers, timeout=timeout)
     except requests.exceptions.Timeout:
         logging.warning(f"Request timed out: {url}")
-    except requests.exceptions.HTTPError as e:
-        # Log non-404 errors as warnings, 404 usually just means "not found"
-        if e.response.status_code != 404:
-            logging.warning(f"HTTP Error: {e.response.status_code} accessing {url}")
-        else:
-            logging.info(f"Resource not found (404): {url}")
     except requests.exceptions.RequestException as e:
         logging.error(f"Request Exception: {e}")
-    except json.JSONDecodeError:
-        logging.error(f"JSON Decode Error for response from {url}")
     except Exception as e:
         logging.error(f"An unexpected error occurred fetching {url}: {e}")
     return None
 
+
+def _fetch_json(url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, timeout: int = 15, session=None) -> Optional[Dict[str, Any]]:
+    """Generic function to fetch JSON data with error handling, using session if provided."""
+    response = _get_response(url, params=params, headers=headers, timeout=timeout, session=session)
+    return _json_from_response(url, response) if response is not None else None
+
+
+def _is_definitive(response) -> bool:
+    """False when a source could not give an answer at all (no response, 5xx or 429), so a miss may not be final."""
+    return response is not None and response.status_code < 500 and response.status_code != 429
+
+
+def _json_from_response(url: str, response) -> Optional[Dict[str, Any]]:
+    """Decodes a JSON API response, logging bad statuses and non-JSON bodies. Shared with the async engine."""
+    if response.status_code >= 400:
+        # Log non-404 errors as warnings, 404 usually just means "not found"
+        if response.status_code != 404:
+            logging.warning(f"HTTP Error: {response.status_code} accessing {url}")
+        else:
+            logging.info(f"Resource not found (404): {url}")
+        return None
+    # Check content type before decoding
+    if 'application/json' in response.headers.get('Content-Type', ''):
+        try:
+            return response.json()
+        except ValueError: # json.JSONDecodeError is a ValueError subclass
+            logging.error(f"JSON Decode Error for response from {url}")
+            return None
+    logging.warning(f"Non-JSON response received from {url}. Content-Type: {response.headers.get('Content-Type')}")
+    return None # Or handle non-JSON appropriately
+
 # --- Keyword Extraction Functions (Modified for Session) ---
 
-def _get_keywords_openalex(doi: str, email: str, session=None) -> Optional[List[str]]:
-    """Fetches keywords and concepts from OpenAlex using DOI and session."""
-    logging.debug(f"Querying OpenAlex for keywords (DOI: {doi})")
+# Each source is split into a request builder (returns url, params) and a parser of the decoded
+# JSON, so the threaded helpers below and the asyncio engine share the exact same logic.
+
+def _openalex_keywords_request(doi: str, email: str):
     encoded_doi = urllib.parse.quote(doi)
-    url = f"https://api.openalex.org/works/doi:{encoded_doi}"
-    params = {'mailto': email}
+    return f"{base_url('openalex')}/works/doi:{encoded_doi}", {'mailto': email}
 
-    data = _fetch_json(url, params=params, session=session) # Pass session
+
+def _parse_openalex_keywords(data: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Extracts author keywords plus the top concepts from an OpenAlex work."""
     if not data:
         return None
 
@@ -81,20 +104,21 @@ def _get_keywords_openalex(doi: str, email: str, session=None) -> Optional[List[
         return None
 
 
-def _get_keywords_semantic_scholar(doi: str, session=None) -> Optional[List[str]]:
-    """Fetches topics (keywords) from Semantic Scholar using DOI and session."""
-    logging.debug(f"Querying Semantic Scholar for topics (DOI: {doi})")
-    encoded_doi = urllib.parse.quote(doi)
-    url = f"https://api.semanticscholar.org/graph/v1/paper/DOI:{encoded_doi}"
-    params = {'fields': 'topics'}
+def _get_keywords_openalex(doi: str, email: str, session=None) -> Optional[List[str]]:
+    """Fetches keywords and concepts from OpenAlex using DOI and session."""
+    logging.debug(f"Querying OpenAlex for keywords (DOI: {doi})")
+    url, params = _openalex_keywords_request(doi, email)
+    data = _fetch_json(url, params=params, session=session) # Pass session
+    return _parse_openalex_keywords(data)
 
-    # Pre-emptive sleep *might* still be useful for S2, even with session retries
-    # Keep it short as retry handles actual 429s.
-    time.sleep(0.3)
 
-    # Use _fetch_json which now uses the session and its retry logic
-    data = _fetch_json(url, params=params, session=session) # Pass session
+def _semantic_scholar_keywords_request(doi: str, email: str = None):
+    encoded_doi = urllib.parse.quote(doi)
+    return f"{base_url('semantic_scholar')}/graph/v1/paper/DOI:{encoded_doi}", {'fields': 'topics'}
 
+
+def _parse_semantic_scholar_keywords(data: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Extracts topics from a Semantic Scholar paper record."""
     if data and isinstance(data.get('topics'), list):
         keywords_found = [topic['topic'] for topic in data['topics'] if isinstance(topic.get('topic'), str)]
         unique_keywords = sorted(list(set(kw.strip() for kw in keywords_found if kw and kw.strip())))
@@ -106,15 +130,24 @@ def _get_keywords_semantic_scholar(doi: str, session=None) -> Optional[List[str]
     return None
 
 
-def _get_keywords_crossref(doi: str, email: str, session=None) -> Optional[List[str]]:
-    """Fetches 'subject' field from Crossref using DOI and session."""
-    logging.debug(f"Querying Crossref for subjects (DOI: {doi})")
+def _get_keywords_semantic_scholar(doi: str, session=None) -> Optional[List[str]]:
+    """Fetches topics (keywords) from Semantic Scholar using DOI and session."""
+    logging.debug(f"Querying Semantic Scholar for topics (DOI: {doi})")
+    url, params = _semantic_scholar_keywords_request(doi)
+    # S2 politeness is enforced process-wide by the rate limiter in _fetch_json
+    # Use _fetch_json which now uses the session and its retry logic
+    data = _fetch_json(url, params=params, session=session) # Pass session
+    return _parse_semantic_scholar_keywords(data)
+
+
+def _crossref_keywords_request(doi: str, email: str):
     encoded_doi = urllib.parse.quote(doi)
-    url = f"https://api.crossref.org/works/{encoded_doi}"
-    params = {'mailto': email}
     # Headers managed by the session now (assuming User-Agent is set there)
+    return f"{base_url('crossref')}/works/{encoded_doi}", {'mailto': email}
 
-    data = _fetch_json(url, params=params, session=session) # Pass session
+
+def _parse_crossref_keywords(data: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Extracts the 'subject' list from a Crossref work record."""
     if not data or data.get('status') != 'ok':
         return None
 
@@ -131,38 +164,54 @@ def _get_keywords_crossref(doi: str, email: str, session=None) -> Optional[List[
     return None
 
 
+def _get_keywords_crossref(doi: str, email: str, session=None) -> Optional[List[str]]:
+    """Fetches 'subject' field from Crossref using DOI and session."""
+    logging.debug(f"Querying Crossref for subjects (DOI: {doi})")
+    url, params = _crossref_keywords_request(doi, email)
+    data = _fetch_json(url, params=params, session=session) # Pass session
+    return _parse_crossref_keywords(data)
+
+
+# Sources in the order get_keywords_for_doi tries them: (name, request builder, parser)
+KEYWORD_SOURCES = [
+    ("openalex", _openalex_keywords_request, _parse_openalex_keywords),
+    ("semantic_scholar", _semantic_scholar_keywords_request, _parse_semantic_scholar_keywords),
+    ("crossref", _crossref_keywords_request, _parse_crossref_keywords),
+]
+
+
 # --- Main Keyword Fetching Function (Modified for Session) ---
-def get_keywords_for_doi(doi: str, email: str = EMAIL, session=None) -> Optional[List[str]]:
+def find_keywords(doi: str, email: str = EMAIL, session=None):
     """
-    Tries to find keywords for a paper using its DOI by querying APIs, using session.
+    Tries the keyword sources in order. Returns (keywords, source name, definitive): definitive is
+    False when nothing was found but some source failed to answer, so the miss may be transient.
     """
     if not doi:
         logging.warning("Input DOI is empty for keyword search.")
-        return None
+        return None, None, True
 
     logging.debug(f"--- Starting Keyword search for DOI: {doi} ---")
 
-    # Try APIs sequentially, passing the session down
-    # 1. Try OpenAlex
-    keywords = _get_keywords_openalex(doi, email, session=session)
-    if keywords:
-        logging.info(f"Keywords found via OpenAlex for DOI: {doi}")
-        return keywords
-
-    # 2. Try Semantic Scholar
-    keywords = _get_keywords_semantic_scholar(doi, session=session)
-    if keywords:
-        logging.info(f"Keywords found via Semantic Scholar for DOI: {doi}")
-        return keywords
-
-    # 3. Try Crossref
-    keywords = _get_keywords_crossref(doi, email, session=session)
-    if keywords:
-        logging.info(f"Keywords found via Crossref for DOI: {doi}")
-        return keywords
+    # Try APIs sequentially (OpenAlex, Semantic Scholar, Crossref), passing the session down
+    all_definitive = True
+    for name, build_request, parse_data in KEYWORD_SOURCES:
+        url, params = build_request(doi, email)
+        response = _get_response(url, params=params, session=session)
+        keywords = parse_data(_json_from_response(url, response) if response is not None else None)
+        if keywords:
+            logging.info(f"Keywords found via {name} for DOI: {doi}")
+            return keywords, name, True
+        all_definitive = all_definitive and _is_definitive(response)
 
     logging.info(f"--- Keyword search complete for DOI: {doi}. Not found. ---")
-    return None
+    return None, None, all_definitive
+
+
+def get_keywords_for_doi(doi: str, email: str = EMAIL, session=None) -> Optional[List[str]]:
+    """
+    Tries to find keywords for a paper using its DOI by querying APIs, using session.
+    """
+    return find_keywords(doi, email=email, session=session)[0]
 
 # Example Usage (can be removed)
 # if __name__ == "__main__":
@@ -0,0 +1,203 @@
+# helper/metadata_cache.py
+# DOI-keyed cache of enrichment metadata: raw BibTeX, the reference and keywords parsed from it,
+# and the keyword list from the keyword APIs together with the source that supplied it.
+#
+# Invalidate from the backend folder with:
+#   python -m features.helper.metadata_cache stats
+#   python -m features.helper.metadata_cache invalidate 10.1000/xyz123 [more DOIs...]
+#   python -m features.helper.metadata_cache clear
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from cachetools import TTLCache
+from .disk_cache import DiskCache
+from .doi_info_scraper import fetch_bibtex, bibtex_to_formatted_text, BIBTEX_NOT_FOUND
+from .keywords_scraper import EMAIL, find_keywords
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+METADATA_CACHE_TTL = int(os.environ.get("METADATA_CACHE_TTL", 180 * 24 * 60 * 60))  # Seconds; 0 disables the cache
+# DOIs no keyword API knows are re-checked after this long
+METADATA_NEGATIVE_TTL = int(os.environ.get("METADATA_NEGATIVE_TTL", 7 * 24 * 60 * 60))
+# DOIs doi.org answered 404 for are not asked for their BibTeX again for this long
+METADATA_BIBTEX_NEGATIVE_TTL = int(os.environ.get("METADATA_BIBTEX_NEGATIVE_TTL", 24 * 60 * 60))
+METADATA_CACHE_MAX_MB = int(os.environ.get("METADATA_CACHE_MAX_MB", 256))
+METADATA_LRU_SIZE = int(os.environ.get("METADATA_LRU_SIZE", 5000))  # Records kept in memory in front of the disk store
+# Seconds a record stays in memory before it is re-read from disk, so invalidations made by the CLI
+# (a separate process) reach a running server within this time
+METADATA_MEMORY_TTL = int(os.environ.get("METADATA_MEMORY_TTL", 300))
+
+_metadata_store = DiskCache("doi_metadata", max_bytes=METADATA_CACHE_MAX_MB * 1024 * 1024)
+_recent_records = TTLCache(maxsize=METADATA_LRU_SIZE, ttl=max(METADATA_MEMORY_TTL, 1))
+_cache_lock = threading.Lock()
+_metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bibtex_fetches": 0, "keyword_fetches": 0}
+
+
+def _doi_key(doi):
+    # DOIs are case-insensitive
+    return (doi or '').strip().lower()
+
+
+def _count(metric):
+    with _cache_lock:
+        _metrics[metric] += 1
+
+
+def _load_record(doi):
+    """Returns the stored record for a DOI (memory first, then disk), or an empty dict."""
+    key = _doi_key(doi)
+    if METADATA_CACHE_TTL <= 0 or not key:
+        return {}
+    with _cache_lock:
+        record = _recent_records.get(key)
+        if record is not None:
+            _metrics["memory_hits"] += 1
+            return record
+    record = _metadata_store.get(key)
+    with _cache_lock:
+        if record is None:
+            _metrics["misses"] += 1
+            return {}
+        _metrics["disk_hits"] += 1
+        _recent_records[key] = record
+    return record
+
+
+def _update_record(doi, **fields):
+    """Merges fields into the DOI's record in memory and on disk."""
+    key = _doi_key(doi)
+    if METADATA_CACHE_TTL <= 0 or not key:
+        return
+    with _cache_lock:
+        record = dict(_recent_records.get(key) or _metadata_store.get(key) or {})
+        record.update(fields)
+        _recent_records[key] = record
+    try:
+        _metadata_store.set(key, record, ttl=METADATA_CACHE_TTL)
+    except Exception as e:
+        logging.warning(f"Failed to cache metadata for DOI {doi}: {e}")
+
+
+# --- BibTeX ---
+def lookup_bibtex(doi):
+    """
+    Returns (bibtex, (reference, bibtex_keywords)) if the DOI's BibTeX is cached, else None.
+    A recent 404 from doi.org comes back as its 'Error ...' string with None in place of the parsed entry.
+    """
+    record = _load_record(doi)
+    if not record.get("bibtex"):
+        missing_at = record.get("bibtex_missing_at")
+        if missing_at is not None and time.time() - missing_at <= METADATA_BIBTEX_NEGATIVE_TTL:
+            return f"Error fetching DOI {doi}: {BIBTEX_NOT_FOUND}", None
+        return None
+    return record["bibtex"], (record.get("reference", ""), record.get("bibtex_keywords", []))
+
+
+def remember_bibtex(doi, bibtex):
+    """Parses and caches a fetched BibTeX entry. Returns (reference, bibtex_keywords), or None for fetch errors."""
+    if bibtex and bibtex.startswith("Error") and bibtex.endswith(BIBTEX_NOT_FOUND):
+        _update_record(doi, bibtex_missing_at=time.time())  # Definitive: skip the DOI for a while
+        return None
+    if not bibtex or bibtex.startswith("Error"):
+        return None  # Other failed fetches are not cached so the next search tries again
+    reference, bibtex_keywords = bibtex_to_formatted_text(bibtex)
+    _update_record(doi, bibtex=bibtex, reference=reference,
+                   bibtex_keywords=bibtex_keywords or [], bibtex_fetched_at=time.time())
+    return reference, bibtex_keywords
+
+
+def fetch_bibtex_cached(doi, session=None):
+    """fetch_bibtex through the cache. Returns (bibtex or 'Error ...' string, parsed (reference, keywords) or None)."""
+    cached = lookup_bibtex(doi)
+    if cached is not None:
+        return cached
+    _count("bibtex_fetches")
+    bibtex = fetch_bibtex(doi, session=session)
+    return bibtex, remember_bibtex(doi, bibtex)
+
+
+# --- Keywords ---
+def lookup_keywords(doi):
+    """
+    Returns (keywords, source) if the keyword lookup for the DOI is cached, else None.
+    A recent "no keywords anywhere" answer comes back as ([], None).
+    """
+    record = _load_record(doi)
+    checked_at = record.get("keywords_fetched_at")
+    if checked_at is None:
+        return None
+    keywords = record.get("keywords") or []
+    if not keywords and time.time() - checked_at > METADATA_NEGATIVE_TTL:
+        return None
+    return keywords, record.get("keywords_source")
+
+
+def remember_keywords(doi, keywords, source=None):
+    _update_record(doi, keywords=keywords or [], keywords_source=source, keywords_fetched_at=time.time())
+
+
+def get_keywords_cached(doi, email=EMAIL, session=None):
+    """get_keywords_for_doi through the cache. Misses caused by sources failing to answer are not cached."""
+    cached = lookup_keywords(doi)
+    if cached is not None:
+        return cached[0] or None
+    _count("keyword_fetches")
+    keywords, source, definitive = find_keywords(doi, email=email, session=session)
+    if keywords or definitive:
+        remember_keywords(doi, keywords, source)
+    return keywords
+
+
+# --- Maintenance ---
+def metadata_cache_stats():
+    """Returns hit/miss counters for this process plus the size of both cache layers."""
+    with _cache_lock:
+        stats = dict(_metrics)
+        stats["memory_entries"] = len(_recent_records)
+    stats.update({f"disk_{key}": value for key, value in _metadata_store.stats().items()})
+    return stats
+
+
+def invalidate(doi):
+    """Drops a DOI's cached metadata so the next search fetches it again."""
+    key = _doi_key(doi)
+    with _cache_lock:
+        _recent_records.pop(key, None)
+    _metadata_store.delete(key)
+
+
+def clear():
+    with _cache_lock:
+        _recent_records.clear()
+    _metadata_store.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the DOI metadata cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show entry count and stored size")
+    invalidate_cmd = commands.add_parser("invalidate", help="Drop cached metadata for the given DOIs")
+    invalidate_cmd.add_argument("dois", nargs="+")
+    commands.add_parser("clear", help="Drop all cached metadata")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        stats = _metadata_store.stats()
+        print(f"{stats['entries']} DOIs cached, {stats['bytes'] / (1024 * 1024):.1f} MB at {_metadata_store.path}")
+    elif args.command == "invalidate":
+        for doi in args.dois:
+            invalidate(doi)
+            print(f"Invalidated {doi}")
+    elif args.command == "clear":
+        clear()
+        print("Metadata cache cleared")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
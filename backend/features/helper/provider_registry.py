@@ -0,0 +1,83 @@
+# helper/provider_registry.py
+import os
+import logging
+import threading
+import requests
+from .disk_cache import DiskCache
+from .upstream_urls import rewrite_url
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+PROVIDER_CACHE_TTL = int(os.environ.get("PROVIDER_CACHE_TTL", 30 * 24 * 60 * 60))  # Repository names rarely change
+PROVIDER_LOOKUP_TIMEOUT = 15
+
+# Process-wide registry: in-memory map in front of a persistent store
+_provider_store = DiskCache("core_providers")
+_provider_names = {}
+_inflight_lookups = {}  # provider_url -> threading.Event for lookups currently on the wire
+_registry_lock = threading.Lock()
+
+
+def _fetch_provider_name(provider_url, session=None):
+    """Resolves a CORE dataProvider URL to its display name. Returns (name, is_definitive)."""
+    requester = session if session else requests
+    try:
+        # Provider URLs come from CORE responses, so they name the real host even when CORE is redirected
+        response = requester.get(rewrite_url(provider_url), timeout=PROVIDER_LOOKUP_TIMEOUT)
+        if response.status_code == 200:
+            return response.json().get('name', "Unknown"), True
+        logging.debug(f"Provider lookup for {provider_url} returned status {response.status_code}")
+        # A 4xx answer will not change on retry; anything else might
+        return "Unknown", 400 <= response.status_code < 500 and response.status_code != 429
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Provider lookup failed for {provider_url}: {e}")
+    except ValueError:
+        logging.warning(f"Provider lookup for {provider_url} returned invalid JSON")
+    return "Unknown", False
+
+
+def get_provider_name(provider_url, session=None):
+    """
+    Returns the repository name for a CORE dataProvider URL, resolving each URL at most once per process.
+    Concurrent callers asking for the same URL wait for the first lookup instead of repeating it.
+    The session should carry the CORE Authorization header (e.g. search.core_session).
+    """
+    if not provider_url:
+        return "Unknown"
+
+    name = _provider_names.get(provider_url)
+    if name is not None:
+        return name
+
+    with _registry_lock:
+        name = _provider_names.get(provider_url)
+        if name is not None:
+            return name
+        lookup_done = _inflight_lookups.get(provider_url)
+        is_owner = lookup_done is None
+        if is_owner:
+            lookup_done = threading.Event()
+            _inflight_lookups[provider_url] = lookup_done
+
+    if not is_owner:
+        # The owner always sets the event (see finally below), but with retries and backoff its lookup can
+        # take far longer than one timeout; keep waiting for it rather than repeating the lookup
+        while not lookup_done.wait(PROVIDER_LOOKUP_TIMEOUT):
+            logging.debug(f"Still waiting for the in-flight provider lookup of {provider_url}")
+        return _provider_names.get(provider_url, "Unknown")
+
+    try:
+        name = _provider_store.get(provider_url)
+        if name is None:
+            name, is_definitive = _fetch_provider_name(provider_url, session=session)
+            if not is_definitive:
+                return name  # Transient failure: let a later item try again
+            _provider_store.set(provider_url, name, ttl=PROVIDER_CACHE_TTL)
+        _provider_names[provider_url] = name
+        return name
+    finally:
+        with _registry_lock:
+            _inflight_lookups.pop(provider_url, None)
+        lookup_done.set()
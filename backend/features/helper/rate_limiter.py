@@ -0,0 +1,167 @@
+# helper/rate_limiter.py
+import os
+import time
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse
+from .upstream_urls import upstream_for_configured_url
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Upstream Configuration ---
+# Hostnames that belong to each upstream API
+UPSTREAM_HOSTS = {
+    "arxiv": ("export.arxiv.org",),
+    "semantic_scholar": ("api.semanticscholar.org",),
+    "crossref": ("api.crossref.org",),
+    "openalex": ("api.openalex.org",),
+    "ncbi": ("eutils.ncbi.nlm.nih.gov",),
+    "doi": ("doi.org", "dx.doi.org"),
+    "core": ("api.core.ac.uk",),  # No rate limit configured; listed so it gets a circuit breaker
+}
+
+# Default (requests per second, burst size) per upstream, shared by every thread in the process.
+# Override with RATE_LIMIT_<UPSTREAM>="rate[:burst]", e.g. RATE_LIMIT_ARXIV="0.33:1".
+DEFAULT_RATE_LIMITS = {
+    "arxiv": (1 / 3.0, 1),  # arXiv asks for one request every 3 seconds
+    "semantic_scholar": (3.0, 3),
+    "crossref": (10.0, 5),
+    "openalex": (10.0, 5),
+    "ncbi": (10.0, 3),  # 10/s with an API key (3/s without)
+    "doi": (20.0, 10),
+}
+
+
+def _load_rate_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for upstream in limits:
+        override = os.environ.get(f"RATE_LIMIT_{upstream.upper()}")
+        if not override:
+            continue
+        try:
+            rate, _, burst = override.partition(':')
+            limits[upstream] = (float(rate), int(burst) if burst else limits[upstream][1])
+        except ValueError:
+            logging.warning(f"Ignoring invalid RATE_LIMIT_{upstream.upper()}={override!r}")
+    return limits
+
+
+RATE_LIMITS = _load_rate_limits()
+
+
+# --- Token Bucket ---
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve a token and are told how long to wait for it,
+    so the wait happens outside the lock and concurrent callers are spaced out in arrival order.
+    Nobody waits while tokens are available.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes one token and returns the number of seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self):
+        """Takes a token only if one is available now. Returns (acquired, seconds until one would be)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True, 0.0
+            return False, (1 - self._tokens) / self.rate
+
+    def acquire_cancellable(self, cancel_event, max_wait=None):
+        """
+        Like acquire(), but returns False without taking a token if cancel_event is set while waiting,
+        or straight away if the wait would exceed max_wait seconds. Returns True once a token is taken.
+        Nothing is reserved while waiting, so callers queued through reserve() are never moved up or
+        pushed back; a cancellable caller may instead be overtaken by them.
+        """
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            acquired, wait = self.try_acquire()
+            if acquired:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            if cancel_event.wait(wait):
+                return False
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """Waits for a token without blocking the event loop."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+_buckets = {upstream: TokenBucket(rate, burst) for upstream, (rate, burst) in RATE_LIMITS.items() if rate > 0}
+_host_to_upstream = {host: upstream for upstream, hosts in UPSTREAM_HOSTS.items() for host in hosts}
+
+
+def upstream_for_url(url):
+    """Returns the upstream key (e.g. 'crossref') for a URL, or None if it is not a known upstream.
+    URLs under an overridden base URL (e.g. the local stand-in, see upstream_urls.py) map to their upstream too.
+    """
+    try:
+        host = (urlparse(url).hostname or '').lower()
+    except ValueError:
+        return None
+    return _host_to_upstream.get(host) or upstream_for_configured_url(url)
+
+
+def throttle(url):
+    """Blocks until the upstream serving url has request budget. Unknown hosts pass straight through."""
+    bucket = _buckets.get(upstream_for_url(url))
+    if bucket is None:
+        return 0.0
+    waited = bucket.acquire()
+    if waited > 1:
+        logging.debug(f"Rate limiter held request to {urlparse(url).hostname} for {waited:.2f}s")
+    return waited
+
+
+def throttle_cancellable(url, cancel_event, max_wait=None):
+    """
+    throttle() for requests that may be called off (e.g. losers of a race): returns False without
+    using a token if cancel_event is set before a token is free or the wait would exceed max_wait.
+    """
+    if cancel_event.is_set():
+        return False
+    bucket = _buckets.get(upstream_for_url(url))
+    if bucket is None:
+        return True
+    return bucket.acquire_cancellable(cancel_event, max_wait=max_wait)
+
+
+async def throttle_async(url):
+    """Async counterpart of throttle()."""
+    bucket = _buckets.get(upstream_for_url(url))
+    if bucket is None:
+        return 0.0
+    return await bucket.acquire_async()
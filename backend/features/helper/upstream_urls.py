@@ -0,0 +1,90 @@
+# helper/upstream_urls.py
+# Base URLs of the upstream APIs, configurable so the pipeline can be pointed at the local stand-in
+# server (see features/upstream_standin.py) for offline load tests and benchmarks.
+#   UPSTREAM_STANDIN_URL=http://127.0.0.1:8900   -> every upstream is served from <standin>/<upstream>
+#   UPSTREAM_BASE_URL_<UPSTREAM>=http://...       -> overrides one upstream (takes precedence)
+import os
+import logging
+from urllib.parse import urlsplit
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+# Real origins; paths (e.g. CORE's /v3/) stay in the callers so recorded paths match on replay
+DEFAULT_BASE_URLS = {
+    "core": "https://api.core.ac.uk",
+    "crossref": "https://api.crossref.org",
+    "openalex": "https://api.openalex.org",
+    "semantic_scholar": "https://api.semanticscholar.org",
+    "arxiv": "http://export.arxiv.org",
+    "ncbi": "https://eutils.ncbi.nlm.nih.gov",
+    "doi": "https://doi.org",
+}
+UPSTREAM_STANDIN_URL = os.environ.get("UPSTREAM_STANDIN_URL", "").rstrip('/')
+OTHER_HOST_SCOPE = "_"  # Stand-in path prefix for hosts that are not a known upstream: /_/<host>/<path>
+
+
+def _load_base_urls():
+    base_urls = {}
+    for upstream, default in DEFAULT_BASE_URLS.items():
+        override = os.environ.get(f"UPSTREAM_BASE_URL_{upstream.upper()}")
+        if override:
+            base_urls[upstream] = override.rstrip('/')
+        elif UPSTREAM_STANDIN_URL:
+            base_urls[upstream] = f"{UPSTREAM_STANDIN_URL}/{upstream}"
+        else:
+            base_urls[upstream] = default
+    redirected = sorted(upstream for upstream in base_urls if base_urls[upstream] != DEFAULT_BASE_URLS[upstream])
+    if redirected:
+        logging.info(f"Upstream base URLs overridden for: {', '.join(redirected)}")
+    return base_urls
+
+
+BASE_URLS = _load_base_urls()
+# Overridden upstreams, longest base first so nested prefixes resolve to the most specific one
+_configured_bases = sorted(((base, upstream) for upstream, base in BASE_URLS.items() if base != DEFAULT_BASE_URLS[upstream]),
+                           key=lambda configured: len(configured[0]), reverse=True)
+
+
+def base_url(upstream):
+    """Returns the configured base URL (no trailing slash) for an upstream key such as 'crossref'."""
+    return BASE_URLS[upstream]
+
+
+def _under(url, base):
+    return url == base or url.startswith(base + '/') or url.startswith(base + '?')
+
+
+def upstream_for_configured_url(url):
+    """Returns the upstream whose overridden base URL serves url, or None (e.g. when nothing is overridden)."""
+    for base, upstream in _configured_bases:
+        if _under(url, base):
+            return upstream
+    return None
+
+
+def rewrite_url(url):
+    """Maps a URL on a real upstream origin (e.g. a link taken from an API response) to that upstream's configured base."""
+    if not url or not _configured_bases:
+        return url
+    for upstream, default in DEFAULT_BASE_URLS.items():
+        if BASE_URLS[upstream] != default and _under(url, default):
+            return BASE_URLS[upstream] + url[len(default):]
+    return url
+
+
+def route_for_url(url):
+    """
+    Splits a real or configured URL into (scope, path, query) as used by recorded fixtures and the stand-in:
+    scope is the upstream key, or '_/<host>' for other hosts (e.g. publisher redirects).
+    """
+    for base, upstream in _configured_bases:
+        if _under(url, base):
+            parts = urlsplit(url[len(base):] or '/')
+            return upstream, parts.path or '/', parts.query
+    parts = urlsplit(url)
+    for upstream, default in DEFAULT_BASE_URLS.items():
+        if _under(url, default):
+            return upstream, parts.path or '/', parts.query
+    return f"{OTHER_HOST_SCOPE}/{(parts.hostname or '').lower()}", parts.path or '/', parts.query
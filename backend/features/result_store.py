@@ -0,0 +1,140 @@
+# result_store.py
+# Columnar copy of the search results, written next to the CSV as <name>.parquet.
+# Readers project just the columns they need (skipping Full_Text on every page flip) and get
+# typed values back: Keywords as a real list and Year_Published as an integer. The CSV remains
+# the export format and the fallback whenever the Parquet file is missing or pyarrow is not installed.
+import os
+import csv
+import json
+import logging
+import pandas as pd
+
+from .streaming_csv import open_committed_csv, read_commit_marker
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: without pyarrow everything is read from the CSV
+    pa = None
+    pq = None
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+RESULT_FIELDS = ["Source", "Reference", "Doi", "Title", "Download_URL", "Abstract", "Keywords", "Full_Text", "Year_Published",
+                 "Alternate_Download_URLs", "Enrichment_Status"]
+LIST_FIELDS = ("Keywords", "Alternate_Download_URLs")
+RESULT_PARQUET_COMPRESSION = os.environ.get("RESULT_PARQUET_COMPRESSION", "zstd")
+RESULT_ROW_GROUP_SIZE = int(os.environ.get("RESULT_ROW_GROUP_SIZE", 256))
+
+if pa is not None:
+    RESULT_SCHEMA = pa.schema(
+        [(field, pa.string()) for field in RESULT_FIELDS if field not in LIST_FIELDS + ("Year_Published",)]
+        + [(field, pa.list_(pa.string())) for field in LIST_FIELDS] + [("Year_Published", pa.int32())]
+    )
+
+
+def dataset_path(csv_path):
+    """Path of the Parquet dataset that accompanies a results CSV."""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def parse_keywords(value):
+    """Turns a Keywords (or other list) value, given as a list or the CSV's string form of one, into a list of strings."""
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str):
+        return []
+    keyword_str = value.strip()
+    if not keyword_str:
+        return []
+    if keyword_str.startswith('[') and keyword_str.endswith(']'):
+        # Looks like a list representation, try to parse it
+        try:
+            # Replace single quotes with double quotes for JSON parsing
+            return json.loads(keyword_str.replace("'", '"'))
+        except ValueError:
+            # If parsing fails, split by comma
+            return [k.strip() for k in keyword_str.strip('[]').split(',') if k.strip()]
+    # Not a list format, split by comma
+    return [k.strip() for k in keyword_str.split(',') if k.strip()]
+
+
+def parse_year(value):
+    """Returns the year as an int, or None if it is missing or not a number."""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _typed_row(row):
+    typed = {field: ("" if row.get(field) is None else str(row.get(field))) for field in RESULT_FIELDS}
+    for field in LIST_FIELDS:
+        typed[field] = [str(value) for value in parse_keywords(row.get(field))]
+    typed["Year_Published"] = parse_year(row.get("Year_Published"))
+    return typed
+
+
+def write_results_dataset(csv_path, rows):
+    """Writes rows (result entries, in rank order) to the Parquet dataset next to csv_path. Returns its path or None."""
+    if pq is None:
+        logging.debug("pyarrow not installed; results are stored as CSV only.")
+        return None
+    path = dataset_path(csv_path)
+    tmp_path = f"{path}.tmp"
+    table = pa.Table.from_pylist([_typed_row(row) for row in rows], schema=RESULT_SCHEMA)
+    pq.write_table(table, tmp_path, compression=RESULT_PARQUET_COMPRESSION, row_group_size=RESULT_ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+    logging.info(f"Results dataset saved at: {path} ({len(rows)} rows, {os.path.getsize(path)} bytes)")
+    return path
+
+
+def _dataset_is_current(csv_path):
+    # A CSV still being streamed, or rewritten after the dataset, is newer than the dataset
+    path = dataset_path(csv_path)
+    if pq is None or not os.path.exists(path) or read_commit_marker(csv_path) is not None:
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+
+def _read_csv_rows(csv_path, columns, encoding):
+    with open_committed_csv(csv_path, encoding=encoding) as file:
+        for row in csv.DictReader(file):
+            typed = _typed_row(row)
+            yield {column: typed[column] for column in columns}
+
+
+def csv_has_header(csv_path):
+    """True if the committed part of the results CSV starts with a header row."""
+    for encoding in ('utf-8-sig', 'latin-1'):
+        try:
+            with open_committed_csv(csv_path, encoding=encoding) as file:
+                return bool(csv.DictReader(file).fieldnames)
+        except UnicodeDecodeError:
+            continue
+    return False
+
+
+def read_results(csv_path, columns=None):
+    """
+    Returns the search results as a list of dicts holding only `columns` (default: all),
+    from the Parquet dataset when it is current, otherwise from the (possibly still streaming) CSV.
+    """
+    columns = list(columns or RESULT_FIELDS)
+    if _dataset_is_current(csv_path):
+        return pq.read_table(dataset_path(csv_path), columns=columns).to_pylist()
+    try:
+        return list(_read_csv_rows(csv_path, columns, 'utf-8-sig'))
+    except UnicodeDecodeError:
+        logging.warning(f"Unicode decode error reading CSV file: {csv_path}; retrying as latin-1")
+        return list(_read_csv_rows(csv_path, columns, 'latin-1'))
+
+
+def read_results_frame(csv_path, columns=None):
+    """Like read_results, but returns a pandas DataFrame."""
+    if _dataset_is_current(csv_path):
+        return pq.read_table(dataset_path(csv_path), columns=list(columns) if columns else None).to_pandas()
+    with open_committed_csv(csv_path) as file:
+        return pd.read_csv(file, usecols=list(columns) if columns else None)
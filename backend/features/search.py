@@ -7,18 +7,24 @@ import logging
 import time
 import json # Added import
 import urllib
+import queue
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry # Corrected import path
+from concurrent.futures import ThreadPoolExecutor
 
 # Assuming helpers are in a 'helper' subdirectory relative to search.py
 # Adjust imports if your structure is different
 try:
-    from .helper.doi_finder import get_doi
+    from .helper.doi_cache import get_doi_cached
     from .helper.extract_secrets import get_secrets
-    from .helper.doi_info_scraper import fetch_bibtex, bibtex_to_formatted_text
-    from .helper.keywords_scraper import get_keywords_for_doi
+    from .helper.doi_info_scraper import bibtex_to_formatted_text
+    from .helper.metadata_cache import fetch_bibtex_cached, get_keywords_cached, metadata_cache_stats
+    from .helper.provider_registry import get_provider_name
+    from .helper.http_session import create_session_with_retries, SessionPool
+    from .helper.upstream_urls import base_url
+    from .helper.fulltext_cache import lookup_full_text, remember_full_text
+    from .streaming_csv import StreamingCsvWriter, write_csv_atomically
+    from .result_store import write_results_dataset
+    from .dedup import DEDUP_ENABLED, DuplicateIndex, deduplicate, iter_deduplicated
 except ImportError as e:
     print(f"Error importing helper modules: {e}")
     # Optionally exit or raise error if helpers are critical
@@ -39,52 +45,51 @@ except Exception as e:
 
 
 
-CORE_API_ENDPOINT = "https://api.core.ac.uk/v3/"
+CORE_API_ENDPOINT = f"{base_url('core')}/v3/"
 CORE_HEADERS = {"Authorization": f"Bearer {CORE_API_KEY}"}
 # OPTIMIZATION: Define max workers for parallel processing
 # Adjust based on your machine, network, and API rate limits (start lower, e.g., 5-10)
 MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 10)) # Allow overriding via env var
+# Enrichment engine used by extract_and_save_to_csv when the caller does not choose one: "threads" or "async"
+ENRICHMENT_ENGINE = os.environ.get("ENRICHMENT_ENGINE", "threads").lower()
+# Default time budget (seconds) for enriching one search; 0 waits for every item. Callers can pass their own.
+SEARCH_TIME_BUDGET = float(os.environ.get("SEARCH_TIME_BUDGET", 0))
+# Whether items still enriching when the budget runs out carry on in the background and update the saved results
+BACKGROUND_ENRICHMENT = os.environ.get("BACKGROUND_ENRICHMENT", "true").lower() == "true"
 
 
 
-# --- Session with Retries ---
-# OPTIMIZATION: Use a Session object for connection pooling and add retries
-def create_session_with_retries(
-    retries=5,  # Increased from 3 to 5
-    backoff_factor=1.0,  # Increased from 0.5 to 1.0 for longer delays
-    status_forcelist=(500, 502, 503, 504, 429), # Retry on these server errors and rate limits
-    session=None,
-):
-    """Creates a requests Session with robust retry logic."""
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-        # Respect Retry-After header if present (important for rate limits like 429)
-        respect_retry_after_header=True,
-        allowed_methods=frozenset(['HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'TRACE']) # Methods to retry on
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    # Add common headers like User-Agent globally to the session
-    session.headers.update({'User-Agent': f'ResearchFetcher/1.1 (mailto:{EMAIL})'})
-    return session
-
+# --- Sessions ---
+# create_session_with_retries lives in helper/http_session.py and is re-exported here
 # Create a global session specifically for CORE API calls (uses CORE_HEADERS)
-core_session = create_session_with_retries()
+# Sized so every enrichment worker can hold a keep-alive connection for provider lookups
+core_session = create_session_with_retries(pool_maxsize=MAX_WORKERS)
 core_session.headers.update(CORE_HEADERS)
 
+# OPTIMIZATION: Shared pool of retrying sessions for the enrichment workers, so each item
+# reuses warm keep-alive connections instead of paying fresh TCP/TLS handshakes
+enrichment_sessions = SessionPool(MAX_WORKERS, name="enrichment")
+
+
+# --- CORE Scroll Prefetching ---
+def _fetch_core_page(url):
+    """Fetches and decodes a single CORE scroll page. Returns (data, latency_seconds)."""
+    page_start = time.time()
+    response = core_session.get(url)
+    response.raise_for_status()
+    return response.json(), time.time() - page_start
+
 
 # --- CORE API Search (Modified to use Session) ---
-def search_works(query, limit=500, max_results=10, start_year=0, end_year=0):
-    """Search for works using the CORE API with scrolling, session, and error handling.
-    Ensures enough English-language papers are returned by continuing to scroll if needed.
+def iter_search_works(query, limit=500, max_results=10, start_year=0, end_year=0, outcome=None):
+    """Yields English-language works from the CORE API as scroll pages arrive.
+    The next scroll page is requested in the background as soon as the current page's
+    scrollId is known, so page N+1 is in flight while page N is handed downstream.
+    Stops (and abandons any in-flight prefetch) once max_results English hits are yielded.
+    If an outcome dict is given, "error" is set when the scroll was cut short by an error and
+    "exhausted" when CORE ran out of results before max_results.
     """
-    english_results = []
+    outcome = {} if outcome is None else outcome
     processed_ids = set()
     encoded_query = urllib.parse.quote_plus(query)
     if start_year > 0 or end_year > 0:
@@ -96,13 +101,18 @@ def search_works(query, limit=500, max_results=10, start_year=0, end_year=0):
     initial_url = f"{CORE_API_ENDPOINT}search/works?q={encoded_query}&limit={limit}&scroll=true"
     logging.info(f">>> Searching CORE for: '{query}' (Max results: {max_results}, Year range: {start_year}-{end_year})")
 
+    # A single background worker is enough: scroll pages must be requested in order
+    prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CoreScroll')
+    pending_page = prefetcher.submit(_fetch_core_page, initial_url)
+    page_latencies = []
+    english_count = 0
+    scroll_start = time.time()
+
     try:
-        url = initial_url
-        scroll_id = None
-        while len(english_results) < max_results:
-            response = core_session.get(url)
-            response.raise_for_status()
-            data = response.json()
+        while pending_page is not None and english_count < max_results:
+            data, latency = pending_page.result()
+            pending_page = None
+            page_latencies.append(latency)
             batch_results = data.get("results", [])
             # Filter for English language and not already processed
             new_english = [
@@ -111,28 +121,54 @@ def search_works(query, limit=500, max_results=10, start_year=0, end_year=0):
                    isinstance(r.get('language'), dict) and
                    r['language'].get('code') == 'en'
             ]
-            english_results.extend(new_english)
             processed_ids.update(r.get('id') for r in batch_results if r.get('id'))
-            logging.info(f"Fetched {len(new_english)} new English results (total: {len(english_results)})")
+            new_english = new_english[:max_results - english_count]
+            english_count += len(new_english)
+            logging.info(f"CORE page {len(page_latencies)}: fetched {len(new_english)} new English results "
+                         f"(total: {english_count}) in {latency:.2f}s")
 
+            # Kick off the next page before handing this one downstream
             scroll_id = data.get("scrollId")
-            if not scroll_id or not batch_results:
-                break  # No more results
+            if english_count < max_results and scroll_id and batch_results:
+                # Fetch more than needed to account for filtering
+                remaining_needed = max_results - english_count
+                current_limit = min(limit, max(remaining_needed * 2, 10))
+                next_url = f"{CORE_API_ENDPOINT}search/works?scrollId={scroll_id}&limit={current_limit}"
+                pending_page = prefetcher.submit(_fetch_core_page, next_url)
 
-            # Prepare next scroll URL, fetch more than needed to account for filtering
-            remaining_needed = max_results - len(english_results)
-            current_limit = min(limit, max(remaining_needed * 2, 10))
-            url = f"{CORE_API_ENDPOINT}search/works?scrollId={scroll_id}&limit={current_limit}"
+            yield from new_english
 
+        outcome["exhausted"] = english_count < max_results
     except requests.exceptions.HTTPError as e:
+        outcome["error"] = f"HTTP {e.response.status_code}"
         logging.error(f"CORE API HTTP Error: {e.response.status_code} - {e.response.text}")
     except requests.exceptions.RequestException as e:
+        outcome["error"] = str(e)
         logging.error(f"CORE API request failed: {e}")
     except json.JSONDecodeError:
+        outcome["error"] = "invalid JSON"
         logging.error(f"Failed to decode JSON response from CORE API.")
     except Exception as e:
+        outcome["error"] = str(e)
         logging.error(f"An unexpected error occurred during CORE search: {e}", exc_info=True)
-
+    finally:
+        # Drop any prefetch that is no longer needed; a request already on the wire finishes in the background
+        if pending_page is not None:
+            pending_page.cancel()
+        prefetcher.shutdown(wait=False)
+        if page_latencies:
+            logging.info(f"CORE scroll: {len(page_latencies)} pages in {time.time() - scroll_start:.2f}s "
+                         f"(per-page latency avg {sum(page_latencies) / len(page_latencies):.2f}s, "
+                         f"max {max(page_latencies):.2f}s)")
+
+
+def search_works(query, limit=500, max_results=10, start_year=0, end_year=0, outcome=None):
+    """Search for works using the CORE API with scrolling, session, and error handling.
+    Ensures enough English-language papers are returned by continuing to scroll if needed.
+    outcome is filled as in iter_search_works.
+    """
+    english_results = list(iter_search_works(query, limit=limit, max_results=max_results,
+                                             start_year=start_year, end_year=end_year, outcome=outcome))
     logging.info(f"Total unique English results fetched from CORE: {len(english_results)}")
     return english_results[:max_results]
 
@@ -151,24 +187,15 @@ def clean_text(text):
     return text.strip()
 
 
-# --- Function to Process a Single Work Item (for Parallel Execution) ---
-def process_work_item(work_item, item_index, total_items):
-    """Processes a single work item to extract all required information. Runs in a thread."""
-    # Get the item ID safely - ensure we log its type for debugging
-    item_id = work_item.get('id', 'N/A')
-    logging.info(f"[Item {item_index+1}/{total_items}] Processing item ID: {item_id} (Type: {type(item_id).__name__})")
+# --- Work Item Processing Steps ---
+# process_work_item is split into network-free steps so the threaded path below and the
+# asyncio engine (async_enrichment.py) build identical rows; only the HTTP calls differ.
+DOI_PATTERN = r"^10\.\d{4,9}/[-._;()/:A-Z0-9]+$"
 
-    thread_name = threading.current_thread().name # Get thread name for logging
-    
-    # Create a *new* session for this thread/task to avoid sharing issues (thread-local state)
-    # This session will be used for all non-CORE API calls within this function.
-    try:
-        thread_session = create_session_with_retries()
-        # Ensure User-Agent is set for this session as well
-        thread_session.headers.update({'User-Agent': f'ResearchFetcher/1.1 (mailto:{EMAIL})'})
-    except Exception as e:
-        logging.error(f"[Item {item_index+1}/{total_items}] Failed to create session: {e}")
-        return None # Cannot proceed without a session
+
+def _prepare_work_item(work_item, item_index):
+    """Filters the item and builds its initial entry. Returns the item's state dict, or None if filtered out."""
+    item_id = work_item.get('id', 'N/A')
 
     # --- Basic Filtering ---
     title = clean_text(work_item.get('title', ''))
@@ -189,7 +216,9 @@ def process_work_item(work_item, item_index, total_items):
         "Download_URL": clean_text(work_item.get("downloadUrl", "")),
         "Abstract": clean_text(work_item.get("abstract", "")),
         "Keywords": [], "Full_Text": "", # Full_Text from CORE often requires separate handling
-        "Year_Published": work_item.get("yearPublished", "") or "N/A" # Handle potential None year
+        "Year_Published": work_item.get("yearPublished", "") or "N/A", # Handle potential None year
+        "Alternate_Download_URLs": [], # Download URLs of duplicate copies folded into this item (see dedup.py)
+        "Enrichment_Status": "partial" # "complete" once every lookup has run (set by _finalize_entry)
     }
 
     # --- Detect source (PubMed or CORE) ---
@@ -208,35 +237,23 @@ def process_work_item(work_item, item_index, total_items):
             is_pubmed = False
 
     # --- Extract Provider Info ---
+    provider_url = None
+    data_providers = work_item.get('dataProviders', [])
     if is_pubmed:
         # For PubMed results, provider info is already in the dataProviders field
-        data_providers = work_item.get('dataProviders', [])
         if data_providers and isinstance(data_providers, list) and len(data_providers) > 0:
             provider_name = data_providers[0].get('name', 'PubMed')
             entry["Source"] = clean_text(provider_name)
         else:
             entry["Source"] = "PubMed"
     else:
-        # For CORE results, follow the existing provider extraction logic
-        provider_name = "Unknown"
-        data_providers = work_item.get('dataProviders', [])
+        # For CORE results the name has to be looked up from the provider URL (done by the caller)
+        entry["Source"] = "Unknown"
         if data_providers and len(data_providers) > 0 and 'url' in data_providers[0]:
-            provider = data_providers[0].get('url')
-            print(f"Provider URL: {provider}")
-            try:
-                provider_info = requests.get(provider, headers=CORE_HEADERS)
-                if provider_info.status_code == 200:
-                    provider_info = provider_info.json()
-                    provider_name = provider_info.get('name', "Unknown")
-            except:
-                pass
-        entry["Source"] = clean_text(provider_name)
+            provider_url = data_providers[0].get('url')
 
     # --- Handle DOI, Reference, and Keywords ---
-    doi = clean_text(work_item.get("doi", "")) # Clean DOI first
-    reference = ""
     keywords = []
-    
     # For PubMed, use pre-extracted reference if available
     if is_pubmed:
         # Use pre-extracted MeSH terms as keywords
@@ -244,64 +261,91 @@ def process_work_item(work_item, item_index, total_items):
         if mesh_terms:
             keywords = [clean_text(term) for term in mesh_terms if term]
             logging.debug(f"[Item {item_index+1}] Using MeSH terms as keywords: {keywords}")
-    
-    # 1. Try finding DOI if not present/valid
-    doi_pattern = r"^10\.\d{4,9}/[-._;()/:A-Z0-9]+$"
-    if not doi or not re.match(doi_pattern, doi, re.IGNORECASE):
-        if doi: 
-            logging.debug(f"[Item {item_index+1}] Invalid DOI format ('{doi}'). Searching external APIs...")
-        else: 
-            logging.debug(f"[Item {item_index+1}] DOI missing for '{title[:50]}...'. Searching external APIs...")
 
-        # Pass the thread's session to the helper
-        found_doi = get_doi(title, email=EMAIL, session=thread_session)
-        if found_doi:
-            doi = clean_text(found_doi) # Clean the found DOI too
-            # Re-validate the found DOI
-            if re.match(doi_pattern, doi, re.IGNORECASE):
-                 logging.info(f"[Item {item_index+1}] Found valid DOI externally: {doi}")
-            else:
-                 logging.warning(f"[Item {item_index+1}] Found DOI externally ('{doi}') but it seems invalid. Discarding.")
-                 doi = "" # Discard invalid DOI
-        else:
-            logging.info(f"[Item {item_index+1}] Could not find DOI externally for '{title[:50]}...'")
-            doi = "" # Ensure DOI is empty if not found/invalid
+    return {
+        "entry": entry,
+        "title": title,
+        "is_pubmed": is_pubmed,
+        "provider_url": provider_url,
+        "doi": clean_text(work_item.get("doi", "")), # Clean DOI first
+        "keywords": keywords,
+    }
 
-    # 2. If a valid DOI exists, fetch BibTeX and Keywords (if not from PubMed or no keywords yet)
+
+def _needs_doi_lookup(state, item_index):
+    """True if the item has no DOI or one that does not look valid."""
+    doi = state["doi"]
+    if doi and re.match(DOI_PATTERN, doi, re.IGNORECASE):
+        return False
     if doi:
-        entry["Doi"] = doi # Store the validated/found DOI
-        
-        # Only fetch BibTeX if no keywords (for PubMed) or for CORE
-        if not keywords or not is_pubmed:
-            bibtex_data = fetch_bibtex(doi, session=thread_session) # Pass session
-            if bibtex_data and not bibtex_data.startswith("Error"):
-                # Use helper to parse BibTeX for reference and potentially keywords
-                parsed_reference, bibtex_keywords = bibtex_to_formatted_text(bibtex_data)
-                # Use the parsed reference if we don't have one yet
-                if not entry["Reference"]:
-                    entry["Reference"] = clean_text(parsed_reference)
-                
-                # For CORE or if we still don't have keywords, use BibTeX keywords
-                if (not is_pubmed or not keywords) and bibtex_keywords and isinstance(bibtex_keywords, list):
-                    # Clean and store keywords from BibTeX
-                    keywords = [clean_text(kw) for kw in bibtex_keywords if isinstance(kw, str) and clean_text(kw)]
-                    logging.debug(f"[Item {item_index+1}] Found keywords in BibTeX: {keywords}")
-
-        # 3. If we still don't have keywords and it's not PubMed or we have no keywords, try keyword scraper APIs
-        if not keywords:
-            logging.debug(f"[Item {item_index+1}] No keywords found yet for DOI {doi}. Querying keyword APIs...")
-            # Pass session to keyword scraper
-            external_keywords = get_keywords_for_doi(doi, email=EMAIL, session=thread_session)
-            if external_keywords and isinstance(external_keywords, list):
-                # Clean and store keywords from external APIs
-                keywords = [clean_text(kw) for kw in external_keywords if isinstance(kw, str) and clean_text(kw)]
-                logging.info(f"[Item {item_index+1}] Found keywords externally via APIs: {keywords}")
+        logging.debug(f"[Item {item_index+1}] Invalid DOI format ('{doi}'). Searching external APIs...")
+    else:
+        logging.debug(f"[Item {item_index+1}] DOI missing for '{state['title'][:50]}...'. Searching external APIs...")
+    return True
+
+
+def _accept_found_doi(state, found_doi, item_index):
+    """Stores an externally found DOI on the state after re-validating it."""
+    if found_doi:
+        doi = clean_text(found_doi) # Clean the found DOI too
+        # Re-validate the found DOI
+        if re.match(DOI_PATTERN, doi, re.IGNORECASE):
+             logging.info(f"[Item {item_index+1}] Found valid DOI externally: {doi}")
+        else:
+             logging.warning(f"[Item {item_index+1}] Found DOI externally ('{doi}') but it seems invalid. Discarding.")
+             doi = "" # Discard invalid DOI
+    else:
+        logging.info(f"[Item {item_index+1}] Could not find DOI externally for '{state['title'][:50]}...'")
+        doi = "" # Ensure DOI is empty if not found/invalid
+    state["doi"] = doi
+
+
+def _wants_bibtex(state):
+    # Only fetch BibTeX if no keywords (for PubMed) or for CORE
+    return not state["keywords"] or not state["is_pubmed"]
+
+
+def _apply_bibtex(state, bibtex_data, item_index, parsed=None):
+    """Takes the reference and (where still needed) keywords from a fetched BibTeX entry.
+    `parsed` is the (reference, keywords) pair already parsed from it, e.g. by the metadata cache.
+    """
+    entry = state["entry"]
+    if bibtex_data and not bibtex_data.startswith("Error"):
+        # Use helper to parse BibTeX for reference and potentially keywords
+        parsed_reference, bibtex_keywords = parsed or bibtex_to_formatted_text(bibtex_data)
+        # Use the parsed reference if we don't have one yet
+        if not entry["Reference"]:
+            entry["Reference"] = clean_text(parsed_reference)
+
+        # For CORE or if we still don't have keywords, use BibTeX keywords
+        if (not state["is_pubmed"] or not state["keywords"]) and bibtex_keywords and isinstance(bibtex_keywords, list):
+            # Clean and store keywords from BibTeX
+            state["keywords"] = [clean_text(kw) for kw in bibtex_keywords if isinstance(kw, str) and clean_text(kw)]
+            logging.debug(f"[Item {item_index+1}] Found keywords in BibTeX: {state['keywords']}")
+
+
+def _apply_external_keywords(state, external_keywords, item_index):
+    """Takes keywords returned by the keyword scraper APIs."""
+    if external_keywords and isinstance(external_keywords, list):
+        # Clean and store keywords from external APIs
+        state["keywords"] = [clean_text(kw) for kw in external_keywords if isinstance(kw, str) and clean_text(kw)]
+        logging.info(f"[Item {item_index+1}] Found keywords externally via APIs: {state['keywords']}")
+
+
+def _finalize_entry(state, work_item, complete=True):
+    """Fills Keywords, the PubMed fallback reference and Full_Text. Returns the finished entry.
+    `complete` is False when the entry is saved before all of its lookups have run (see _partial_entry).
+    """
+    entry = state["entry"]
+    title = state["title"]
+    doi = state["doi"]
+    keywords = state["keywords"]
 
     # Store Keywords field with the final list (could be empty)
     entry["Keywords"] = keywords if keywords else []
-    
+
     # For PubMed, use the pre-extracted reference if we don't have one yet
-    if is_pubmed and not entry["Reference"] and 'authors' in work_item:
+    if state["is_pubmed"] and not entry["Reference"] and 'authors' in work_item:
         # Create a basic reference format if not already set
         reference = clean_text(work_item.get('authors', ''))
         year = work_item.get('yearPublished', '')
@@ -314,111 +358,425 @@ def process_work_item(work_item, item_index, total_items):
             reference += f". {journal}"
         if doi:
             reference += f". doi: {doi}"
-        
+
         entry["Reference"] = clean_text(reference)
 
+    # Copies of the same paper collapsed by the dedup stage may offer other places to download it
+    entry["Alternate_Download_URLs"] = [clean_text(url) for url in work_item.get("alternateDownloadUrls", []) if url]
+
     # --- Handle Full Text ---
+    # CORE full texts are kept in the shared full-text cache; items without one may find a copy there
+    # (e.g. crawled by an earlier PubMed search for the same DOI)
     full_text = clean_text(work_item.get("fullText", ""))
+    core_id = None if state["is_pubmed"] else work_item.get("id")
+    if full_text:
+        if core_id is not None:
+            remember_full_text(full_text, "core", doi=doi, core_id=core_id)
+    else:
+        cached = lookup_full_text(doi=doi, core_id=core_id)
+        if cached is not None:
+            full_text = clean_text(cached[0])
     if full_text:
         entry["Full_Text"] = full_text
-    
+    entry["Enrichment_Status"] = "complete" if complete else "partial"
+    return entry
+
+
+def _partial_entry(state, work_item, item_index):
+    """
+    Builds the row for an item whose enrichment has not finished, from whatever it has gathered so far
+    (title and abstract at least). `state` is the item's in-progress state, or None if it has not started.
+    The worker may still be filling in `state`, so the row is built from a copy.
+    """
+    if state is None:
+        state = _prepare_work_item(work_item, item_index)
+        if state is None:
+            return None # Filtered out
+    snapshot = dict(state, entry=dict(state["entry"]), keywords=list(state["keywords"]))
+    if re.match(DOI_PATTERN, snapshot["doi"] or "", re.IGNORECASE):
+        snapshot["entry"]["Doi"] = snapshot["doi"]
+    else:
+        snapshot["doi"] = "" # Not validated (or not found) yet
+    return _finalize_entry(snapshot, work_item, complete=False)
+
+
+# --- Function to Process a Single Work Item (for Parallel Execution) ---
+def process_work_item(work_item, item_index, total_items, session=None, progress=None):
+    """Processes a single work item to extract all required information. Runs in a thread.
+    `session` is used for all non-CORE API calls; a fresh one is created if none is given.
+    If `progress` (a dict) is given, the item's in-progress state is published there under item_index,
+    so a caller whose time budget runs out can still save what has been found (see _partial_entry).
+    """
+    # Get the item ID safely - ensure we log its type for debugging
+    item_id = work_item.get('id', 'N/A')
+    logging.info(f"[Item {item_index+1}/{total_items}] Processing item ID: {item_id} (Type: {type(item_id).__name__})")
+
+    thread_session = session
+    if thread_session is None:
+        try:
+            thread_session = create_session_with_retries()
+        except Exception as e:
+            logging.error(f"[Item {item_index+1}/{total_items}] Failed to create session: {e}")
+            return None # Cannot proceed without a session
+
+    state = _prepare_work_item(work_item, item_index)
+    if state is None:
+        return None
+    entry = state["entry"]
+    if progress is not None:
+        progress[item_index] = (state, work_item)
+
+    # CORE provider name: resolved once per process through the pooled CORE session (cached in memory and on disk)
+    if state["provider_url"]:
+        entry["Source"] = clean_text(get_provider_name(state["provider_url"], session=core_session))
+
+    # 1. Try finding DOI if not present/valid (the title->DOI cache is checked before any resolver is called)
+    if _needs_doi_lookup(state, item_index):
+        # Pass the thread's session to the helper
+        _accept_found_doi(state, get_doi_cached(state["title"], email=EMAIL, session=thread_session), item_index)
+
+    # 2. If a valid DOI exists, fetch BibTeX and Keywords (if not from PubMed or no keywords yet)
+    doi = state["doi"]
+    if doi:
+        entry["Doi"] = doi # Store the validated/found DOI
+        if _wants_bibtex(state):
+            # BibTeX and keywords come from the DOI metadata cache when this DOI has been seen before
+            bibtex_data, parsed = fetch_bibtex_cached(doi, session=thread_session) # Pass session
+            _apply_bibtex(state, bibtex_data, item_index, parsed)
+
+        # 3. If we still don't have keywords, try keyword scraper APIs
+        if not state["keywords"]:
+            logging.debug(f"[Item {item_index+1}] No keywords found yet for DOI {doi}. Querying keyword APIs...")
+            # Pass session to keyword scraper
+            _apply_external_keywords(state, get_keywords_cached(doi, email=EMAIL, session=thread_session), item_index)
+
+    _finalize_entry(state, work_item)
     logging.info(f"[Item {item_index+1}/{total_items}] Finished processing item ID: {item_id}")
     return entry # Return the dictionary for this item
 
 
+def _process_work_item_pooled(work_item, item_index, total_items, progress=None, cancel=None):
+    """Runs process_work_item with a session borrowed from the shared enrichment pool.
+    Items that have not started by the time `cancel` is set are skipped (None is returned).
+    """
+    if cancel is not None and cancel.is_set():
+        return None
+    with enrichment_sessions.session() as pooled_session:
+        return process_work_item(work_item, item_index, total_items, session=pooled_session, progress=progress)
+
+
+def _total_items(data):
+    # Streamed inputs (e.g. federated search) have no length up front; logs show '?' instead
+    return len(data) if hasattr(data, '__len__') else '?'
+
+
+def _iter_enriched_threaded(data, progress=None, cancel=None):
+    """Runs process_work_item over a thread pool, yielding (item_index, result, exception) as items finish.
+    `data` may be any iterable: items are submitted as they arrive, so a slow producer does not hold
+    back results for the items it has already produced.
+    `progress` receives each submitted item (see process_work_item); once `cancel` is set no further items
+    are read and queued ones are skipped.
+    """
+    total_items = _total_items(data)
+    completed = queue.Queue()
+    input_done = object()
+
+    # Use ThreadPoolExecutor for parallel I/O-bound tasks (API calls)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='Worker') as executor:
+        def submit_all():
+            # Submit tasks: process_work_item for each item in the data as the input yields it
+            # Pass item index and total count for better logging context
+            submitted = 0
+            try:
+                for i, work_item in enumerate(data):
+                    if cancel is not None and cancel.is_set():
+                        break
+                    if progress is not None:
+                        progress[i] = (None, work_item) # Not started yet
+                    future = executor.submit(_process_work_item_pooled, work_item, i, total_items, progress, cancel)
+                    future.add_done_callback(lambda done, i=i: completed.put((i, done)))
+                    submitted += 1
+            except Exception as e:
+                logging.error(f"Reading work items failed after {submitted} items: {e}", exc_info=True)
+            finally:
+                completed.put((input_done, submitted))
+
+        feeder = threading.Thread(target=submit_all, name='WorkFeeder', daemon=True)
+        feeder.start()
+
+        # Process completed tasks as they finish to collect results
+        submitted = None
+        finished = 0
+        while submitted is None or finished < submitted:
+            item_index, future = completed.get()
+            if item_index is input_done:
+                submitted = future
+                continue
+            finished += 1
+            try:
+                yield item_index, future.result(), None # Get result from the completed future
+            except Exception as e:
+                yield item_index, None, e
+        feeder.join()
+
+    pool_stats = enrichment_sessions.stats()
+    logging.info(f"Enrichment session pool (process totals): {pool_stats['sessions']} sessions, {pool_stats['requests']} requests, "
+                 f"{pool_stats['connections_opened']} connections opened, {pool_stats['connections_reused']} reused.")
+
+
+class _DeadlineReader:
+    """
+    Reads (item_index, result, exception) tuples from an enrichment iterator on a helper thread, so the
+    caller can stop waiting when its time budget runs out while the enrichment itself carries on.
+    """
+
+    def __init__(self, enriched, deadline):
+        self.deadline = deadline
+        self.timed_out = False
+        self._arrivals = queue.Queue()
+        self._done = object()
+        threading.Thread(target=self._pump, args=(enriched,), name='EnrichmentReader', daemon=True).start()
+
+    def _pump(self, enriched):
+        try:
+            for arrival in enriched:
+                self._arrivals.put(arrival)
+        except Exception as e:
+            logging.error(f"Enrichment engine failed: {e}", exc_info=True)
+        finally:
+            self._arrivals.put(self._done)
+
+    def __iter__(self):
+        """Yields arrivals until enrichment ends or the deadline passes (timed_out is then set)."""
+        while True:
+            try:
+                arrival = self._arrivals.get(timeout=max(self.deadline - time.time(), 0))
+            except queue.Empty:
+                self.timed_out = True
+                return
+            if arrival is self._done:
+                return
+            yield arrival
+
+    def ready(self):
+        """Yields the arrivals already waiting, without blocking."""
+        while True:
+            try:
+                arrival = self._arrivals.get_nowait()
+            except queue.Empty:
+                return
+            if arrival is self._done:
+                self._arrivals.put(arrival) # Leave the end marker for remaining()
+                return
+            yield arrival
+
+    def remaining(self):
+        """Yields every arrival still to come, however long enrichment takes."""
+        while True:
+            arrival = self._arrivals.get()
+            if arrival is self._done:
+                return
+            yield arrival
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _finish_enrichment_in_background(reader, csv_file_name, headers, rows_by_index):
+    """
+    Waits for the items that were saved partially enriched and rewrites the saved results (CSV and dataset)
+    with their finished rows. Nothing is written if the CSV has been replaced or removed in the meantime,
+    e.g. by a newer search.
+    """
+    signature = _file_signature(csv_file_name)
+
+    def run():
+        updated = 0
+        for item_index, result, error in reader.remaining():
+            if error is not None:
+                logging.error(f"Background enrichment of item at index {item_index} failed: {error}", exc_info=error)
+            elif result and isinstance(result, dict):
+                saved = rows_by_index.get(item_index)
+                if saved is not None:
+                    # The saved row may hold download URLs of duplicates that arrived after the item (see _apply_late_alternates)
+                    result["Alternate_Download_URLs"] = saved.get("Alternate_Download_URLs", result.get("Alternate_Download_URLs", []))
+                rows_by_index[item_index] = result
+                updated += 1
+        if not updated:
+            logging.info(f"Background enrichment for '{csv_file_name}' finished without new data.")
+            return
+        try:
+            if _file_signature(csv_file_name) != signature:
+                logging.info(f"'{csv_file_name}' changed while enrichment continued; discarding {updated} late rows.")
+                return
+            rows = [rows_by_index[index] for index in sorted(rows_by_index)]
+            write_csv_atomically(csv_file_name, headers, rows)
+            write_results_dataset(csv_file_name, rows)
+            logging.info(f"Background enrichment updated {updated} rows in '{csv_file_name}'.")
+        except Exception as e:
+            logging.warning(f"Failed to save background enrichment for '{csv_file_name}': {e}", exc_info=True)
+
+    threading.Thread(target=run, name='BackgroundEnrichment', daemon=True).start()
+
+
+def _apply_late_alternates(index, ranked_results):
+    """Adds the download URLs of duplicates that streamed in after their canonical row was built; returns the rows changed."""
+    changed = 0
+    for item_index, row in ranked_results:
+        alternates = [clean_text(url) for url in index.alternates(item_index) if url]
+        if alternates != row.get("Alternate_Download_URLs"):
+            row["Alternate_Download_URLs"] = alternates
+            changed += 1
+    if changed:
+        logging.info(f"Dedup: added alternate download URLs from late duplicates to {changed} rows.")
+    return changed
+
+
 # --- Main Extraction and Saving Function (Parallelized) ---
-def extract_and_save_to_csv(data, csv_file_name):
-    """Extracts data from CORE results in parallel and saves to CSV."""
+def extract_and_save_to_csv(data, csv_file_name, engine=None, time_budget=None, background=None):
+    """Extracts data from CORE results in parallel and saves to CSV.
+    `data` may be a list or any iterable of work items (e.g. federated_search.iter_federated_search);
+    items are enriched as they arrive and rows keep the order the items were produced in.
+    `engine` selects the enrichment engine: "threads" (default, ThreadPoolExecutor) or "async"
+    (asyncio/aiohttp, see async_enrichment.py). Both produce identical rows.
+    `time_budget` (seconds, default SEARCH_TIME_BUDGET; 0 = unbounded) bounds how long this waits: items
+    still enriching when it runs out are saved with the fields found so far and Enrichment_Status "partial".
+    If `background` (default BACKGROUND_ENRICHMENT) is true they keep enriching and the saved results are
+    updated when they finish; otherwise the remaining work is cancelled.
+    """
     if not data:
         logging.warning("No data provided to extract_and_save_to_csv.")
         return []
 
     # Define headers based on the keys in the 'entry' dictionary created in process_work_item
-    headers = ["Source", "Reference", "Doi", "Title", "Download_URL", "Abstract", "Keywords", "Full_Text", "Year_Published"]
-    processed_results = []
-    total_items = len(data)
-    logging.info(f"Starting parallel processing of {total_items} work items using up to {MAX_WORKERS} workers...")
+    headers = ["Source", "Reference", "Doi", "Title", "Download_URL", "Abstract", "Keywords", "Full_Text", "Year_Published",
+               "Alternate_Download_URLs", "Enrichment_Status"]
+
+    # Collapse duplicate copies of the same paper before any enrichment request is made.
+    # Lists are deduplicated up front; streamed input is checked item by item as it arrives.
+    stream_index = None # Duplicates of streamed items may arrive after the item was sent for enrichment
+    if DEDUP_ENABLED:
+        if isinstance(data, list):
+            data = deduplicate(data)
+        else:
+            stream_index = DuplicateIndex()
+            data = iter_deduplicated(data, stream_index)
+    total_items = _total_items(data)
+    engine = (engine or ENRICHMENT_ENGINE).lower()
+    time_budget = SEARCH_TIME_BUDGET if time_budget is None else time_budget
+    background = BACKGROUND_ENRICHMENT if background is None else background
+    progress = {} if time_budget else None # item_index -> (in-progress state, work item)
+    cancel = threading.Event()
     start_time = time.time()
 
-    # Use ThreadPoolExecutor for parallel I/O-bound tasks (API calls)
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='Worker') as executor:
-        # Submit tasks: process_work_item for each item in the data
-        # Pass item index and total count for better logging context
-        future_to_index = {executor.submit(process_work_item, work_item, i, total_items): i for i, work_item in enumerate(data)}
+    if engine == "async":
+        from .async_enrichment import iter_enriched_async, ASYNC_MAX_ITEMS # Imported lazily: needs aiohttp
+        logging.info(f"Starting async processing of {total_items} work items with up to {ASYNC_MAX_ITEMS} in flight...")
+        enriched = iter_enriched_async(data, progress=progress, cancel=cancel)
+    else:
+        logging.info(f"Starting parallel processing of {total_items} work items using up to {MAX_WORKERS} workers...")
+        enriched = _iter_enriched_threaded(data, progress=progress, cancel=cancel)
+    reader = _DeadlineReader(enriched, start_time + time_budget) if time_budget else None
 
-        # Process completed tasks as they finish to collect results
-        for future in as_completed(future_to_index):
-            item_index = future_to_index[future]
+    # Rows are streamed to the CSV as each item finishes, so readers see results while the rest are enriched
+    try:
+        csv_writer = StreamingCsvWriter(csv_file_name, headers)
+    except (IOError, csv.Error) as e:
+        logging.error(f"Failed to open CSV file '{csv_file_name}' for writing: {e}", exc_info=True)
+        csv_writer = None
+    ranked_results = []  # (item_index, entry) so the returned list follows the original ranking
+    finished_items = set()
+
+    def save_row(item_index, row):
+        nonlocal csv_writer
+        ranked_results.append((item_index, row))
+        if csv_writer is not None:
             try:
-                result = future.result() # Get result from the completed future
-                if result and isinstance(result, dict): # Check if result is valid
-                    processed_results.append(result)
-                elif result is None:
-                     logging.debug(f"Item at index {item_index} was filtered out during processing.")
-                else:
-                     logging.warning(f"Unexpected result type from processing item at index {item_index}: {type(result)}")
-            except Exception as e:
+                csv_writer.write_row(row, rank=item_index)
+            except (IOError, csv.Error) as e:
+                logging.error(f"Streaming CSV write failed for '{csv_file_name}', stopping CSV output: {e}", exc_info=True)
+                csv_writer.abort()
+                csv_writer = None
+
+    def handle(arrivals):
+        for item_index, result, error in arrivals:
+            finished_items.add(item_index)
+            if error is not None:
                 # Log exception raised during task execution
-                logging.error(f"Error processing work item at index {item_index}: {e}", exc_info=True) # exc_info=True logs traceback
-
+                logging.error(f"Error processing work item at index {item_index}: {error}", exc_info=error) # exc_info logs traceback
+            elif result and isinstance(result, dict): # Check if result is valid
+                save_row(item_index, result)
+            elif result is None:
+                 logging.debug(f"Item at index {item_index} was filtered out during processing.")
+            else:
+                 logging.warning(f"Unexpected result type from processing item at index {item_index}: {type(result)}")
+
+    handle(reader if reader is not None else enriched)
+
+    # Time budget spent: save what the unfinished items have so far and let them finish (or stop) without us
+    timed_out = reader is not None and reader.timed_out
+    if timed_out:
+        if not background:
+            cancel.set()
+        handle(reader.ready()) # Items that finished while the deadline passed
+        partial_count = 0
+        for item_index, (state, work_item) in sorted(list(progress.items()), key=lambda tracked: tracked[0]):
+            if item_index in finished_items:
+                continue
+            row = _partial_entry(state, work_item, item_index)
+            if row is not None:
+                save_row(item_index, row)
+                partial_count += 1
+        logging.warning(f"Time budget of {time_budget:.1f}s ran out: saved {partial_count} items partially enriched"
+                        f"{' (still enriching in the background)' if background else ''}.")
+
+    late_duplicates = _apply_late_alternates(stream_index, ranked_results) if stream_index is not None else 0
+    processed_results = [entry for _, entry in sorted(ranked_results, key=lambda ranked: ranked[0])]
     processing_time = time.time() - start_time
     logging.info(f"Parallel processing finished in {processing_time:.2f} seconds.")
     logging.info(f"Successfully processed and retrieved data for {len(processed_results)} items out of {total_items}.")
+    cache_stats = metadata_cache_stats()
+    logging.info(f"DOI metadata cache (process totals): {cache_stats['memory_hits']} memory hits, {cache_stats['disk_hits']} disk hits, "
+                 f"{cache_stats['misses']} misses; {cache_stats['bibtex_fetches']} BibTeX and {cache_stats['keyword_fetches']} keyword fetches.")
 
-    # Check if any data was successfully processed before writing CSV
-    if not processed_results:
-        logging.warning(f"No data extracted successfully. CSV file '{csv_file_name}' will not be created/updated.")
-        # Create an empty CSV with just headers to avoid 404 errors
-        try:
-            with open(csv_file_name, "w", encoding="utf-8", newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
-            logging.info(f"Created empty CSV file with headers at: {os.path.abspath(csv_file_name)}")
-        except Exception as e:
-            logging.error(f"Failed to create empty CSV file: {e}")
-        return []
+    if csv_writer is None:
+        return processed_results # Return the processed results even if saving failed
 
-    # OPTIMIZATION: Write to CSV after all data is processed
+    # Final pass: put the streamed rows back into the original ranking and swap the file in atomically
     try:
-        logging.info(f"Saving {len(processed_results)} extracted items to {csv_file_name}...")
-        
-        # Make sure the directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(csv_file_name)), exist_ok=True)
-        
-        with open(csv_file_name, "w", encoding="utf-8", newline='') as csvfile:
-            # Use DictWriter for easy writing from list of dictionaries
-            writer = csv.DictWriter(csvfile, fieldnames=headers, extrasaction='ignore') # Ignore extra fields if any
-            writer.writeheader()
-            
-            # Write all processed rows at once
-            writer.writerows(processed_results)
-            
-            # Flush to ensure data is written to disk
-            csvfile.flush()
-            os.fsync(csvfile.fileno())
-            
-        # Double-check file exists and has content
-        if not os.path.exists(csv_file_name):
-            logging.error(f"CSV file does not exist after writing: {csv_file_name}")
-            return processed_results
-        
+        csv_writer.finalize()
+        if late_duplicates:
+            write_csv_atomically(csv_file_name, headers, processed_results) # The streamed rows lack those URLs
+        if not processed_results:
+            logging.warning(f"No data extracted successfully. CSV file '{csv_file_name}' contains only headers.")
+            return []
         file_size = os.path.getsize(csv_file_name)
         logging.info(f"CSV saved successfully at: {os.path.abspath(csv_file_name)} (Size: {file_size} bytes)")
-        return processed_results # Return the data that was saved
     except IOError as e:
-        logging.error(f"I/O Error saving CSV file '{csv_file_name}': {e}")
+        logging.error(f"I/O Error finalizing CSV file '{csv_file_name}': {e}")
         import traceback
         logging.error(traceback.format_exc())
-    except csv.Error as e:
-         logging.error(f"CSV writing error for file '{csv_file_name}': {e}")
-         import traceback
-         logging.error(traceback.format_exc())
+        csv_writer.abort()
+        return processed_results
     except Exception as e:
         logging.error(f"An unexpected error occurred during CSV writing: {e}", exc_info=True)
         import traceback
         logging.error(traceback.format_exc())
+        csv_writer.abort()
+        return processed_results
+
+    # Columnar copy for readers that only need a few fields; they fall back to the CSV without it
+    try:
+        write_results_dataset(csv_file_name, processed_results)
+    except Exception as e:
+        logging.warning(f"Failed to write results dataset for '{csv_file_name}': {e}", exc_info=True)
+
+    if timed_out and background:
+        _finish_enrichment_in_background(reader, csv_file_name, headers, dict(ranked_results))
 
-    return processed_results # Return the processed results even if saving failed
+    return processed_results # Return the data that was saved
 
 
 
@@ -0,0 +1,118 @@
+# search_cache.py
+import os
+import time
+import logging
+
+from .helper.disk_cache import DiskCache
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 6 * 60 * 60))  # Seconds; 0 disables the cache
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 200))
+SEARCH_CACHE_MAX_MB = int(os.environ.get("SEARCH_CACHE_MAX_MB", 512))
+
+_search_cache = DiskCache(
+    "search_results",
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    max_bytes=SEARCH_CACHE_MAX_MB * 1024 * 1024,
+)
+
+
+def _normalize_query(query):
+    """Lower-cases and collapses whitespace so trivially different queries share an entry."""
+    return ' '.join((query or '').lower().split())
+
+
+def _cache_key(source, query, start_year, end_year):
+    # max_results is deliberately not part of the row key: one entry per query holds the
+    # largest result set fetched so far and serves any request for the same or fewer results.
+    return f"{source}|{_normalize_query(query)}|{int(start_year or 0)}|{int(end_year or 0)}"
+
+
+def get_cached_results(source, query, max_results, start_year=0, end_year=0):
+    """Returns cached results for the search, or None if they are missing, expired or too few."""
+    if SEARCH_CACHE_TTL <= 0:
+        return None
+    cached = _search_cache.get(_cache_key(source, query, start_year, end_year))
+    if not cached:
+        return None
+    results = cached.get("results", [])
+    # A cached set can answer the request if it was fetched with a larger max_results,
+    # or if the search reported that the upstream had no more results.
+    if cached.get("max_results", 0) >= max_results or cached.get("exhausted"):
+        return results[:max_results]
+    return None
+
+
+def cache_results(source, query, max_results, start_year, end_year, results, exhausted=False, replace=False):
+    """
+    Stores results unless an entry fetched with a larger max_results is already cached (replace=True
+    overwrites it anyway). exhausted marks a set that holds every result the upstream has.
+    """
+    if SEARCH_CACHE_TTL <= 0 or not results:
+        return
+    key = _cache_key(source, query, start_year, end_year)
+    existing = _search_cache.get(key)
+    if not replace and existing and existing.get("max_results", 0) > max_results:
+        return
+    try:
+        _search_cache.set(key, {"max_results": max_results, "results": results, "exhausted": bool(exhausted)},
+                          ttl=SEARCH_CACHE_TTL)
+    except Exception as e:
+        logging.warning(f"Failed to cache {source} results for '{query}': {e}")
+
+
+def _store_fetch(source, query, max_results, start_year, end_year, results, outcome, refresh):
+    # Searches swallow upstream errors and return what they had; such partial sets are not cached
+    if outcome.get("error"):
+        logging.info(f"Not caching {source} results for '{query}': fetch was incomplete ({outcome['error']})")
+        return
+    cache_results(source, query, max_results, start_year, end_year, results,
+                  exhausted=outcome.get("exhausted", False), replace=refresh)
+
+
+def cached_search(source, search_fn, query, max_results=10, start_year=0, end_year=0, refresh=False):
+    """
+    Runs search_fn(query, max_results=..., start_year=..., end_year=..., outcome=...) through the result cache.
+    search_fn fills the outcome dict: "error" if it gave up early, "exhausted" if the upstream ran out of results.
+    Set refresh=True to bypass the cached entry (the fresh results still replace it).
+    """
+    if not refresh:
+        cached = get_cached_results(source, query, max_results, start_year, end_year)
+        if cached is not None:
+            logging.info(f"Search cache hit for {source} query '{query}' ({len(cached)} results)")
+            return cached
+
+    start_time = time.time()
+    outcome = {}
+    results = search_fn(query, max_results=max_results, start_year=start_year, end_year=end_year, outcome=outcome)
+    logging.info(f"Search cache miss for {source} query '{query}', fetched {len(results or [])} results "
+                 f"in {time.time() - start_time:.2f} seconds")
+    _store_fetch(source, query, max_results, start_year, end_year, results, outcome, refresh)
+    return results
+
+
+def cached_iter_search(source, iter_fn, query, max_results=10, start_year=0, end_year=0, refresh=False):
+    """
+    Streaming counterpart of cached_search for iterator-based searches (e.g. search.iter_search_works):
+    yields cached results if present, otherwise yields results as iter_fn produces them and caches
+    the full set once the iterator is exhausted.
+    """
+    if not refresh:
+        cached = get_cached_results(source, query, max_results, start_year, end_year)
+        if cached is not None:
+            logging.info(f"Search cache hit for {source} query '{query}' ({len(cached)} results)")
+            yield from cached
+            return
+
+    start_time = time.time()
+    results = []
+    outcome = {}
+    for result in iter_fn(query, max_results=max_results, start_year=start_year, end_year=end_year, outcome=outcome):
+        results.append(result)
+        yield result
+    logging.info(f"Search cache miss for {source} query '{query}', fetched {len(results)} results "
+                 f"in {time.time() - start_time:.2f} seconds")
+    _store_fetch(source, query, max_results, start_year, end_year, results, outcome, refresh)
@@ -1,14 +1,162 @@
+import os
 import requests
 import xml.etree.ElementTree as ET
 import re
+import asyncio
 import logging
 # from crewai_tools import ScrapeWebsiteTool
-import asyncio
-from crawl4ai import AsyncWebCrawler
-from .helper.extract_secrets import get_pubmed_api_key
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from .helper.eutils import EUTILS_POOL_SIZE, eutils_url, eutils_params, get_eutils
+from .helper.http_recorder import recording_enabled
+from .helper.fulltext_cache import lookup_full_text, remember_full_text
+from .crawl_scheduler import CrawlScheduler, CRAWL_TIMEOUT
+from .crawler_pool import crawler_service
+from .fulltext_fetcher import TieredFullTextFetcher, TIER_SOURCES
 import datetime
 
-PUBMED_API_KEY = get_pubmed_api_key()
+# "history": ESearch stores the result set on the NCBI history server (usehistory=y) and EFetch pages
+# through it by WebEnv/query_key + retstart/retmax. "ids": the ID list is sent back to EFetch in batches.
+PUBMED_FETCH_MODE = os.environ.get("PUBMED_FETCH_MODE", "history").lower()
+PUBMED_EFETCH_PAGE_SIZE = int(os.environ.get("PUBMED_EFETCH_PAGE_SIZE", 200))  # Records per EFetch request
+PUBMED_EFETCH_WORKERS = EUTILS_POOL_SIZE  # EFetch pages in flight (env PUBMED_EFETCH_WORKERS); the NCBI rate limit still applies
+PUBMED_STREAM_CHUNK_SIZE = 64 * 1024  # Bytes of EFetch XML handed to the parser at a time
+
+def _efetch_pages(esearch_result, id_list, max_results):
+    """Returns the EFetch request params for each page of the result set, in result order."""
+    web_env = esearch_result.get('webenv')
+    query_key = esearch_result.get('querykey')
+    if PUBMED_FETCH_MODE == "history" and web_env and query_key:
+        total = min(int(esearch_result.get('count', '0')), max_results)
+        return [
+            eutils_params(db='pubmed', WebEnv=web_env, query_key=query_key, retstart=start,
+                           retmax=min(PUBMED_EFETCH_PAGE_SIZE, total - start), retmode='xml')
+            for start in range(0, total, PUBMED_EFETCH_PAGE_SIZE)
+        ]
+    # Batches of IDs keep the URL short enough for EFetch
+    return [
+        eutils_params(db='pubmed', id=','.join(id_list[start:start + PUBMED_EFETCH_PAGE_SIZE]), retmode='xml')
+        for start in range(0, len(id_list), PUBMED_EFETCH_PAGE_SIZE)
+    ]
+
+def _parse_pubmed_article(article_node):
+    """Extracts the metadata dict used by search_pubmed from one <PubmedArticle> element."""
+    title = article_node.findtext('.//ArticleTitle')
+    abstract = article_node.findtext('.//AbstractText')
+    
+    # Extract authors
+    authors = []
+    for author_element in article_node.findall('.//Author'):
+        last_name = author_element.findtext('LastName')
+        fore_name = author_element.findtext('ForeName')
+        if last_name and fore_name:
+            authors.append(f"{fore_name} {last_name}")
+        elif last_name:
+            authors.append(last_name)
+    authors_str = ', '.join(authors)
+    
+    # Extract publication date
+    pub_date = article_node.find('.//PubDate')
+    year = ""
+    if pub_date is not None:
+        year = pub_date.findtext('Year')
+        month = pub_date.findtext('Month')
+        day = pub_date.findtext('Day')
+        date_parts = [year, month, day]
+        date_str = '-'.join(part for part in date_parts if part)
+    else:
+        date_str = ''
+    
+    journal = article_node.findtext('.//Journal/Title')
+    
+    # The article's own identifiers; ReferenceList entries carry ArticleIds of the papers it cites
+    article_ids = article_node.findall('PubmedData/ArticleIdList/ArticleId')
+
+    # Extract DOI
+    doi = ''
+    for eid in article_ids:
+        if eid.attrib.get('IdType') == 'doi':
+            doi_text = eid.text
+            if doi_text: # Ensure DOI text is not None or empty
+                doi = doi_text.strip()
+            break
+    
+    # Extract keywords (MeSH terms)
+    keyword_list = []
+    for mesh_heading in article_node.findall('.//MeshHeading'):
+        descriptor = mesh_heading.findtext('DescriptorName')
+        if descriptor:
+            keyword_list.append(descriptor)
+    
+    # Extract PMID for building the URL
+    pmid = ''
+    for eid in article_ids:
+        if eid.attrib.get('IdType') == 'pubmed':
+            pmid = eid.text
+            break
+
+    # PMC ID, present when the article is in PubMed Central (structured full text may be available)
+    pmcid = ''
+    for eid in article_ids:
+        if eid.attrib.get('IdType') == 'pmc' and eid.text:
+            pmcid = eid.text.strip()
+            break
+
+    return {
+        'title': title,
+        'abstract': abstract,
+        'authors_str': authors_str,
+        'year': year,
+        'date_str': date_str,
+        'journal': journal,
+        'doi': doi,
+        'keyword_list': keyword_list,
+        'pmid': pmid,
+        'pmcid': pmcid
+    }
+
+def _iter_articles_in_stream(chunks):
+    """
+    Incrementally parses EFetch XML fed in as byte chunks and yields each article's metadata as soon as
+    its closing </PubmedArticle> arrives. Finished elements are cleared, so memory stays flat however
+    large the response is.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+            elif element.tag == 'PubmedArticle':
+                yield _parse_pubmed_article(element)
+                root.clear() # Drops this article (and anything before it) from the tree
+    parser.close()
+
+def _fetch_efetch_page(url, params):
+    """Streams one EFetch page and returns its parsed articles; the page's XML is never held in memory as a whole."""
+    # Recording needs the whole body, so the response is only streamed when recording is off
+    response = get_eutils(url, params=params, stream=not recording_enabled())
+    with response:
+        return list(_iter_articles_in_stream(response.iter_content(chunk_size=PUBMED_STREAM_CHUNK_SIZE)))
+
+def _iter_pubmed_articles(pages):
+    """
+    Fetches and parses EFetch pages concurrently (up to PUBMED_EFETCH_WORKERS, under the NCBI rate limit)
+    and yields article metadata dicts in result order, each page as soon as it and every page before it are done.
+    """
+    efetch_url = eutils_url('efetch')
+
+    def fetch_page(numbered_page):
+        page_number, params = numbered_page
+        logging.debug(f"EFetch page {page_number + 1}/{len(pages)}: retstart={params.get('retstart', 0)}")
+        return _fetch_efetch_page(efetch_url, params)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(PUBMED_EFETCH_WORKERS, len(pages))), thread_name_prefix='EFetch') as executor:
+        # map() yields in submission order, so pages are reassembled in result order
+        for page_articles in executor.map(fetch_page, enumerate(pages)):
+            yield from page_articles
 
 def fetch_full_text_from_doi(doi):
     """
@@ -17,24 +165,22 @@ def fetch_full_text_from_doi(doi):
     """
     if not doi:
         return ""
-    # This function will be replaced by direct use of _fetch_full_text in a gathered context.
-    # However, keeping it for now if it's used elsewhere, or can be removed if not.
-    return asyncio.run(_fetch_full_text(f"https://doi.org/{doi}"))
+    return crawler_service.run(_fetch_full_text(f"https://doi.org/{doi}"))
 
 async def _fetch_full_text(url, crawler=None):
     """
     Fetches the full text using the provided crawler instance if given,
-    otherwise creates a new one (for backward compatibility).
+    otherwise borrows a browser from the shared crawler pool (the crawl is
+    abandoned CRAWL_TIMEOUT seconds after it gets a browser).
+    Must run on the crawler service loop when no crawler is given.
     """
     if crawler is not None:
         return await _fetch_full_text_with_crawler(crawler, url)
-    else:
-        async with AsyncWebCrawler() as crawler_instance:
-            return await _fetch_full_text_with_crawler(crawler_instance, url)
+    return await _fetch_full_text_with_crawler(crawler_service.pool, url, timeout=CRAWL_TIMEOUT)
 
-async def _fetch_full_text_with_crawler(crawler, url):
+async def _fetch_full_text_with_crawler(crawler, url, **kwargs):
     try:
-        result = await crawler.arun(url=url)
+        result = await crawler.arun(url=url, **kwargs)
         if result and result.success and hasattr(result, "markdown"):
             return result.markdown
         else:
@@ -43,11 +189,14 @@ async def _fetch_full_text_with_crawler(crawler, url):
     except Exception as e:
         logging.error(f"Exception during fetching full text from {url}: {e}")
         return ""
-def search_pubmed(query, max_results=100, start_year=0, end_year=0):
+def search_pubmed(query, max_results=100, start_year=0, end_year=0, outcome=None):
     """
     Search PubMed for articles matching the query and year range.
     Returns results formatted to be compatible with extract_and_save_to_csv.
+    If an outcome dict is given, "error" is set when the search failed and "exhausted"
+    when PubMed has no matches beyond the ones returned.
     """
+    outcome = {} if outcome is None else outcome
     logging.info(f"📚 Starting PubMed search for query: '{query}'")
     logging.info(f"Parameters: max_results={max_results}, year range: {start_year}-{end_year}")
     
@@ -73,159 +222,99 @@ def search_pubmed(query, max_results=100, start_year=0, end_year=0):
     
     # Search PubMed to get article IDs
     logging.info("Step 1: Retrieving article IDs from PubMed ESearch")
-    esearch_url = (
-        'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi'
-        '?db=pubmed'
-        f'&term={full_query}'
-        f'&retmax={max_results}'
-        '&retmode=json'
-        f'&api_key={PUBMED_API_KEY}'
-    )
-    logging.debug(f"ESearch URL: {esearch_url}")
+    esearch_url = eutils_url('esearch')
+    esearch_params = eutils_params(db='pubmed', term=full_query, retmax=max_results, retmode='json')
+    if PUBMED_FETCH_MODE == "history":
+        esearch_params['usehistory'] = 'y'
+    logging.debug(f"ESearch URL: {esearch_url} term={full_query!r}")
     
     try:
-        esearch_response = requests.get(esearch_url)
-        esearch_response.raise_for_status()  # Raise exception for HTTP errors
+        esearch_response = get_eutils(esearch_url, params=esearch_params)
         
         esearch_data = esearch_response.json()
         if 'esearchresult' not in esearch_data or 'idlist' not in esearch_data['esearchresult']:
             logging.warning("No 'idlist' found in PubMed ESearch response")
+            outcome["error"] = "no idlist in ESearch response"
             return []
         
         id_list = esearch_data['esearchresult']['idlist']
         count = int(esearch_data['esearchresult'].get('count', '0'))
         
+        outcome["exhausted"] = count <= len(id_list)
         if not id_list:
             logging.info(f"PubMed search found 0 results for query: '{query}'")
             return []
         
         logging.info(f"PubMed found {count} total matches, retrieved {len(id_list)} article IDs")
         
-        # Fetch article details in batches to avoid URL too long error
-        logging.info("Step 2: Fetching detailed article data from PubMed EFetch in batches")
-        BATCH_SIZE = 200  # Safe batch size for PubMed EFetch
-        efetch_xml_chunks = []
-        for i in range(0, len(id_list), BATCH_SIZE):
-            batch_ids = id_list[i:i+BATCH_SIZE]
-            ids = ','.join(batch_ids)
-            efetch_url = (
-                'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi'
-                '?db=pubmed'
-                f'&id={ids}'
-                '&retmode=xml'
-                f'&api_key={PUBMED_API_KEY}'
-            )
-            logging.debug(f"EFetch URL (batch {i//BATCH_SIZE+1}): {efetch_url.split('&id=')[0]}")
-            efetch_response = requests.get(efetch_url)
-            efetch_response.raise_for_status()
-            efetch_xml_chunks.append(efetch_response.content)
-        
-        # Parse XML responses from all batches
-        logging.info("Step 3: Parsing XML data from PubMed (all batches)")
+        # Fetch article details page by page, several pages at a time; each page is parsed as it streams in
+        efetch_pages = _efetch_pages(esearch_data['esearchresult'], id_list, max_results)
+        logging.info(f"Step 2: Fetching and parsing article data from PubMed EFetch in {len(efetch_pages)} pages "
+                     f"({'history server' if 'WebEnv' in efetch_pages[0] else 'ID batches'}, up to {PUBMED_EFETCH_WORKERS} concurrent)")
         articles = []
         articles_processed = 0
         articles_with_doi = 0
         articles_with_mesh = 0
         
-        # Prepare for concurrent full-text fetching
+        # Full texts are looked up as each article is parsed: cached texts (from earlier searches) are used as
+        # they are, the rest are queued straight away on a crawl scheduler running on the crawler service loop
         doi_to_fetch = []
         parsed_articles_metadata = []
+        doi_to_full_text = {}
+        doi_pmids = {}
+        doi_pmcids = {}
+        url_dois = {}
+        dois_to_crawl = []
+        crawl_jobs = asyncio.Queue()
 
-        for efetch_data in efetch_xml_chunks:
-            root = ET.fromstring(efetch_data)
-            for article_node in root.findall('.//PubmedArticle'):
-                articles_processed += 1
-                title = article_node.findtext('.//ArticleTitle')
-                abstract = article_node.findtext('.//AbstractText')
-                
-                # Extract authors
-                authors = []
-                for author_element in article_node.findall('.//Author'):
-                    last_name = author_element.findtext('LastName')
-                    fore_name = author_element.findtext('ForeName')
-                    if last_name and fore_name:
-                        authors.append(f"{fore_name} {last_name}")
-                    elif last_name:
-                        authors.append(last_name)
-                authors_str = ', '.join(authors)
-                
-                # Extract publication date
-                pub_date = article_node.find('.//PubDate')
-                year = ""
-                if pub_date is not None:
-                    year = pub_date.findtext('Year')
-                    month = pub_date.findtext('Month')
-                    day = pub_date.findtext('Day')
-                    date_parts = [year, month, day]
-                    date_str = '-'.join(part for part in date_parts if part)
-                else:
-                    date_str = ''
-                
-                journal = article_node.findtext('.//Journal/Title')
-                
-                # Extract DOI
-                doi = ''
-                for eid in article_node.findall('.//ArticleId'):
-                    if eid.attrib.get('IdType') == 'doi':
-                        doi_text = eid.text
-                        if doi_text: # Ensure DOI text is not None or empty
-                            doi = doi_text.strip()
-                            articles_with_doi += 1
-                            if doi not in doi_to_fetch: # Avoid duplicate fetches for the same DOI
-                                 doi_to_fetch.append(doi)
-                        break
-                
-                # Extract keywords (MeSH terms)
-                keyword_list = []
-                for mesh_heading in article_node.findall('.//MeshHeading'):
-                    descriptor = mesh_heading.findtext('DescriptorName')
-                    if descriptor:
-                        keyword_list.append(descriptor)
-                
-                if keyword_list:
-                    articles_with_mesh += 1
-                    logging.debug(f"Found {len(keyword_list)} MeSH terms for article: {title[:50] if title else 'Untitled'}...")
-                
-                # Extract PMID for building the URL
-                pmid = ''
-                for eid in article_node.findall('.//ArticleId'):
-                    if eid.attrib.get('IdType') == 'pubmed':
-                        pmid = eid.text
-                        break
-
-                parsed_articles_metadata.append({
-                    'title': title,
-                    'abstract': abstract,
-                    'authors_str': authors_str,
-                    'year': year,
-                    'date_str': date_str,
-                    'journal': journal,
-                    'doi': doi,
-                    'keyword_list': keyword_list,
-                    'pmid': pmid
-                })
+        async def fetch_all_full_texts():
+            # Cheap tiers first (plain HTTP, PMC); the crawl tier borrows a warm browser from the shared pool
+            async with aiohttp.ClientSession() as http:
+                fetcher = TieredFullTextFetcher(http, crawl=_fetch_full_text)
+                # Bounded crawl: jobs are queued in result order, so the first page of results is fetched first
+                # Each tier bounds its own requests; the crawl timeout starts once a browser is free
+                scheduler = CrawlScheduler(lambda url: fetcher.fetch(url_dois[url], doi_pmcids.get(url_dois[url])),
+                                           timeout=None, default=("", None))
+                full_texts = await scheduler.run(crawl_jobs)
+                fetcher.log_stats()
+                return full_texts
 
-        # Concurrently fetch all full texts using a single crawler instance
-        logging.info(f"Step 4: Concurrently fetching full text for {len(doi_to_fetch)} unique DOIs.")
-
-        async def fetch_all_full_texts(dois):
-            async with AsyncWebCrawler() as crawler:
-                tasks = [
-                    _fetch_full_text(f"https://doi.org/{d}", crawler=crawler)
-                    for d in dois
-                ]
-                return await asyncio.gather(*tasks)
-
-        # Run the asynchronous tasks with a single crawler instance
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Runs on the long-lived crawler service loop rather than a fresh loop and browser per search
+        crawling = crawler_service.submit(fetch_all_full_texts())
         try:
-            fetched_full_texts_list = loop.run_until_complete(fetch_all_full_texts(doi_to_fetch))
+            for metadata in _iter_pubmed_articles(efetch_pages):
+                articles_processed += 1
+                doi = metadata['doi']
+                if doi:
+                    articles_with_doi += 1
+                    if doi not in doi_to_fetch: # Avoid duplicate fetches for the same DOI
+                        doi_to_fetch.append(doi)
+                        doi_pmids[doi] = metadata['pmid']
+                        doi_pmcids[doi] = metadata['pmcid']
+                        cached = lookup_full_text(doi=doi, pmid=metadata['pmid'])
+                        if cached is not None:
+                            doi_to_full_text[doi] = cached[0]
+                        else:
+                            url = f"https://doi.org/{doi}"
+                            url_dois[url] = doi
+                            crawler_service.call_soon(crawl_jobs.put_nowait, (len(dois_to_crawl), doi, url))
+                            dois_to_crawl.append(doi)
+                if metadata['keyword_list']:
+                    articles_with_mesh += 1
+                    logging.debug(f"Found {len(metadata['keyword_list'])} MeSH terms for article: {metadata['title'][:50] if metadata['title'] else 'Untitled'}...")
+                parsed_articles_metadata.append(metadata)
         finally:
-            loop.close()
+            crawler_service.call_soon(crawl_jobs.put_nowait, None) # No more jobs; the scheduler finishes what it has
+        logging.info(f"Step 3: Waiting on full text for {len(dois_to_crawl)} unique DOIs "
+                     f"({len(doi_to_full_text)} more served from the full-text cache).")
 
-        doi_to_full_text = dict(zip(doi_to_fetch, fetched_full_texts_list))
-        logging.info(f"Successfully fetched {sum(1 for text in fetched_full_texts_list if text)} full texts out of {len(doi_to_fetch)} attempts.")
+        full_texts = crawling.result()
+        fetched_full_texts_list = [full_texts.get(doi, ("", None)) for doi in dois_to_crawl]
+        for doi, (full_text, tier) in zip(dois_to_crawl, fetched_full_texts_list):
+            doi_to_full_text[doi] = full_text
+            if tier:
+                remember_full_text(full_text, TIER_SOURCES[tier], doi=doi, pmid=doi_pmids.get(doi))
+        logging.info(f"Successfully fetched {sum(1 for text, _ in fetched_full_texts_list if text)} full texts out of {len(dois_to_crawl)} attempts.")
 
         # Construct final articles list
         for metadata in parsed_articles_metadata:
@@ -270,10 +359,13 @@ def search_pubmed(query, max_results=100, start_year=0, end_year=0):
         
     except requests.exceptions.RequestException as e:
         logging.error(f"PubMed API request failed: {str(e)}")
+        outcome["error"] = str(e)
         return []
     except ET.ParseError as e:
         logging.error(f"XML parsing error with PubMed response: {str(e)}")
+        outcome["error"] = str(e)
         return []
     except Exception as e:
         logging.error(f"Unexpected error during PubMed search: {str(e)}")
+        outcome["error"] = str(e)
         return []
\ No newline at end of file
@@ -0,0 +1,144 @@
+# streaming_csv.py
+# Incremental CSV output for the enrichment stage. Rows are appended as soon as each work item
+# finishes, and a small commit marker next to the CSV records how many bytes hold complete rows,
+# so readers can serve a consistent partial file while enrichment is still running.
+import io
+import os
+import csv
+import json
+import time
+import logging
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# --- Constants and Configuration ---
+CSV_FSYNC_INTERVAL = float(os.environ.get("CSV_FSYNC_INTERVAL", 2.0))  # Max seconds between fsyncs while streaming
+CSV_FSYNC_ROWS = int(os.environ.get("CSV_FSYNC_ROWS", 50))  # ...or every this many rows, whichever comes first
+
+
+def commit_marker_path(csv_path):
+    return f"{csv_path}.commit"
+
+
+def read_commit_marker(csv_path):
+    """Returns the commit marker of a CSV being streamed, or None if the file is finished (or was never streamed)."""
+    try:
+        with open(commit_marker_path(csv_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_commit_marker(csv_path, marker):
+    # Write-then-rename so readers never see a half-written marker
+    tmp_path = f"{commit_marker_path(csv_path)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(marker, f)
+    os.replace(tmp_path, commit_marker_path(csv_path))
+
+
+def open_committed_csv(csv_path, encoding='utf-8-sig'):
+    """
+    Opens a results CSV for reading. While the CSV is still being streamed only its committed prefix
+    (the header plus every complete row) is returned, so a DictReader never sees a half-written row.
+    """
+    # Open the file before reading the marker: the finished file only replaces the streamed one
+    # after the marker is marked complete, so a partial marker always describes the file we hold.
+    raw = open(csv_path, 'rb')
+    marker = read_commit_marker(csv_path)
+    if marker and not marker.get("complete"):
+        try:
+            committed = raw.read(marker.get("offset", 0))
+        finally:
+            raw.close()
+        return io.StringIO(committed.decode(encoding), newline='')
+    return io.TextIOWrapper(raw, encoding=encoding, newline='')
+
+
+def write_csv_atomically(csv_path, fieldnames, rows):
+    """Writes a complete CSV to a temporary file and swaps it in, so readers see either the old or the new file."""
+    tmp_path = f"{csv_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, csv_path)
+
+
+class StreamingCsvWriter:
+    """
+    Appends rows to a CSV as they arrive and publishes a commit marker after each one.
+    Rows may arrive in any order; finalize() rewrites the file in rank order and removes the marker.
+    Only byte offsets are kept per row, so memory does not grow with the size of the rows.
+    """
+
+    def __init__(self, csv_path, fieldnames):
+        self.csv_path = csv_path
+        self.fieldnames = fieldnames
+        self.rows_written = 0
+        self._row_spans = []  # (rank, offset, length) of each row in the streamed file
+        os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+        self._file = open(csv_path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore') # Ignore extra fields if any
+        self._writer.writeheader()
+        self._file.flush()
+        self._header_end = self._file.tell()
+        self._committed = self._header_end
+        self._last_fsync = time.monotonic()
+        self._rows_since_fsync = 0
+        self._publish(force_fsync=True)
+
+    def write_row(self, row, rank):
+        """Appends one row; rank is its position in the final (ranked) file."""
+        self._writer.writerow(row)
+        self._file.flush()
+        end = self._file.tell()
+        self._row_spans.append((rank, self._committed, end - self._committed))
+        self._committed = end
+        self.rows_written += 1
+        self._rows_since_fsync += 1
+        self._publish()
+
+    def _publish(self, force_fsync=False):
+        # fsync periodically for durability; the marker itself is updated on every row for visibility
+        if force_fsync or self._rows_since_fsync >= CSV_FSYNC_ROWS or time.monotonic() - self._last_fsync >= CSV_FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+            self._rows_since_fsync = 0
+        _write_commit_marker(self.csv_path, {"offset": self._committed, "rows": self.rows_written, "complete": False})
+
+    def finalize(self):
+        """Rewrites the rows in rank order, atomically swaps the result in and removes the commit marker."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        ordered_path = f"{self.csv_path}.ordered"
+        with open(self.csv_path, 'rb') as streamed, open(ordered_path, 'wb') as ordered:
+            ordered.write(streamed.read(self._header_end))
+            for _, offset, length in sorted(self._row_spans):
+                streamed.seek(offset)
+                ordered.write(streamed.read(length))
+            ordered.flush()
+            os.fsync(ordered.fileno())
+
+        # Mark complete before swapping so a reader holding the streamed file reads all of it
+        _write_commit_marker(self.csv_path, {"offset": self._committed, "rows": self.rows_written, "complete": True})
+        os.replace(ordered_path, self.csv_path)
+        try:
+            os.remove(commit_marker_path(self.csv_path))
+        except OSError:
+            pass
+
+    def abort(self):
+        """Closes the file after a failure, leaving the rows written so far (in arrival order) readable."""
+        if not self._file.closed:
+            self._file.truncate(self._committed)
+            self._file.close()
+        try:
+            os.remove(commit_marker_path(self.csv_path))
+        except OSError:
+            pass
@@ -0,0 +1,190 @@
+# upstream_standin.py
+# Local stand-in for the upstream APIs (CORE, NCBI E-utilities, Crossref, OpenAlex, Semantic Scholar,
+# arXiv, doi.org) that replays fixture archives recorded with HTTP_RECORD_DIR (see helper/http_recorder.py),
+# with configurable latency, error rate and 429 behaviour, for offline load tests and benchmarks.
+#
+#   HTTP_RECORD_DIR=fixtures/ python app.py                 # record while running real searches
+#   python -m features.upstream_standin fixtures/ --port 8900 --latency 0.05 --error-rate 0.02 \
+#       --rate-limit ncbi=10:3 --rate-limit crossref=10:5
+#   UPSTREAM_STANDIN_URL=http://127.0.0.1:8900 python app.py   # point the backend at the stand-in
+#
+# Requests are served from /<upstream>/<path> (e.g. /crossref/works?...) and /_/<host>/<path> for other
+# hosts reached through redirects. GET /_standin/stats returns request counters.
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from .helper.http_recorder import load_fixtures, fixture_key
+from .helper.rate_limiter import TokenBucket
+from .helper.upstream_urls import route_for_url, OTHER_HOST_SCOPE
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+
+class StandinConfig:
+    """Replay behaviour of the stand-in server."""
+
+    def __init__(self, latency=0.0, jitter=0.0, latency_scale=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limits=None, missing_status=404, seed=None):
+        self.latency = latency  # Fixed delay added to every response (seconds)
+        self.jitter = jitter  # Uniform random extra delay up to this many seconds
+        self.latency_scale = latency_scale  # Multiple of the recorded response time added as delay
+        self.error_rate = error_rate  # Share of requests answered with 503
+        self.throttle_rate = throttle_rate  # Share of requests answered with 429, on top of rate limits
+        self.rate_limits = rate_limits or {}  # scope -> (requests per second, burst); excess gets 429
+        self.missing_status = missing_status  # Status for requests with no recorded response
+        self.random = random.Random(seed)
+
+
+class UpstreamStandin:
+    """Looks up recorded responses and applies the configured latency, errors and rate limits."""
+
+    def __init__(self, fixtures, config):
+        self.fixtures = fixtures
+        self.config = config
+        self._buckets = {scope: TokenBucket(rate, burst) for scope, (rate, burst) in config.rate_limits.items()}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "replayed": 0, "missing": 0, "injected_errors": 0, "throttled": 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def _pick(self, scope, key):
+        # Errors are injected by the stand-in itself, so prefer the latest good recording
+        recorded = self.fixtures.get((scope, key))
+        if not recorded:
+            return None
+        good = [fixture for fixture in recorded if fixture["status"] < 500 and fixture["status"] != 429]
+        return (good or recorded)[-1]
+
+    def respond(self, method, path):
+        """Returns (status, headers, body, delay_seconds) for a request path such as /crossref/works?query=..."""
+        self._count("requests")
+        parts = urlsplit(path)
+        segments = parts.path.lstrip('/').split('/')
+        scope_length = 2 if segments[0] == OTHER_HOST_SCOPE else 1
+        scope = '/'.join(segments[:scope_length])
+        upstream_path = '/' + '/'.join(segments[scope_length:])
+
+        bucket = self._buckets.get(scope)
+        if bucket is not None:
+            acquired, wait = bucket.try_acquire()
+            if not acquired:
+                self._count("throttled")
+                return 429, {"Retry-After": str(max(1, math.ceil(wait)))}, b"", 0.0
+        rng = self.config.random
+        if self.config.throttle_rate and rng.random() < self.config.throttle_rate:
+            self._count("throttled")
+            return 429, {"Retry-After": "1"}, b"", 0.0
+        if self.config.error_rate and rng.random() < self.config.error_rate:
+            self._count("injected_errors")
+            return 503, {}, b"", self.config.latency
+
+        fixture = self._pick(scope, fixture_key(method, upstream_path, parts.query))
+        if fixture is None:
+            self._count("missing")
+            logging.info(f"No recorded response for {scope} {method} {upstream_path}?{parts.query}")
+            body = json.dumps({"error": "no recorded response"}).encode('utf-8')
+            return self.config.missing_status, {"Content-Type": "application/json"}, body, self.config.latency
+        self._count("replayed")
+        delay = (self.config.latency + self.config.latency_scale * fixture.get("elapsed", 0.0)
+                 + (rng.uniform(0, self.config.jitter) if self.config.jitter else 0.0))
+        return fixture["status"], dict(fixture["headers"]), fixture["content"], delay
+
+
+def _make_handler(standin):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real upstreams
+
+        def _send(self, status, headers, body):
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _standin_url(self, url):
+            # Recorded redirects point at real hosts; send the client back to the stand-in instead
+            if not url.startswith(("http://", "https://")):
+                return url
+            scope, path, query = route_for_url(url)
+            return f"http://{self.headers.get('Host')}/{scope}{path}{'?' + query if query else ''}"
+
+        def do_GET(self):
+            if self.path == "/_standin/stats":
+                self._send(200, {"Content-Type": "application/json"}, json.dumps(standin.stats).encode('utf-8'))
+                return
+            status, headers, body, delay = standin.respond(self.command, self.path)
+            if delay > 0:
+                time.sleep(delay)
+            if "Location" in headers:
+                headers["Location"] = self._standin_url(headers["Location"])
+            self._send(status, headers, body)
+
+        do_HEAD = do_GET
+
+        def log_message(self, format, *args):
+            logging.debug("%s - %s" % (self.address_string(), format % args))
+
+    return StandinHandler
+
+
+def serve(fixtures_dir, host="127.0.0.1", port=8900, config=None):
+    """Serves the fixtures in fixtures_dir until interrupted."""
+    fixtures = load_fixtures(fixtures_dir)
+    standin = UpstreamStandin(fixtures, config or StandinConfig())
+    server = ThreadingHTTPServer((host, port), _make_handler(standin))
+    server.daemon_threads = True
+    logging.info(f"Upstream stand-in serving {len(fixtures)} recorded requests from {fixtures_dir} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"Upstream stand-in stopped: {standin.stats}")
+
+
+def _parse_rate_limit(value):
+    scope, _, limit = value.partition('=')
+    rate, _, burst = limit.partition(':')
+    return scope, (float(rate), int(burst) if burst else 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded upstream API responses for offline load tests.")
+    parser.add_argument("fixtures", help="Directory of fixture archives recorded with HTTP_RECORD_DIR")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed delay per response, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra delay of up to this many seconds")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Add this multiple of each response's recorded time (1.0 replays real latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-limit", action="append", default=[], type=_parse_rate_limit, metavar="UPSTREAM=RATE[:BURST]",
+                        help="Answer 429 with Retry-After beyond this rate, e.g. ncbi=10:3 (repeatable)")
+    parser.add_argument("--missing-status", type=int, default=404, help="Status for requests that were never recorded")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible error and throttle injection")
+    args = parser.parse_args(argv)
+
+    config = StandinConfig(latency=args.latency, jitter=args.jitter, latency_scale=args.latency_scale,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                           rate_limits=dict(args.rate_limit), missing_status=args.missing_status, seed=args.seed)
+    serve(args.fixtures, host=args.host, port=args.port, config=config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
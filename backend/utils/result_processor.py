@@ -1,6 +1,7 @@
 import logging
 import pandas as pd
 import os
+from features.result_store import read_results_frame
 DATA_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data'))
 print(DATA_FOLDER)
 def get_context_from_result(search_results, CSV_FILE):
@@ -81,7 +82,8 @@ def get_context_from_result(search_results, CSV_FILE):
     try:
         if os.path.exists(CSV_FILE_PATH):
             logging.info(f"Reading CSV for URLs: {CSV_FILE_PATH}")
-            df_papers = pd.read_csv(CSV_FILE_PATH)
+            # Only the two lookup columns are loaded, not the full text
+            df_papers = read_results_frame(CSV_FILE_PATH, columns=['Doi', 'Download_URL'])
 
             # Ensure DOI column exists and handle potential missing values/types
             if 'Doi' in df_papers.columns and 'Download_URL' in df_papers.columns:
@@ -290,11 +290,9 @@ const SearchPage = () => {
 
             navigate(`/search?filename=${csvFilename}`, { replace: true });
 
-            setPapers(searchResponse.data.results.map(result => ({
-                source: result.dataProviders?.[0]?.name || 'Unknown',
-                title: result.title || 'Unknown',
-                download_url: result.downloadUrl || '',
-                year: result.yearPublished || 'Unknown'
+            setPapers(searchResponse.data.results.map(paper => ({
+                ...paper,
+                keywords: Array.isArray(paper.keywords) ? paper.keywords : []
             })));
             
             setCsvLoading(true);